@@ -0,0 +1,37 @@
+# ==================================================
+# Imports
+# ==================================================
+from functions.load_config import load_config
+from functions.analyze_run import analyze_run
+
+# ==================================================
+# Loading algorithm parameters from the input file
+# ==================================================
+config = load_config('input.txt')
+
+# Metrics file of the run from which the failed relaxations of each operator are counted
+metrics_file = str(config.get('metrics_file', 'metrics.jsonl'))
+# Number of the clustered lowest minima, the distance below which two minima may belong to the same cluster
+# and the largest energy difference between the minima of a cluster
+analysis_n_minima = config.get('analysis_n_minima', 20)
+analysis_cluster_tol = float(config.get('analysis_cluster_tol', 0.005))
+analysis_cluster_energy_tol = float(config.get('analysis_cluster_energy_tol', 0.01))
+
+# ==================================================
+# The main logic of the program
+# ==================================================
+def main():
+    # Analysis of all generations of the run in the current directory
+    results = analyze_run('.', 'analysis', metrics_file, analysis_n_minima, analysis_cluster_tol,
+                          analysis_cluster_energy_tol)
+
+    progression = results['progression']
+    clusters = results['clusters']
+    print(f'Generations: {len(progression["generations"])}, '
+          f'structures: {len(results["run"]["energies"])}, '
+          f'best energy: {progression["e_best"][-1]:.4f} eV, '
+          f'distinct minima among the {len(clusters["indexes"])} lowest: {clusters["labels"].max() + 1}')
+    print('The tables and arrays have been written to the analysis folder.')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,405 @@
+"""
+The module contains a function 'analyze_run' that analyzes all generations of a finished (or running) run,
+and functions 'get_signature', 'load_run', 'load_operator_attempts', 'get_unique', 'get_energy_progression',
+'get_parent_indexes', 'get_operator_stats', 'get_lineage', 'cluster_minima' and 'write_analysis' used by it.
+"""
+
+import os
+import re
+import glob
+import json
+import numpy as np
+from pathlib import Path
+from functions.population import Population
+from functions.selection import get_fingerprints
+
+# Arrays of the parsed generations stored in the cache
+RUN_KEYS = ('generation', 'energies', 'names', 'parents', 'operators', 'positions', 'numbers')
+
+def get_signature(filename):
+    """
+    Returns the signature of the file (size and modification time) used to check whether the cached data is valid.
+
+    Args:
+        filename (str): Name of the file.
+
+    Returns:
+        str: The signature.
+    """
+    stat = os.stat(filename)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+def load_run(directory='.', cache_filename=None):
+    """
+    Loads the structures of all generations (the files pop{i}/pop{i}.traj) into arrays concatenated over
+    the generations. If the cache file exists, the generations whose files have not changed since the last
+    analysis are taken from it and only the new or changed generations are parsed. The cache is then updated.
+
+    Args:
+        directory (str): Directory of the run.
+        cache_filename (str, optional): Name of the .npz cache file (None - no cache).
+
+    Returns:
+        dict: The arrays 'generation', 'energies', 'names', 'parents', 'operators', 'positions' (n_structures,
+            n_atoms, 3) and 'numbers' (n_structures, n_atoms) together with 'tags', 'cell' and 'pbc' common
+            for all structures.
+    """
+    filenames = {}
+    for filename in glob.glob(f'{directory}/pop*/pop*.traj'):
+        match = re.fullmatch(r'pop(\d+)', Path(filename).stem)
+        if match and Path(filename).parent.name == Path(filename).stem:
+            filenames[int(match.group(1))] = filename
+    if not filenames:
+        raise FileNotFoundError(f'No generations found in {directory}.')
+    generations = sorted(filenames)
+    signatures = np.array([get_signature(filenames[i]) for i in generations])
+
+    cache = None
+    if cache_filename is not None and os.path.exists(cache_filename):
+        with np.load(cache_filename) as data:
+            cache = {key: data[key] for key in data.files}
+
+    parts = []
+    common = None
+    for i, signature in zip(generations, signatures):
+        cached = cache is not None and i in cache['cached_generations'] \
+                 and cache['cached_signatures'][list(cache['cached_generations']).index(i)] == signature
+        if cached:
+            rows = cache['generation'] == i
+            parts.append({key: cache[key][rows] for key in RUN_KEYS})
+            if common is None:
+                common = {key: cache[key] for key in ('tags', 'cell', 'pbc')}
+            continue
+
+        try:
+            population = Population.from_traj(filenames[i])
+        except ValueError:
+            # Empty trajectory of a generation that has just been started
+            continue
+        parts.append({'generation': np.full(len(population), i),
+                      'energies': population.energies,
+                      'names': population.names,
+                      'parents': population.parents,
+                      'operators': population.operators,
+                      'positions': population.positions,
+                      'numbers': population.numbers})
+        if common is None:
+            common = {'tags': population.tags, 'cell': np.asarray(population.cell), 'pbc': population.pbc}
+
+    if not parts:
+        raise FileNotFoundError(f'No relaxed structures found in {directory}.')
+    if len({part['positions'].shape[1] for part in parts}) > 1:
+        raise ValueError('All generations of the run must have the same number of atoms.')
+
+    run = {key: np.concatenate([part[key] for part in parts]) for key in RUN_KEYS}
+    run.update(common)
+    if cache_filename is not None:
+        np.savez(cache_filename, cached_generations=np.array(generations), cached_signatures=signatures, **run)
+    return run
+
+def load_operator_attempts(metrics_filename):
+    """
+    Counts the relaxed and the failed candidates of each operator in the metrics file
+    (the records with the features of the candidate) and the structures rejected by the validation
+    before the calculation (see validation.validate_struct).
+
+    Args:
+        metrics_filename (str): Name of the JSON-lines metrics file.
+
+    Returns:
+        dict: The numbers of relaxed, failed and rejected candidates ('success', 'failed', 'rejected')
+            of each operator.
+    """
+    attempts = {}
+    empty = {'success': 0, 'failed': 0, 'rejected': 0}
+    try:
+        with open(metrics_filename, 'r') as file:
+            for line in file:
+                record = json.loads(line)
+                if record.get('type') != 'candidate' or 'features' not in record:
+                    continue
+                stats = attempts.setdefault(record['features']['operator'], dict(empty))
+                stats['success' if record.get('success') else 'failed'] += 1
+                for operator, count in record.get('rejections', {}).items():
+                    attempts.setdefault(operator, dict(empty))['rejected'] += count
+    except FileNotFoundError:
+        pass
+    return attempts
+
+def get_unique(run):
+    """
+    Returns the indexes of the first appearance of each structure in the run. The best individuals
+    passed to the next generations keep their names, so they are counted once. Structures without
+    a name are all kept.
+
+    Args:
+        run (dict): The arrays returned by load_run.
+
+    Returns:
+        np.array: The indexes of the unique structures.
+    """
+    named = run['names'] != ''
+    _, first = np.unique(run['names'][named], return_index=True)
+    return np.sort(np.concatenate([np.nonzero(named)[0][first], np.nonzero(~named)[0]]))
+
+def get_energy_progression(run):
+    """
+    Returns the lowest, mean, highest energy and the standard deviation of the energy of each generation
+    together with the lowest energy found up to each generation.
+
+    Args:
+        run (dict): The arrays returned by load_run.
+
+    Returns:
+        dict: The arrays 'generations', 'e_min', 'e_mean', 'e_max', 'e_std' and 'e_best'.
+    """
+    generations, index = np.unique(run['generation'], return_inverse=True)
+    energies = run['energies']
+    counts = np.bincount(index)
+    e_mean = np.bincount(index, weights=energies) / counts
+    e_std = np.sqrt(np.maximum(np.bincount(index, weights=energies ** 2) / counts - e_mean ** 2, 0.))
+    e_min = np.full(len(generations), np.inf)
+    np.minimum.at(e_min, index, energies)
+    e_max = np.full(len(generations), -np.inf)
+    np.maximum.at(e_max, index, energies)
+    return {'generations': generations, 'e_min': e_min, 'e_mean': e_mean, 'e_max': e_max, 'e_std': e_std,
+            'e_best': np.minimum.accumulate(e_min)}
+
+def get_parent_indexes(run, unique):
+    """
+    Returns the indexes (in the run arrays) of the parents of the unique structures.
+
+    Args:
+        run (dict): The arrays returned by load_run.
+        unique (np.array): The indexes of the unique structures returned by get_unique.
+
+    Returns:
+        np.array: The indexes of the parents, shape (n_unique, 2) (-1 - no parent or parent not found).
+    """
+    names = run['names'][unique]
+    order = np.argsort(names)
+    sorted_names = names[order]
+
+    parents = np.full((len(unique), 2), '', dtype=object)
+    for k, tmp_parents in enumerate(run['parents'][unique]):
+        if tmp_parents:
+            split = tmp_parents.split(',')[:2]
+            parents[k, :len(split)] = split
+    parents = parents.astype(str)
+
+    position = np.clip(np.searchsorted(sorted_names, parents), 0, len(names) - 1)
+    found = (sorted_names[position] == parents) & (parents != '')
+    return np.where(found, unique[order[position]], -1)
+
+def get_operator_stats(run, attempts=None):
+    """
+    Returns the statistics of each operator: the number of relaxed structures, the number of failed relaxations
+    and of the structures rejected before the calculation (from the metrics file), the number of structures with a lower energy than their best parent
+    and the mean energy gain relative to the best parent.
+
+    Args:
+        run (dict): The arrays returned by load_run.
+        attempts (dict, optional): The numbers returned by load_operator_attempts.
+
+    Returns:
+        dict: The arrays 'operators', 'n_relaxed', 'n_failed', 'n_rejected', 'success_rate', 'n_with_parents',
+            'n_improved', 'improvement_rate' and 'mean_gain'.
+    """
+    unique = get_unique(run)
+    parent_indexes = get_parent_indexes(run, unique)
+    energies = run['energies'][unique]
+
+    parent_energies = np.where(parent_indexes >= 0, run['energies'][parent_indexes], np.inf)
+    best_parent = parent_energies.min(axis=1)
+    with_parents = np.isfinite(best_parent)
+    gain = np.where(with_parents, best_parent - energies, 0.)
+
+    operators, index = np.unique(run['operators'][unique], return_inverse=True)
+    n_relaxed = np.bincount(index, minlength=len(operators))
+    n_with_parents = np.bincount(index, weights=with_parents, minlength=len(operators)).astype(int)
+    n_improved = np.bincount(index, weights=with_parents & (gain > 0), minlength=len(operators)).astype(int)
+    total_gain = np.bincount(index, weights=gain, minlength=len(operators))
+
+    attempts = attempts or {}
+    n_failed = np.array([attempts.get(operator, {}).get('failed', 0) for operator in operators])
+    n_rejected = np.array([attempts.get(operator, {}).get('rejected', 0) for operator in operators])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {'operators': operators,
+                'n_relaxed': n_relaxed,
+                'n_failed': n_failed,
+                'n_rejected': n_rejected,
+                'success_rate': n_relaxed / (n_relaxed + n_failed),
+                'n_with_parents': n_with_parents,
+                'n_improved': n_improved,
+                'improvement_rate': n_improved / n_with_parents,
+                'mean_gain': total_gain / n_with_parents}
+
+def get_lineage(run, index, unique, parent_indexes, max_depth=20):
+    """
+    Describes the ancestors of the structure as an indented tree.
+
+    Args:
+        run (dict): The arrays returned by load_run.
+        index (int): Index of the structure in the run arrays.
+        unique (np.array): The indexes of the unique structures returned by get_unique.
+        parent_indexes (np.array): The indexes of their parents returned by get_parent_indexes.
+        max_depth (int): Maximum number of the described generations of ancestors.
+
+    Returns:
+        list: The lines of the tree.
+    """
+    parent_indexes = dict(zip(unique.tolist(), parent_indexes.tolist()))
+
+    lines = []
+    def describe(k, depth):
+        lines.append(f'{"    " * depth}{run["names"][k] or "(no name)"} ({run["energies"][k]:.4f} eV, '
+                     f'{run["operators"][k] or "unknown"}, pop{run["generation"][k]})')
+        if depth >= max_depth:
+            return
+        for parent in parent_indexes.get(k, []):
+            if parent >= 0:
+                describe(parent, depth + 1)
+    describe(index, 0)
+    return lines
+
+def cluster_minima(run, n_minima=20, tol=0.005, energy_tol=0.01):
+    """
+    Clusters the unique structures with the lowest energies by the cosine distance between their fingerprints
+    (see selection.get_fingerprints) with complete linkage: the closest clusters are merged as long as all pairs
+    of their structures are closer than tol and the energies of all structures differ by at most energy_tol.
+    The radial fingerprints do not distinguish some different arrangements, so the energy window is needed
+    as well. The default tol was calibrated on the symmetry-unique arrangements of 2-4 Mo atoms in the 4x4 cell
+    (see enumerate_structs): copies with random displacements of 0.01-0.02 A lie within it, while only
+    a few percent of the pairs of different arrangements do (12-40 % for 0.05).
+    The clusters are numbered from the one with the lowest energy.
+
+    Args:
+        run (dict): The arrays returned by load_run.
+        n_minima (int): Number of the clustered structures.
+        tol (float): Distance below which two structures may belong to the same cluster.
+        energy_tol (float): Largest energy difference (eV) between the structures of a cluster.
+
+    Returns:
+        dict: The arrays 'indexes' (indexes of the structures in the run arrays, from the lowest energy),
+            'labels' (cluster of each structure) and 'distances' (matrix of the distances).
+    """
+    unique = get_unique(run)
+    indexes = unique[np.argsort(run['energies'][unique], kind='stable')[:n_minima]]
+    n = len(indexes)
+
+    population = Population(run['positions'][indexes], run['numbers'][indexes], run['energies'][indexes],
+                            run['tags'], run['names'][indexes], run['parents'][indexes], run['operators'][indexes],
+                            run['cell'], run['pbc'], [{} for _ in range(n)])
+    fingerprints = get_fingerprints(population)
+    lengths = np.linalg.norm(fingerprints, axis=1)
+    unit = fingerprints / np.where(lengths > 0, lengths, 1.)[:, np.newaxis]
+    distances = np.clip(0.5 * (1. - unit @ unit.T), 0., 1.)
+    np.fill_diagonal(distances, 0.)
+
+    # Each cluster is labelled with its structure of the lowest energy, the distance between two clusters
+    # is the largest distance between their structures (complete linkage)
+    energies = run['energies'][indexes]
+    e_min, e_max = energies.copy(), energies.copy()
+    linkage = distances.copy()
+    np.fill_diagonal(linkage, np.inf)
+    labels = np.arange(n)
+    while True:
+        spread = np.maximum(e_max[:, np.newaxis], e_max) - np.minimum(e_min[:, np.newaxis], e_min)
+        allowed = (linkage < tol) & (spread <= energy_tol)
+        if not allowed.any():
+            break
+        a, b = sorted(np.unravel_index(np.argmin(np.where(allowed, linkage, np.inf)), linkage.shape))
+        linkage[a, :] = linkage[:, a] = np.maximum(linkage[a, :], linkage[b, :])
+        linkage[b, :] = linkage[:, b] = np.inf
+        linkage[a, a] = np.inf
+        e_min[a], e_max[a] = min(e_min[a], e_min[b]), max(e_max[a], e_max[b])
+        labels[labels == b] = a
+    _, labels = np.unique(labels, return_inverse=True)
+    return {'indexes': indexes, 'labels': labels, 'distances': distances}
+
+def write_analysis(out_folder, run, progression, operator_stats, clusters, lineages):
+    """
+    Writes the tables of the analysis to text files and the arrays to the file analysis.npz in the output folder.
+
+    Args:
+        out_folder (str): The output folder.
+        run (dict): The arrays returned by load_run.
+        progression (dict): The arrays returned by get_energy_progression.
+        operator_stats (dict): The arrays returned by get_operator_stats.
+        clusters (dict): The arrays returned by cluster_minima.
+        lineages (list): The lines of the trees returned by get_lineage.
+
+    Returns:
+        None: The function does not return a value.
+    """
+    Path(out_folder).mkdir(parents=True, exist_ok=True)
+
+    with open(f'{out_folder}/energy_progression.txt', 'w') as f:
+        f.write('Generation\tMin\tMean\tMax\tStd\tBest\n')
+        for row in zip(*(progression[key] for key in ('generations', 'e_min', 'e_mean', 'e_max', 'e_std',
+                                                      'e_best'))):
+            f.write(f'{row[0]}\t' + '\t'.join(f'{np.round(value, 4)}' for value in row[1:]) + '\n')
+
+    with open(f'{out_folder}/operators.txt', 'w') as f:
+        f.write(f'{"operator":<14}{"relaxed":>9}{"failed":>8}{"rejected":>10}{"success":>9}{"improved":>10}{"rate":>8}'
+                f'{"mean gain (eV)":>16}\n')
+        for k, operator in enumerate(operator_stats['operators']):
+            # Operators without parents (e.g., random) have no improvement rate
+            rate, gain = operator_stats['improvement_rate'][k], operator_stats['mean_gain'][k]
+            f.write(f'{operator or "unknown":<14}{operator_stats["n_relaxed"][k]:>9}{operator_stats["n_failed"][k]:>8}'
+                    f'{operator_stats["n_rejected"][k]:>10}{operator_stats["success_rate"][k]:>9.2f}{operator_stats["n_improved"][k]:>10}'
+                    f'{"-" if np.isnan(rate) else f"{rate:.2f}":>8}{"-" if np.isnan(gain) else f"{gain:.4f}":>16}\n')
+
+    with open(f'{out_folder}/clusters.txt', 'w') as f:
+        f.write('Cluster\tSize\tLowest\tEnergy\tSpread\n')
+        energies = run['energies'][clusters['indexes']]
+        for label in np.unique(clusters['labels']):
+            members = np.nonzero(clusters['labels'] == label)[0]
+            f.write(f'{label}\t{len(members)}\t{run["names"][clusters["indexes"][members[0]]]}\t'
+                    f'{np.round(energies[members[0]], 4)}\t{np.round(np.ptp(energies[members]), 4)}\n')
+
+    with open(f'{out_folder}/lineage.txt', 'w') as f:
+        f.write('\n\n'.join('\n'.join(lines) for lines in lineages) + '\n')
+
+    np.savez(f'{out_folder}/analysis.npz',
+             **progression,
+             **{f'operator_{key}': value for key, value in operator_stats.items()},
+             minima_names=run['names'][clusters['indexes']],
+             minima_energies=run['energies'][clusters['indexes']],
+             minima_labels=clusters['labels'],
+             minima_distances=clusters['distances'])
+
+def analyze_run(directory='.', out_folder='analysis', metrics_filename='metrics.jsonl', n_minima=20,
+                cluster_tol=0.005, cluster_energy_tol=0.01, n_lineages=3):
+    """
+    Analyzes all generations of the run: the energy progression, the statistics of the operators,
+    the lineage of the best structures and the clustering of the lowest minima. The generations are loaded
+    in one pass and the parsed data is cached in the file out_folder/cache.npz, so a repeated analysis
+    parses only the new generations. The results are written to the output folder (see write_analysis).
+
+    Args:
+        directory (str): Directory of the run.
+        out_folder (str): The output folder (relative to the directory of the run).
+        metrics_filename (str): Name of the metrics file (relative to the directory of the run).
+        n_minima (int): Number of the clustered structures with the lowest energies.
+        cluster_tol (float): Distance below which two structures may belong to the same cluster.
+        cluster_energy_tol (float): Largest energy difference (eV) between the structures of a cluster.
+        n_lineages (int): Number of the best structures whose lineage is described.
+
+    Returns:
+        dict: The results ('run', 'progression', 'operator_stats', 'clusters', 'lineages').
+    """
+    out_folder = f'{directory}/{out_folder}'
+    Path(out_folder).mkdir(parents=True, exist_ok=True)
+    run = load_run(directory, f'{out_folder}/cache.npz')
+
+    progression = get_energy_progression(run)
+    operator_stats = get_operator_stats(run, load_operator_attempts(f'{directory}/{metrics_filename}'))
+    clusters = cluster_minima(run, n_minima, cluster_tol, cluster_energy_tol)
+    unique = get_unique(run)
+    parent_indexes = get_parent_indexes(run, unique)
+    lineages = [get_lineage(run, index, unique, parent_indexes) for index in clusters['indexes'][:n_lineages]]
+
+    write_analysis(out_folder, run, progression, operator_stats, clusters, lineages)
+    return {'run': run, 'progression': progression, 'operator_stats': operator_stats, 'clusters': clusters,
+            'lineages': lineages}
@@ -1,25 +1,42 @@
 """
-The module contains a function 'get_calc' that creates a calculator SIESTA with given parameters.
+The module contains a function 'get_calc' that creates a calculator SIESTA with given parameters,
+a function 'load_calc_profile' that loads the settings of the calculator from a profile file
+and a function 'get_calc_settings' that describes the settings affecting the energy.
 """
 
 from ase.calculators.siesta import Siesta
 from ase.units import Ry
+from functions.load_config import load_config
+from functions.constraints import LAYER_CONSTRAINTS
 
-def get_calc(label):
+# Default settings of the calculator: k-points along each in-plane direction, mesh cutoff (Ry), DM.Tolerance
+DEFAULT_PROFILE = {'kpts': 8, 'mesh_cutoff': 200, 'dm_tolerance': 1.0E-3}
+
+def get_calc(label, profile=None, layer_constraint='none'):
     """
-    Returns the calculator object for the given label.
+    Returns the calculator object for the given label. If the atoms of the layers are constrained
+    (see constraints.set_layer_constraint), the coordinates are written in the Zmatrix block, whose flags
+    pass the constraints to SIESTA, and the CG criteria are set for the Zmatrix coordinates.
 
     Args:
         label (str): The label to identify output files.
+        profile (dict, optional): Settings of the calculator overriding DEFAULT_PROFILE
+            ('kpts', 'mesh_cutoff', 'dm_tolerance'), e.g. found by tune_calc.
+        layer_constraint (str, optional): Kind of the constraint of the atoms of the layers
+            (see constraints.LAYER_CONSTRAINTS).
 
     Returns:
         ase.Calculator: The calculator object with given parameters.
     """
+    if layer_constraint not in LAYER_CONSTRAINTS:
+        raise ValueError(f'Unknown layer constraint: {layer_constraint}')
+    profile = {**DEFAULT_PROFILE, **(profile or {})}
+    kpts = int(profile['kpts'])
     tmp_calc = Siesta(label=f'{label}',
                   xc='PBE',
                   basis_set='SZP',
-                  kpts=[8, 8, 1],
-                  mesh_cutoff=200 * Ry,
+                  kpts=[kpts, kpts, 1],
+                  mesh_cutoff=float(profile['mesh_cutoff']) * Ry,
                   spin='collinear',
                   fdf_arguments={'MaxSCFIterations':    500,
                                 'PAO.BasisSize':           'SZP',
@@ -35,7 +52,7 @@ def get_calc(label):
                                 'DM.OccupancyTolerance':   0.1000000000E-11,
                                 'DM.NumberKick':           0,
                                 'DM.KickMixingWeight':     0.5000000000,
-                                'DM.Tolerance':       1.0E-3,
+                                'DM.Tolerance':       float(profile['dm_tolerance']),
                                 'DM.UseSaveDM':       '.true.',
                                 'DM.UseSaveXV':       '.true.',
                                 'WriteMullikenPop':        1 ,
@@ -51,4 +68,49 @@ def get_calc(label):
                                 'WriteCoorXmol':           '.true.',
                                  },
                  )
-    return tmp_calc
\ No newline at end of file
+    if layer_constraint != 'none':
+        fdf_arguments = tmp_calc.parameters['fdf_arguments']
+        # Criteria of the CG relaxation in the Zmatrix coordinates equal to MD.MaxForceTol and MD.MaxCGDispl
+        fdf_arguments['ZM.ForceTolLength'] = fdf_arguments['MD.MaxForceTol']
+        fdf_arguments['ZM.MaxDisplLength'] = fdf_arguments['MD.MaxCGDispl']
+        tmp_calc.set(atomic_coord_format='zmatrix', fdf_arguments=fdf_arguments)
+    return tmp_calc
+
+def load_calc_profile(filename):
+    """
+    Loads the settings of the calculator written by tune_calc.write_calc_profile.
+
+    Args:
+        filename (str): Name of the profile file.
+
+    Returns:
+        dict: The settings of the calculator.
+    """
+    config = load_config(filename)
+    return {key: config[key] for key in DEFAULT_PROFILE if key in config}
+
+def get_calc_settings(calc):
+    """
+    Describes the settings of the calculator that affect the computed energy, so that the energies
+    of structures relaxed in different runs can be compared only if the descriptions are the same.
+
+    Args:
+        calc (ase.Calculator): Calculator object.
+
+    Returns:
+        str: The description (e.g., 'xc=PBE,basis=SZP,spin=collinear,kpts=8x8x1,mesh_cutoff=200,dm_tolerance=0.001').
+    """
+    parameters = calc.parameters
+    kpts = parameters.get('kpts') or [1, 1, 1]
+    mesh_cutoff = parameters.get('mesh_cutoff')
+    # The functional is stored by ASE together with its family (e.g., ('GGA', 'PBE'))
+    xc = parameters.get('xc')
+    if isinstance(xc, (tuple, list)):
+        xc = xc[-1]
+    settings = {'xc': xc,
+                'basis': parameters.get('basis_set'),
+                'spin': parameters.get('spin'),
+                'kpts': 'x'.join(str(int(k)) for k in kpts),
+                'mesh_cutoff': f'{mesh_cutoff / Ry:g}' if mesh_cutoff is not None else None,
+                'dm_tolerance': f'{parameters.get("fdf_arguments", {}).get("DM.Tolerance", "")}'}
+    return ','.join(f'{key}={value}' for key, value in settings.items())
@@ -0,0 +1,70 @@
+"""
+The module contains a function 'set_layer_constraint' that constrains the atoms of the layers during
+the relaxation and a function 'get_outer_indexes' used by it.
+"""
+
+import numpy as np
+from ase.constraints import FixAtoms, FixCartesian
+from functions.small_functions import get_interlayer_indexes
+
+# Kinds of the constraint of the atoms of the layers:
+# none - all atoms relaxed, fix - layers fixed, z - layers moved only along z,
+# outer - outer chalcogen planes of the two layers fixed
+LAYER_CONSTRAINTS = ('none', 'fix', 'z', 'outer')
+
+def get_outer_indexes(structure, layer_indexes, tol=0.5):
+    """
+    Returns the indexes of the atoms of the outer planes of the layers (the outer chalcogens), i.e., the atoms
+    of the bottom layer lying at the bottom of the cell and the atoms of the top layer lying at its top.
+
+    Args:
+        structure (ase.Atoms): The structure.
+        layer_indexes (list): Indexes of the atoms of the layers.
+        tol (float): Height difference (Angstrom) within which the atoms belong to the same plane.
+
+    Returns:
+        list: The indexes of the atoms of the outer planes.
+    """
+    layer_indexes = np.asarray(layer_indexes)
+    z = structure.positions[layer_indexes, 2]
+    middle = structure.cell[2, 2] / 2
+    bottom = z < middle
+    outer = np.zeros(len(layer_indexes), dtype=bool)
+    if np.any(bottom):
+        outer |= bottom & (z < z[bottom].min() + tol)
+    if np.any(~bottom):
+        outer |= ~bottom & (z > z[~bottom].max() - tol)
+    return layer_indexes[outer].tolist()
+
+def set_layer_constraint(structure, kind='none'):
+    """
+    Sets the constraint of the atoms of the layers of the structure. The atoms between the layers
+    are always free. The constraints are written by ASE to the SIESTA input as the flags
+    of the Zmatrix block (see calculator.get_calc) and are obeyed by the ASE optimizers
+    of the socket mode. The kind of the constraint is stored in atoms.info['layer_constraint'].
+
+    Args:
+        structure (ase.Atoms): The structure (modified in place).
+        kind (str): Kind of the constraint (one of LAYER_CONSTRAINTS).
+
+    Returns:
+        int: Number of the fixed degrees of freedom.
+    """
+    if kind not in LAYER_CONSTRAINTS:
+        raise ValueError(f'Unknown layer constraint: {kind}')
+
+    atom_indexes = get_interlayer_indexes(structure)
+    layer_indexes = [i for i in range(len(structure)) if i not in atom_indexes]
+    structure.info['layer_constraint'] = kind
+    if kind == 'fix':
+        structure.set_constraint(FixAtoms(indices=layer_indexes))
+        return 3 * len(layer_indexes)
+    if kind == 'z':
+        structure.set_constraint(FixCartesian(layer_indexes, mask=(True, True, False)))
+        return 2 * len(layer_indexes)
+    if kind == 'outer':
+        outer_indexes = get_outer_indexes(structure, layer_indexes)
+        structure.set_constraint(FixAtoms(indices=outer_indexes))
+        return 3 * len(outer_indexes)
+    structure.set_constraint()
+    return 0
@@ -1,29 +1,43 @@
 """
-The module contains a function 'continue_generation' that allows you to continue unfinished calculations.
+The module contains a function 'continue_generation' that allows you to continue unfinished calculations
+and functions 'find_unfinished', 'get_index' and 'get_last_index' that find the structures whose relaxation
+was interrupted and the numbers of the existing folders.
 """
 
-import os, sys, random
+import os, re, sys, random
 from pathlib import Path
-import numpy as np
-from ase import io
 from ase.io import Trajectory
 from math import ceil
-from functions.sort_population import sort_population
+from functions.population import Population
+from functions.prep_struct import prep_struct
 from functions.gen_rand_struct import gen_rand_struct
 from functions.mutation import mutation
+from functions.small_functions import get_interlayer_sites
 from functions.crossover import crossover
 from functions.gen_energy_file import gen_energy_file
+from functions.relax_struct import relax_struct, load_unfinished
+from functions.stop_criteria import budget_exhausted
+from functions.metrics import new_record, timed, finish_candidate, finish_generation
+from functions.selection import get_distance_matrix, select_parents
+from functions.scheduler import run_jobs, count_done
+from functions.pipeline import make_jobs
+from functions.cost_model import get_features, fit_cost_model
 
-def continue_generation(previous_pop_filename, pop_size, n_best, n_child, n_mut,
+def continue_generation(previous_pop, pop_size, n_best, n_child, n_mut,
                         struct_filename, size, n_atoms, n_change, atom_symbol,
-                        calc, mag_moment, label, continue_pop_label):
+                        calc, mag_moment, label, continue_pop_label, budget=None,
+                        mut_kinds=('random',), mut_step=0.5, relax_options=None,
+                        metrics=None, selection=None, prefetch=0):
     """
     Continues computing the unfinished generation, starting from the last fully computed structure.
+    Relaxations interrupted in the child*, mut* and cand* folders are resumed first from the geometry
+    and the density matrix saved by SIESTA, and new structures are numbered after the existing folders.
     As a result of the function's execution, calculations continue in the folder continue_pop_label,
-    which is provided as an argument to the function.
+    which is provided as an argument to the function. If the compute budget is used up, the generation
+    is checkpointed again and can be continued later.
 
     Args:
-        previous_pop_filename (str): Name of the file containing the previous population.
+        previous_pop (Population or str): The sorted previous population or the name of the file containing it.
         pop_size (int): Size of the population.
         n_best (int): Number of the best individuals from the previous generation that will go to the new generation.
         n_child (int): Number of new individuals created through crossover.
@@ -37,150 +51,209 @@ def continue_generation(previous_pop_filename, pop_size, n_best, n_child, n_mut,
         mag_moment (float): Initial magnetic moment assigned to atoms between layers.
         label (str): Label assigned to the calculator files (e.g., MoS2).
         continue_pop_label (str): Label of the unfinished population.
+        budget (dict, optional): Compute budget of the run (see stop_criteria.init_budget).
+        mut_kinds (list, optional): Kinds of mutation drawn for each mutant (see mutation.MUTATION_KINDS).
+        mut_step (float, optional): Maximum displacement in the local kinds of mutation.
+        relax_options (dict, optional): Options of the relaxation (see relax_struct).
+        metrics (dict, optional): Metrics collector of the run (see metrics.init_metrics).
+        selection (dict, optional): Parent selection settings of the run (see selection.init_selection).
+        prefetch (int, optional): Maximum number of the candidates created in advance in the background
+            while SIESTA is running (see pipeline.make_jobs, 0 - disabled).
 
-     Returns:
-        None: The function does not return a value.
+    Returns:
+        Population: The sorted population or None if the generation was checkpointed.
     """
 
     try:
-        # Loading the initial population from the .traj file
-        previous_pop = sort_population(Trajectory(previous_pop_filename, 'r'))
-        # Better adapted part of the previous population
-        better_part = previous_pop[:ceil(pop_size / 2)]
+        gen_record = new_record(continue_pop_label)
+        with timed(metrics, gen_record, 'selection'):
+            # Loading the previous population from the .traj file if it is not kept in memory
+            if not isinstance(previous_pop, Population):
+                previous_pop = Population.from_traj(previous_pop).sorted()
+            # Better adapted part of the previous population
+            better_part = previous_pop[:ceil(pop_size / 2)]
+            # Distances between the structures of the better part used by the diverse parent selection
+            distances = None
+            if selection is not None and selection['mode'] == 'diverse':
+                distances = get_distance_matrix(better_part, selection)
+                gen_record['diversity'] = float(distances.mean())
+        # Indexes of the parents selected in this generation
+        chosen = []
 
         folder_path = Path(f'{continue_pop_label}')
         folder_path.mkdir(parents=True, exist_ok=True)
         original_directory = os.getcwd()
         os.chdir(folder_path)
 
+        # Two-layer structure to which the atoms between the layers are added
+        template = prep_struct(f'{original_directory}/{struct_filename}', size)
+        # High-symmetry sites of the hop mutation, computed once from the unrelaxed layers
+        sites = get_interlayer_sites(template) if 'hop' in mut_kinds else None
+
+        # Structures already in the new population
+        structures = []
         try:
             # Loading structures from the unfinished generation
-            continue_pop = Trajectory(f'{continue_pop_label}.traj', 'r')
-            not_ended_pop = []
-            for struct in continue_pop:
-                not_ended_pop.append(struct)
-
-            # Creating .traj file for new population
-            new_pop = Trajectory(f'{continue_pop_label}.traj', 'w')
-
-            # Adding structures from the unfinished generation or if the unfinished generation is empty
-            # adding the best individuals from the previous population directly to the new generation
-            if len(not_ended_pop) > 0:
-                for struct in not_ended_pop:
-                    new_pop.write(struct)
-            else:
-                for i in range(n_best):
-                    new_pop.write(better_part[i])
-
+            with Trajectory(f'{continue_pop_label}.traj', 'r') as continue_pop:
+                structures = [struct for struct in continue_pop]
         # If there is no continue_pop .traj file
         except FileNotFoundError:
-            # Creating .traj file for new population
-            new_pop = Trajectory(f'{continue_pop_label}.traj', 'w')
-            # Adding the best individuals from the previous population directly to the new generation
-            for i in range(n_best):
-                new_pop.write(better_part[i])
-
-        # Creating new individuals through crossover
-        child_counter = len(new_pop) - n_best
-        while len(new_pop) < n_best + n_child:
-            child_counter += 1
-            tmp_folder_path = Path(f'child{child_counter}')
-            tmp_folder_path.mkdir(parents=True, exist_ok=True)
-            os.chdir(tmp_folder_path)
-            parent1, parent2 = random.sample(better_part, 2)
-            child = crossover(parent1, parent2, n_change, f'{original_directory}/{struct_filename}', size)
-            moments = [0] * (len(child) - n_atoms) + [mag_moment] * n_atoms
-            child.set_initial_magnetic_moments(moments)
-            try:
-                child.calc = calc
-                pot_energy = child.get_potential_energy()
-                relaxed_child = io.read(f'{label}.XV')
-                relaxed_child.pbc = [True, True, False]
-                relaxed_child.info['pot_energy'] = np.round(pot_energy, 4)
-                io.write(f'relaxed_child{child_counter}.xyz', relaxed_child)
-                new_pop.write(relaxed_child)
-                print(f'Successfully relaxed child{child_counter}.')
-                with open(f'../log_{continue_pop_label}.txt', 'a') as f:
-                    f.write(f'Successfully relaxed child{child_counter}.\n')
-            except Exception as e:
-                print(f'Failed to relax child{child_counter}. Error: {e}')
-                with open(f'../log_{continue_pop_label}.txt', 'a') as f:
-                    f.write(f'Failed to relax child{child_counter}. Error: {e}\n')
+            pass
 
+        # Creating .traj file for new population
+        new_pop = Trajectory(f'{continue_pop_label}.traj', 'w')
 
-            os.chdir(original_directory / folder_path)
+        # Adding structures from the unfinished generation or if the unfinished generation is empty
+        # adding the best individuals from the previous population directly to the new generation
+        # - they are written from the arrays of the population and kept in memory without copies
+        if len(structures) > 0:
+            for struct in structures:
+                new_pop.write(struct)
+        else:
+            better_part.write_to(new_pop, range(n_best))
+            structures = [better_part.to_atoms(i, copy=False) for i in range(n_best)]
 
-        # Creating new individuals through mutation
-        mut_counter = len(new_pop) - n_best - n_child
-        while len(new_pop) < n_best + n_child + n_mut:
-            mut_counter += 1
-            tmp_folder_path = Path(f'mut{mut_counter}')
-            tmp_folder_path.mkdir(parents=True, exist_ok=True)
-            os.chdir(tmp_folder_path)
-            mut_struct = mutation(random.choice(better_part))
-            moments = [0] * (len(mut_struct) - n_atoms) + [mag_moment] * n_atoms
-            mut_struct.set_initial_magnetic_moments(moments)
-            try:
-                mut_struct.calc = calc
-                pot_energy = mut_struct.get_potential_energy()
-                relaxed_mut_struct = io.read(f'{label}.XV')
-                relaxed_mut_struct.pbc = [True, True, False]
-                relaxed_mut_struct.info['pot_energy'] = np.round(pot_energy, 4)
-                io.write(f'relaxed_mut{mut_counter}.xyz', relaxed_mut_struct)
-                new_pop.write(relaxed_mut_struct)
-                print(f'Successfully relaxed mut{mut_counter}.')
-                with open(f'../log_{continue_pop_label}.txt', 'a') as f:
-                    f.write(f'Successfully relaxed mut{mut_counter}.\n')
-            except Exception as e:
-                print(f'Failed to relax mut{mut_counter}. Error: {e}')
-                with open(f'../log_{continue_pop_label}.txt', 'a') as f:
-                    f.write(f'Failed to relax mut{mut_counter}. Error: {e}\n')
+        # Resuming the relaxations interrupted in the existing folders
+        for name in find_unfinished(continue_pop_label, label):
+            if len(structures) >= pop_size or budget_exhausted(budget):
+                break
+            os.chdir(name)
+            record = new_record(continue_pop_label, name)
+            with timed(metrics, record, 'io'):
+                struct = load_unfinished(name, label)
+            # The features are computed again, as the record of the interrupted run is not saved
+            if struct is not None:
+                record['features'] = get_features(struct, calc)
+            relaxed_struct = relax_struct(struct, n_atoms, mag_moment, calc, label, name, continue_pop_label,
+                                          budget, relax_options, metrics, record, resume=True)
+            if relaxed_struct is not None:
+                with timed(metrics, record, 'io'):
+                    new_pop.write(relaxed_struct)
+                structures.append(relaxed_struct)
+            finish_candidate(metrics, record, relaxed_struct is not None)
 
             os.chdir(original_directory / folder_path)
 
-        # Creating the remaining individuals by drawing new structures
-        candidates_counter = len(new_pop) - n_best - n_child - n_mut
-        while len(new_pop) < pop_size:
-            candidates_counter += 1
-            tmp_struct = gen_rand_struct(f'{original_directory}/{struct_filename}', size, atom_symbol, n_atoms)
-            moments = [0] * (len(tmp_struct) - n_atoms) + [mag_moment] * n_atoms
-            tmp_struct.set_initial_magnetic_moments(moments)
-            tmp_folder_path = Path(f'cand{candidates_counter}')
-            tmp_folder_path.mkdir(parents=True, exist_ok=True)
-            os.chdir(tmp_folder_path)
-            try:
-                tmp_struct.calc = calc
-                pot_energy = tmp_struct.get_potential_energy()
-                relaxed_struct = io.read(f'{label}.XV')
-                relaxed_struct.pbc = [True, True, False]
-                relaxed_struct.info['pot_energy'] = np.round(pot_energy, 4)
-                io.write(f'relaxed_cand{candidates_counter}.xyz', relaxed_struct)
-                new_pop.write(relaxed_struct)
-                print(f'Successfully relaxed cand{candidates_counter}.')
-                with open(f'../log_{continue_pop_label}.txt', 'a') as f:
-                    f.write(f'Successfully relaxed cand{candidates_counter}.\n')
-            except Exception as e:
-                print(f'Failed to relax cand{candidates_counter}. Error: {e}')
-                with open(f'../log_{continue_pop_label}.txt', 'a') as f:
-                    f.write(f'Failed to relax cand{candidates_counter}. Error: {e}\n')
+        def make_struct(kind):
+            # Creates a new individual of the given kind
+            if kind == 'child':
+                index1, index2 = select_parents(better_part, 2, selection, distances, chosen)
+                return crossover(better_part, index1, index2, n_change, template)
+            if kind == 'mut':
+                index, = select_parents(better_part, 1, selection, distances, chosen)
+                # The parent is not copied - mutation modifies its own copy
+                return mutation(better_part.to_atoms(index, copy=False), random.choice(mut_kinds), mut_step,
+                                sites=sites)
+            return gen_rand_struct(f'{original_directory}/{struct_filename}', size, atom_symbol, n_atoms, template)
 
-            os.chdir(original_directory / folder_path)
+        # Creating the missing individuals - new structures are numbered after the existing folders
+        quotas = {'child': n_child, 'mut': n_mut, 'cand': pop_size - n_best - n_child - n_mut}
+        counters = {kind: get_last_index(kind) for kind in quotas}
+        done = count_done([struct.info.get('name', '') for struct in structures], continue_pop_label, quotas, n_best)
+        # Cost model of the wall times fitted once for the whole generation
+        model = fit_cost_model(metrics['filename']) if metrics is not None else None
+        while any(done[kind] < quota for kind, quota in quotas.items()) and not budget_exhausted(budget):
+            specs = []
+            for kind, quota in quotas.items():
+                for _ in range(quota - done[kind]):
+                    counters[kind] += 1
+                    specs.append((f'{kind}{counters[kind]}', (kind,)))
+            with make_jobs(continue_pop_label, specs, make_struct, calc, metrics, prefetch) as jobs:
+                structures += run_jobs(jobs, new_pop, n_atoms, mag_moment, calc, label, continue_pop_label, budget,
+                                       relax_options, metrics, model)
+            done = count_done([struct.info.get('name', '') for struct in structures], continue_pop_label, quotas,
+                              n_best)
 
-        tmp_pop = sort_population(Trajectory(f'{continue_pop_label}.traj', 'r'))
-        # Saving the energy of structures in the new population to a file
-        gen_energy_file(tmp_pop, f'../energy_{continue_pop_label}')
+        # If the compute budget is exhausted, the unfinished generation is left in the continue_pop_label.traj file
+        if any(done[kind] < quota for kind, quota in quotas.items()):
+            new_pop.close()
+            os.chdir(original_directory)
+            print(f'Compute budget exhausted - the {continue_pop_label} has been checkpointed.')
+            with open(f'{folder_path}/log_{continue_pop_label}.txt', 'a') as f:
+                f.write(f'Compute budget exhausted - the {continue_pop_label} has been checkpointed.\n')
+            finish_generation(metrics, gen_record, f'{folder_path}/log_{continue_pop_label}.txt')
+            return None
 
-        os.chdir(original_directory)
+        new_pop.close()
+        with timed(metrics, gen_record, 'selection'):
+            # The population built from the structures kept in memory, without reading continue_pop_label.traj again
+            tmp_pop = Population.from_atoms(structures).sorted()
+        with timed(metrics, gen_record, 'io'):
+            # Saving the energy of structures in the new population to a file
+            gen_energy_file(tmp_pop, f'../energy_{continue_pop_label}')
 
-        # Saving the new population to the .traj file in order from the lowest to the highest energy
-        out_pop = Trajectory(f'sorted_{continue_pop_label}.traj', 'w')
-        for structure in tmp_pop:
-            out_pop.write(structure)
+            os.chdir(original_directory)
+
+            # Saving the new population to the .traj file in order from the lowest to the highest energy
+            tmp_pop.write(f'sorted_{continue_pop_label}.traj')
+        finish_generation(metrics, gen_record, f'{folder_path}/log_{continue_pop_label}.txt')
 
         print(f'The {continue_pop_label} is complete!')
         with open(f'{folder_path}/log_{continue_pop_label}.txt', 'a') as f:
             f.write(f'The {continue_pop_label} is complete!\n')
 
+        return tmp_pop
+
     except Exception as er:
         print(er)
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+def find_unfinished(pop_name, label):
+    """
+    Finds the structures of the population whose relaxation was interrupted. These are the child*, mut*
+    and cand* folders in the current working directory without the relaxed structure, containing
+    the starting structure or the geometry saved by SIESTA, whose failure is not recorded in the log.
+
+    Args:
+        pop_name (str): Label of the population.
+        label (str): Label assigned to the calculator files (e.g., MoS2).
+
+    Returns:
+        list: Names of the structures (e.g., cand3).
+    """
+    failed = set()
+    try:
+        with open(f'log_{pop_name}.txt', 'r') as f:
+            for line in f:
+                if line.startswith('Failed to relax '):
+                    failed.add(line.split()[3].rstrip('.'))
+    except FileNotFoundError:
+        pass
+
+    unfinished = []
+    for path in sorted(Path('.').iterdir(), key=lambda p: (p.name.rstrip('0123456789'), get_index(p.name))):
+        name = path.name
+        if not path.is_dir() or not re.fullmatch(r'(child|mut|cand)\d+', name) or name in failed:
+            continue
+        if (path / f'relaxed_{name}.xyz').exists():
+            continue
+        if (path / f'start_{name}.traj').exists() or (path / f'{label}.XV').exists():
+            unfinished.append(name)
+    return unfinished
+
+def get_index(name):
+    """
+    Returns the number at the end of the folder name (e.g., 3 for cand3) or 0 if there is none.
+
+    Args:
+        name (str): Name of the folder.
+
+    Returns:
+        int: The number.
+    """
+    match = re.search(r'\d+$', name)
+    return int(match.group()) if match else 0
+
+def get_last_index(prefix):
+    """
+    Returns the highest number of the folders with the given prefix in the current working directory.
+
+    Args:
+        prefix (str): Prefix of the folders (child, mut or cand).
+
+    Returns:
+        int: The highest number or 0 if there is no such folder.
+    """
+    indexes = [get_index(path.name) for path in Path('.').iterdir()
+               if path.is_dir() and re.fullmatch(rf'{prefix}\d+', path.name)]
+    return max(indexes, default=0)
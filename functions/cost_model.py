@@ -0,0 +1,112 @@
+"""
+The module contains a function 'fit_cost_model' that fits the model of the wall time of a candidate
+to the records from the metrics file, and functions 'get_features', 'get_profile_cost', 'get_feature_vector'
+and 'predict_cost' used by it.
+"""
+
+import json
+import numpy as np
+from ase.units import Ry
+
+OPERATORS = ('random', 'enumeration', 'seed', 'crossover', 'mutation')
+
+# Minimum number of records to which the model is fitted - with fewer records the fit is not constrained
+# by the data and the predictions are not made
+MIN_RECORDS = 5
+
+def get_profile_cost(calc):
+    """
+    Returns the relative cost of a single SCF step of the calculator settings: the number of k-points
+    multiplied by the mesh cutoff (Ry) to the power 1.5 (the number of real-space grid points).
+
+    Args:
+        calc (ase.Calculator): Calculator object.
+
+    Returns:
+        float: The relative cost.
+    """
+    kpts = calc.parameters.get('kpts') or [1, 1, 1]
+    mesh_cutoff = calc.parameters.get('mesh_cutoff', Ry) / Ry
+    return float(np.prod(kpts) * mesh_cutoff ** 1.5)
+
+def get_features(struct, calc):
+    """
+    Returns the features of a candidate used to predict its wall time: the operator that created it,
+    the number of atoms between the layers, the distance from the closest parent and the relative cost
+    of the calculator settings.
+
+    Args:
+        struct (ase.Atoms): The candidate structure.
+        calc (ase.Calculator): Calculator object.
+
+    Returns:
+        dict: The features.
+    """
+    return {'operator': struct.info.get('operator', 'random'),
+            'n_intercalants': int(np.count_nonzero(struct.get_tags() == 1)),
+            'parent_distance': float(struct.info.get('parent_distance', 0.)),
+            'profile_cost': get_profile_cost(calc)}
+
+def get_feature_vector(features):
+    """
+    Returns the vector of the features: intercept, one-hot encoded operator, number of atoms between the layers,
+    distance from the closest parent and logarithm of the relative cost of the calculator settings.
+
+    Args:
+        features (dict): The features returned by get_features.
+
+    Returns:
+        np.array: The feature vector.
+    """
+    one_hot = [float(features['operator'] == operator) for operator in OPERATORS]
+    return np.array([1.] + one_hot + [features['n_intercalants'], features['parent_distance'],
+                                      np.log(features['profile_cost'])])
+
+def fit_cost_model(filename, ridge=1E-3, min_records=MIN_RECORDS):
+    """
+    Fits the linear model of the logarithm of the wall time of a candidate to the features of the candidates
+    successfully relaxed in the past (the records of the metrics file). A small ridge term keeps the fit
+    stable when some features are constant in the data.
+
+    Args:
+        filename (str): Name of the JSON-lines metrics file.
+        ridge (float): Strength of the ridge regularization.
+        min_records (int): Minimum number of records to which the model is fitted.
+
+    Returns:
+        dict: The model ('coef' - coefficients, 'n_records' - number of fitted records)
+            or None if there are fewer than min_records records.
+    """
+    X, y = [], []
+    try:
+        with open(filename, 'r') as file:
+            for line in file:
+                record = json.loads(line)
+                if (record.get('type') == 'candidate' and record.get('success') and 'features' in record
+                        and record.get('wall_time', 0) > 0):
+                    X.append(get_feature_vector(record['features']))
+                    y.append(np.log(record['wall_time']))
+    except FileNotFoundError:
+        return None
+    if len(X) < min_records:
+        return None
+
+    X = np.array(X)
+    y = np.array(y)
+    penalty = ridge * np.eye(X.shape[1])
+    penalty[0, 0] = 0.
+    coef = np.linalg.solve(X.T @ X + penalty, X.T @ y)
+    return {'coef': coef, 'n_records': len(y)}
+
+def predict_cost(model, features):
+    """
+    Predicts the wall time of a candidate.
+
+    Args:
+        model (dict): The model returned by fit_cost_model.
+        features (dict): The features returned by get_features.
+
+    Returns:
+        float: The predicted wall time in seconds.
+    """
+    return float(np.exp(get_feature_vector(features) @ model['coef']))
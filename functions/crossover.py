@@ -2,107 +2,74 @@
 The module contains a function 'crossover' that performs crossover operation.
 """
 
-from ase import Atoms
-import math
 import random
-from itertools import combinations
-from functions.small_functions import get_r, second_part
-from functions.prep_struct import prep_struct
+from ase import Atoms
+from functions.small_functions import get_interlayer_indexes, get_parent_distance
+from functions.validation import validate_struct
 
-def crossover(atoms1, atoms2, n, struct_filename, struct_size):
+def crossover(population, index1, index2, n, template, max_tries=1000):
     """
-    Performs crossover between two given structures by exchanging atoms between them.
+    Performs crossover between two structures of the population by exchanging atoms between them.
+    The atoms between the layers of the parents are read from views of the population arrays.
+    Each child is checked by validation.validate_struct, so collisions with the atoms of the layers
+    and the periodic images are found as well. If no valid child is found in max_tries exchanges,
+    the last one is returned and rejected before the calculation (see scheduler.make_job).
+    The number of drawn exchanges is stored in atoms.info['n_tries'] and the distance of the child
+    from the closer parent in atoms.info['parent_distance'].
 
     Args:
-        atoms1 (ase.Atoms): First structure.
-        atoms2 (ase.Atoms): Second structure
+        population (Population): The population containing the parent structures.
+        index1 (int): Index of the first parent in the population.
+        index2 (int): Index of the second parent in the population.
         n (int): Number of atoms exchanged between structures during crossover.
-        struct_filename (str): Filename of basic dichalcogenide structure (e.g., MoS2).
-        struct_size (str): Size of structures (e.g., 4x4).
+        template (ase.Atoms): Two-layer structure created by prep_struct to which the atoms are added.
+        max_tries (int): Maximum number of drawn exchanges.
 
     Returns:
         ase.Atoms: The structure created by crossover.
     """
-    # Parent structures - the same cells as atoms1 and atoms2
-    # Atoms located between the layers in atoms1 and atoms2 will be added to them
-    parent1 = Atoms()
-    parent1.set_cell(atoms1.cell)
-    parent2 = Atoms()
-    parent2.set_cell(atoms2.cell)
-
-    # Output child object
-    child = prep_struct(struct_filename, struct_size)
-
-    #  Dimensions of the parents unit cell
-    cell = atoms1.get_cell()
-    array = atoms1.cell.cellpar()
-    c = array[2]  # Dimension in the direction of the z-axis
-    c_half = c / 2 # Half the height of the cell
+    # Positions and atomic numbers of atoms located between the layers in the parent structures
+    positions1 = population.intercalant_positions[index1]
+    numbers1 = population.intercalant_numbers[index1]
+    positions2 = population.intercalant_positions[index2]
+    numbers2 = population.intercalant_numbers[index2]
 
     tol_r = 0.1  # Tolerance used when checking the distance between atoms
-
-    # Adding atoms located between layers in atoms1 and atoms2 structures to the parent structures
-    for atom in atoms1:
-        if math.isclose(atom.position[2], c_half, abs_tol=1E-1):
-            parent1.append(atom)
-    for atom in atoms2:
-        if math.isclose(atom.position[2], c_half, abs_tol=1E-1):
-            parent2.append(atom)
-
-    combinations1 = list(combinations(parent1, n)) # All n-atomic combinations from parent1
-    combinations2 = list(combinations(parent2, n)) # All n-atomic combinations from parent2
-
-    while True:
-        # Temporary structures of children
-        tmp_child1 = Atoms()
-        tmp_child1.set_cell(cell)
-        tmp_child2 = Atoms()
-        tmp_child2.set_cell(cell)
-        # Part 'a' of parent1 made of atoms selected during combination
-        parent1_a = Atoms(random.choice(combinations1))
-        # Part 'b' of parent1 made of remaining atoms
-        parent1_b = second_part(parent1, parent1_a)
-        # Part 'a' of parent2 made of atoms selected during combination
-        parent2_a = Atoms(random.choice(combinations2))
-        # Part 'b' of parent2 made of remaining atoms
-        parent2_b = second_part(parent2, parent2_a)
-
-        # Adding atoms between layers to child no. 1
-        for atom in parent1_a + parent2_b:
-            tmp_child1.append(atom)
-
-        # Adding atoms between layers to child no. 2
-        for atom in parent1_b + parent2_a:
-            tmp_child2.append(atom)
-
-        # Collision check between atoms and their images in tmp_child1
-        image_structure1 = tmp_child1 * [3, 3, 1]
-        collision_in_child1 = False
-        for i in range(len(image_structure1)):
-            for j in range(i + 1, len(image_structure1)):
-                distance = image_structure1.get_distance(i, j)
-                if distance < (2 * get_r(image_structure1.get_atomic_numbers()[0]) + tol_r):
-                    collision_in_child1 = True
-                    break
-
-        # Collision check between atoms and their images in tmp_child2
-        image_structure2= tmp_child2 * [3, 3, 1]
-        collision_in_child2 = False
-        for i in range(len(image_structure2)):
-            for j in range(i + 1, len(image_structure2)):
-                distance = image_structure2.get_distance(i, j)
-                if distance < (2 * get_r(image_structure2.get_atomic_numbers()[0]) + tol_r):
-                    collision_in_child2 = True
-                    break
-
-        # If there is no collision in tmp_child1 or tmp_child2 - create output child structure
-        if not collision_in_child1:
-            for atom in tmp_child1:
-                child.append(atom)
+    n_tries = 0 # Number of drawn exchanges
+
+    for _ in range(max_tries):
+        n_tries += 1
+        # Part 'a' of parents made of n randomly selected atoms, part 'b' made of the remaining atoms
+        parent1_a = random.sample(range(len(positions1)), n)
+        parent1_b = [i for i in range(len(positions1)) if i not in parent1_a]
+        parent2_a = random.sample(range(len(positions2)), n)
+        parent2_b = [i for i in range(len(positions2)) if i not in parent2_a]
+
+        # Children made of the template and the exchanged atoms between the layers (tagged 1)
+        child1 = template.copy()
+        child1.extend(Atoms(numbers=list(numbers1[parent1_a]) + list(numbers2[parent2_b]),
+                            positions=list(positions1[parent1_a]) + list(positions2[parent2_b]),
+                            tags=[1] * len(parent1_a + parent2_b), cell=population.cell, pbc=population.pbc))
+        child2 = template.copy()
+        child2.extend(Atoms(numbers=list(numbers1[parent1_b]) + list(numbers2[parent2_a]),
+                            positions=list(positions1[parent1_b]) + list(positions2[parent2_a]),
+                            tags=[1] * len(parent1_b + parent2_a), cell=population.cell, pbc=population.pbc))
+
+        # If there is no collision between atoms, the layers and their images in child1 or child2
+        # - create output child structure
+        if not validate_struct(child1, tol_r):
+            child = child1
             break
-        if not collision_in_child2:
-            for atom in tmp_child2:
-                child.append(atom)
+        if not validate_struct(child2, tol_r):
+            child = child2
             break
-
+    else:
+        # The colliding child is rejected by the validation before the calculation (see scheduler.make_job)
+        child = child1
+
+    child.info['operator'] = 'crossover'
+    child.info['n_tries'] = n_tries
+    child.info['parents'] = f'{population.names[index1]},{population.names[index2]}'
+    child.info['parent_distance'] = get_parent_distance(child.positions[get_interlayer_indexes(child)],
+                                                        [positions1, positions2], population.cell, population.pbc)
     return child
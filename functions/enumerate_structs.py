@@ -0,0 +1,226 @@
+"""
+The module contains a function 'enumerate_structs' that lists all symmetry-unique arrangements of atoms
+on the high-symmetry sites between the layers, and functions 'get_symmetry_operations', 'get_site_permutations',
+'enumerate_occupancies' and 'build_struct' used by it.
+"""
+
+import math
+import itertools
+import numpy as np
+from ase import Atoms
+from ase.data import atomic_numbers
+from ase.geometry import get_distances
+from functions.small_functions import get_r, check_collision, get_interlayer_sites
+from functions.pre_relax import PairPotential
+
+def get_symmetry_operations(structure, tol=0.1):
+    """
+    Finds the symmetry operations of the structure that do not mix the in-plane and the out-of-plane directions.
+    Each operation maps the scaled positions x onto x @ W.T + t.
+
+    Args:
+        structure (ase.Atoms): The structure.
+        tol (float): Distance (Angstrom) below which two positions are treated as the same.
+
+    Returns:
+        list: The (W, t) pairs of the rotation matrix (np.array 3x3) and the translation (np.array) in scaled coordinates.
+    """
+    cell = structure.get_cell()
+    pbc = structure.pbc
+    scaled = structure.get_scaled_positions(wrap=True)
+    numbers = structure.numbers
+    metric = cell @ cell.T
+
+    # Atoms of the least common element are the anchors from which the translations are found
+    elements, counts = np.unique(numbers, return_counts=True)
+    anchor_number = elements[np.argmin(counts)]
+    anchors = np.nonzero(numbers == anchor_number)[0]
+
+    # Subset of atoms checked before the whole structure
+    probe = np.arange(min(len(structure), 8))
+
+    operations = []
+    for a, b, c, d in itertools.product((-1, 0, 1), repeat=4):
+        for s in (1, -1):
+            W = np.array([[a, b, 0], [c, d, 0], [0, 0, s]])
+            if round(np.linalg.det(W)) == 0 or not np.allclose(W.T @ metric @ W, metric, atol=1E-3 * metric.max()):
+                continue
+            for k in anchors:
+                t = scaled[k] - W @ scaled[anchors[0]]
+                t[pbc] -= np.floor(t[pbc])
+                if maps_onto(scaled[probe] @ W.T + t, numbers[probe], scaled, numbers, cell, pbc, tol) \
+                        and maps_onto(scaled @ W.T + t, numbers, scaled, numbers, cell, pbc, tol):
+                    operations.append((W, t))
+    return operations
+
+def maps_onto(mapped, mapped_numbers, scaled, numbers, cell, pbc, tol):
+    """
+    Checks whether every mapped position coincides with an atom of the same element.
+
+    Args:
+        mapped (np.array): The mapped scaled positions.
+        mapped_numbers (np.array): The atomic numbers of the mapped atoms.
+        scaled (np.array): The scaled positions of the structure.
+        numbers (np.array): The atomic numbers of the structure.
+        cell (ase.Cell): The cell object.
+        pbc (np.array): Periodic boundary conditions.
+        tol (float): Distance below which two positions are treated as the same.
+
+    Returns:
+        bool: True if all positions are mapped onto atoms of the same element.
+    """
+    diff = mapped[:, np.newaxis, :] - scaled[np.newaxis, :, :]
+    diff[..., pbc] -= np.round(diff[..., pbc])
+    d = np.linalg.norm(diff @ np.asarray(cell), axis=-1)
+    same = (d < tol) & (mapped_numbers[:, np.newaxis] == numbers[np.newaxis, :])
+    return bool(np.all(same.any(axis=1)))
+
+def get_site_permutations(operations, sites, cell, pbc, tol=0.1):
+    """
+    Returns the permutations of the sites induced by the symmetry operations.
+
+    Args:
+        operations (list): The (W, t) pairs returned by get_symmetry_operations.
+        sites (np.array): The xyz coordinates of the sites.
+        cell (ase.Cell): The cell object.
+        pbc (np.array): Periodic boundary conditions.
+        tol (float): Distance below which two positions are treated as the same.
+
+    Returns:
+        np.array: The permutations, shape (n_operations, n_sites) - site i is mapped onto site permutations[g, i].
+    """
+    scaled = cell.scaled_positions(sites)
+    permutations = []
+    for W, t in operations:
+        diff = (scaled @ W.T + t)[:, np.newaxis, :] - scaled[np.newaxis, :, :]
+        diff[..., pbc] -= np.round(diff[..., pbc])
+        d = np.linalg.norm(diff @ np.asarray(cell), axis=-1)
+        permutation = np.argmin(d, axis=1)
+        # Operations mapping a site outside the set of sites are skipped
+        if np.all(d[np.arange(len(sites)), permutation] < tol) and len(set(permutation)) == len(sites):
+            permutations.append(permutation)
+    return np.array(permutations)
+
+def enumerate_occupancies(template, atom_symbol, n_atoms, max_combinations=10**7, tol_r=0.1, chunk_size=10000):
+    """
+    Lists the symmetry-unique occupancies of the sites between the layers by n_atoms atoms. Sites colliding
+    with the layers and occupancies with colliding atoms are skipped. Each occupancy is represented
+    by the lexicographically smallest member of its orbit under the symmetry operations of the template.
+
+    Args:
+        template (ase.Atoms): Two-layer structure created by prep_struct.
+        atom_symbol (str): Chemical symbol of atoms between the layers.
+        n_atoms (int): Number of atoms between layers.
+        max_combinations (int): Maximum number of checked combinations of the sites.
+        tol_r (float): Tolerance used when checking the distance between atoms.
+        chunk_size (int): Number of combinations processed at once.
+
+    Returns:
+        tuple: The xyz coordinates of the sites (np.array), the occupancies (np.array of site indexes,
+            shape (n_unique, n_atoms)) and the number of equivalent occupancies of each of them (np.array).
+    """
+    cell = template.get_cell()
+    pbc = template.pbc
+    atom_number = atomic_numbers[atom_symbol]
+
+    sites = get_interlayer_sites(template)
+    sites = np.array([site for site in sites if not check_collision(template, site, atom_number, tol_r=tol_r)])
+    n_sites = len(sites)
+
+    n_combinations = math.comb(n_sites, n_atoms)
+    if n_combinations > max_combinations or n_sites ** n_atoms >= 2 ** 62:
+        raise ValueError(f'Too many arrangements to enumerate: {n_combinations} combinations of {n_sites} sites.')
+
+    # Pairs of sites too close to be occupied at the same time
+    _, d = get_distances(sites, cell=cell, pbc=pbc)
+    conflicts = d < 2 * get_r(atom_number) + tol_r
+    np.fill_diagonal(conflicts, False)
+
+    permutations = get_site_permutations(get_symmetry_operations(template), sites, cell, pbc)
+    powers = n_sites ** np.arange(n_atoms - 1, -1, -1, dtype=np.int64)
+    pairs = list(itertools.combinations(range(n_atoms), 2))
+
+    occupancies = []
+    multiplicities = []
+    combinations = itertools.combinations(range(n_sites), n_atoms)
+    while True:
+        chunk = np.array(list(itertools.islice(combinations, chunk_size)), dtype=np.int64).reshape(-1, n_atoms)
+        if len(chunk) == 0:
+            break
+        if pairs:
+            chunk = chunk[~np.any([conflicts[chunk[:, a], chunk[:, b]] for a, b in pairs], axis=0)]
+        if len(chunk) == 0:
+            continue
+
+        # Keys of all images of the occupancies (sorted site indexes as digits of a number)
+        images = np.sort(permutations[:, chunk], axis=-1)
+        keys = images @ powers
+        own_keys = chunk @ powers
+        representative = own_keys == keys.min(axis=0)
+
+        sorted_keys = np.sort(keys[:, representative], axis=0)
+        multiplicities.append(1 + np.count_nonzero(np.diff(sorted_keys, axis=0), axis=0))
+        occupancies.append(chunk[representative])
+
+    if not occupancies:
+        return sites, np.zeros((0, n_atoms), dtype=np.int64), np.zeros(0, dtype=int)
+    return sites, np.vstack(occupancies), np.concatenate(multiplicities)
+
+def build_struct(template, sites, occupancy, atom_symbol):
+    """
+    Creates the structure with atoms placed on the given sites between the layers.
+
+    Args:
+        template (ase.Atoms): Two-layer structure created by prep_struct.
+        sites (np.array): The xyz coordinates of the sites.
+        occupancy (np.array): Indexes of the occupied sites.
+        atom_symbol (str): Chemical symbol of atoms between the layers.
+
+    Returns:
+        ase.Atoms: The structure.
+    """
+    structure = template + Atoms(symbols=[atom_symbol] * len(occupancy), positions=sites[np.asarray(occupancy)],
+                                 tags=[1] * len(occupancy))
+    structure.info['operator'] = 'enumeration'
+    structure.info['n_tries'] = 1
+    return structure
+
+def enumerate_structs(template, atom_symbol, n_atoms, rank='none', max_structs=0, max_combinations=10**7):
+    """
+    Lists the structures with all symmetry-unique arrangements of atoms on the high-symmetry sites
+    between the layers. The structures can be ranked with the classical pair potential (without relaxation),
+    so that the most promising arrangements are relaxed first. The number of equivalent arrangements
+    of each structure is stored in atoms.info['multiplicity'].
+
+    Args:
+        template (ase.Atoms): Two-layer structure created by prep_struct.
+        atom_symbol (str): Chemical symbol of atoms between the layers.
+        n_atoms (int): Number of atoms between layers.
+        rank (str): Cheap energy model used to order the structures (pair or none).
+        max_structs (int): Maximum number of returned structures (0 - all).
+        max_combinations (int): Maximum number of checked combinations of the sites.
+
+    Returns:
+        list: The structures (ase.Atoms) in the order in which they should be relaxed.
+    """
+    if rank not in ('pair', 'none'):
+        raise ValueError(f'Unknown energy model: {rank}')
+
+    sites, occupancies, multiplicities = enumerate_occupancies(template, atom_symbol, n_atoms, max_combinations)
+    structures = []
+    for occupancy, multiplicity in zip(occupancies, multiplicities):
+        structure = build_struct(template, sites, occupancy, atom_symbol)
+        structure.info['multiplicity'] = int(multiplicity)
+        structures.append(structure)
+
+    if rank == 'pair':
+        energies = []
+        for structure in structures:
+            structure.calc = PairPotential()
+            energies.append(structure.get_potential_energy())
+            structure.calc = None
+        structures = [structures[i] for i in np.argsort(energies, kind='stable')]
+
+    if max_structs > 0:
+        structures = structures[:max_structs]
+    return structures
@@ -0,0 +1,92 @@
+"""
+The module contains a function 'classify_failure' that finds the reason of a failed SIESTA calculation,
+a context manager 'adjusted_calc' that temporarily changes the settings of the calculator
+and a function 'format_failure_stats' that describes the failures of a generation.
+"""
+
+import re
+from pathlib import Path
+from contextlib import contextmanager
+from ase.calculators.socketio import SocketClosed
+
+# Regular expressions matching the SIESTA output (or the error message) identifying the category of the failure.
+# The setup patterns match only the errors of missing pseudopotential and basis files, as the names of these
+# files are printed in the output of every calculation
+FAILURE_PATTERNS = {'scf': (r'scf did not converge', r'scf_not_conv', r'scf not converged'),
+                    'geometry': (r'too close',),
+                    'memory': (r'out of memory', r'allocation failed', r'cannot allocate'),
+                    'setup': (r'pseudopotential file \S+ not found', r'configure pseudo_path',
+                              r'no such file or directory: \S+\.(psf|psml|ion)\b',
+                              r'cannot open \S+\.(psf|psml|ion)\b')}
+
+# Errors of the connection with the SIESTA process of a session (see socket_session.SiestaSession)
+SOCKET_ERRORS = (SocketClosed, ConnectionError, TimeoutError)
+
+# Categories of failures that can be fixed by changing the settings of the calculator
+FIXABLE_FAILURES = ('scf',)
+
+# Escalating adjustments of the calculator used in the subsequent retries of a fixable failure
+RETRY_ADJUSTMENTS = [{'DM.MixingWeight': 0.05, 'DM.NumberPulay': '8'},
+                     {'DM.MixingWeight': 0.02, 'DM.NumberPulay': '10', 'MaxSCFIterations': 1000}]
+
+def classify_failure(label, error, directory='.'):
+    """
+    Finds the category of a failed calculation (scf, geometry, memory, setup, socket, no_output or unknown)
+    from the SIESTA output file and the error message. A failure not recognized in the output is classified
+    as 'socket' if the error is an error of the connection with the SIESTA process of a session.
+
+    Args:
+        label (str): Label assigned to the calculator files (e.g., MoS2).
+        error (Exception): The error raised by the calculation.
+        directory (str, optional): Directory containing the SIESTA output file.
+
+    Returns:
+        str: The category of the failure.
+    """
+    try:
+        with open(Path(directory) / f'{label}.out', 'r') as file:
+            output = file.read()
+    except FileNotFoundError:
+        output = None
+
+    text = f'{output or ""}\n{error}'.lower()
+    for category, patterns in FAILURE_PATTERNS.items():
+        if any(re.search(pattern, text) for pattern in patterns):
+            return category
+    if isinstance(error, SOCKET_ERRORS):
+        return 'socket'
+    return 'no_output' if not output else 'unknown'
+
+@contextmanager
+def adjusted_calc(calc, adjustment=None):
+    """
+    Context manager changing the fdf arguments of the calculator and restoring them afterwards.
+
+    Args:
+        calc (ase.Calculator): Calculator object.
+        adjustment (dict, optional): The changed fdf arguments (e.g., {'DM.MixingWeight': 0.05}).
+    """
+    if not adjustment:
+        yield calc
+        return
+
+    original = dict(calc.parameters['fdf_arguments'])
+    calc.set(fdf_arguments={**original, **adjustment})
+    try:
+        yield calc
+    finally:
+        calc.set(fdf_arguments=original)
+
+def format_failure_stats(failures):
+    """
+    Describes the failures of a generation aggregated by finish_generation.
+
+    Args:
+        failures (dict): Number of failures and SIESTA time wasted by them for each category.
+
+    Returns:
+        str: The description (e.g., 'Failures: scf 2 (wasted 120.0 s)').
+    """
+    parts = [f'{category} {stats["count"]} (wasted {stats["siesta_time"]:.1f} s)'
+             for category, stats in sorted(failures.items())]
+    return 'Failures: ' + ', '.join(parts)
@@ -4,7 +4,6 @@ of structures in the new population.
 """
 
 import numpy as np
-from functions.sort_population import sort_population
 
 def gen_energy_file(population, out_filename):
     """
@@ -13,22 +12,18 @@ def gen_energy_file(population, out_filename):
     and the lowest energy value at the end.
 
     Args:
-        population (ase.io.Trajectory): A Trajectory object with the population.
+        population (Population): The population.
         out_filename (str): The name of the output file.
 
     Returns:
         None: The function does not return a value.
     """
-    sorted_population = sort_population(population)
-    energies = []
-    for i, structure in enumerate(sorted_population):
-        pot_energy = structure.info['pot_energy']
-        energies.append(pot_energy)
-        with open(f'{out_filename}.txt', 'a') as file:
-            file.write(f'{i+1}\t{np.round(pot_energy,4)}\n')
+    energies = np.sort(population.energies)
+    lines = [f'{i+1}\t{np.round(pot_energy,4)}\n' for i, pot_energy in enumerate(energies)]
 
     with open(f'{out_filename}.txt', 'a') as file:
+        file.writelines(lines)
         file.write('\n')
-        file.write(f'Sum: {np.round(sum(energies),4)}\n')
+        file.write(f'Sum: {np.round(np.sum(energies),4)}\n')
         file.write(f'Mean: {np.round(np.mean(energies),4)}\n')
         file.write(f'Min: {np.round(np.min(energies),4)}\n')
@@ -2,84 +2,62 @@
 The module contains a function 'gen_rand_struct' that generates a random structure.
 """
 
-from ase import Atoms, Atom
-import numpy as np
-from functions.small_functions import get_r, calc_distance, get_image_positions, get_rand_xyz
+from ase import Atoms
+from ase.data import atomic_numbers
+from functions.small_functions import (get_rand_xyz, build_cell_list, add_to_cell_list, check_collision,
+                                       get_max_collision_distance)
 from functions.prep_struct import prep_struct
 
-def gen_rand_struct(structure_file_name, size, atom_symbol, n_atoms):
+def gen_rand_struct(structure_file_name, size, atom_symbol, n_atoms, template=None):
     """
     Generates a two-layer structure with atoms randomly distributed between the layers, based on the given parameters.
+    Collisions with the atoms of the layers, the atoms already added and their periodic images are checked
+    with a cell list, so the generation scales linearly with the size of the structure.
+    The atoms between the layers are marked with tag 1 and the number of drawn positions
+    is stored in atoms.info['n_tries'].
 
     Args:
         structure_file_name (str): Name of the file containing the dichalcogenide structure.
         size (str): Size of the structure (e.g., 4x4).
         atom_symbol (str): Chemical symbol of atoms between the layers.
         n_atoms (int): Number of atoms between layers.
+        template (ase.Atoms, optional): Two-layer structure created by prep_struct - if given,
+            the structure file is not read again.
 
     Returns:
         ase.Atoms: The generated structure.
     """
-    # The output structure to which atoms will be added
-    structure = prep_struct(structure_file_name, size)
+    # The two-layer structure to which atoms will be added
+    layers = prep_struct(structure_file_name, size) if template is None else template
+    n_layer = len(layers)
+    cell = layers.get_cell()
+    atom_number = atomic_numbers[atom_symbol]
 
-    # Dimensions of the unit cell
-    cell = structure.get_cell()
-    array = cell.cellpar()
-    a = array[0] # Dimension in the x-axis direction
-    b = array[1]
-    b_y = b * np.sqrt(3) / 2 # Component b in the y direction
-    b_x = b / 2 # Component b in the x direction
+    # The output structure with all atoms between the layers added at once - the atoms are placed one by one
+    # and only the placed atoms are in the cell list, so the atoms not placed yet are never checked
+    structure = layers + Atoms(numbers=[atom_number] * n_atoms, tags=[1] * n_atoms)
 
-    # Temporary structure storing the positions of atoms between layers
-    tmp_structure = Atoms()
-    tmp_structure.set_cell(cell)
+    tol_r = 0.1 # Tolerance used when checking the distance between atoms
 
-    # Temporary 3x3 structure that stores the positions of atoms between the layers and their imagess
-    image_structure = Atoms()
-    image_structure.set_cell(cell)
-    image_structure = image_structure * [3, 3, 1]
+    # Cell list of the layers used to find the atoms close to the placed atom
+    cutoff = get_max_collision_distance(list(layers.numbers) + [atom_number], tol_r)
+    cell_list = build_cell_list(layers, cutoff)
 
-    tol_r = 0.1 # Tolerance used when checking the distance between atoms
+    n_tries = 0 # Number of drawn positions
 
-    # Adding atoms in a given number
-    for i in range(n_atoms):
+    # Placing atoms in a given number
+    for index in range(n_layer, n_layer + n_atoms):
         while True:
-            # Atom with random coordinates
+            n_tries += 1
+            # Random coordinates of the atom
             random_positions = get_rand_xyz(cell)
-            random_atom = Atom(atom_symbol, random_positions)
-
-            # Atom with random coordinates shifted by vector a and b
-            # Middle atom in a 3x3 temporary structure
-            middle_positions = random_positions + np.array([a - b_x, b_y, 0.])
-            middle_atom = Atom(atom_symbol, middle_positions)
-
-            # Positions to which atoms will be added in the temporary 3x3 structure
-            image_positions = get_image_positions(cell, random_atom)
-
-            collision_with_atom = False # Flag informing about collision with atoms from layers
-            # Checking the distance between the added atom and the atoms from the layers
-            for atom in structure:
-                d = calc_distance(random_atom, atom)
-                if d < (get_r(random_atom.number) + get_r(atom.number) + tol_r):
-                    collision_with_atom = True
-                    break
-
-            if not collision_with_atom:
-                collision_with_image_atom = False # Flag informing about collisions with atomic images
-                # Checking whether the added atom does not collide with the images
-                for atom in image_structure:
-                    d = calc_distance(middle_atom, atom)
-                    if d < (get_r(middle_atom.number) + get_r(atom.number) + tol_r):
-                        collision_with_image_atom = True
-                        break
 
-                if not collision_with_image_atom:
-                    # Adding atoms to the structure with images in all possible positions
-                    for position in image_positions:
-                        image_structure.append(Atom(atom_symbol, position))
-                    # Adding an atom that does not interfere with layers and images to the target structure
-                    structure.append(random_atom)
-                    break
+            # Placing an atom that does not interfere with layers, other atoms and their images
+            if not check_collision(structure, random_positions, atom_number, tol_r=tol_r, cell_list=cell_list):
+                structure.positions[index] = random_positions
+                add_to_cell_list(cell_list, index, random_positions)
+                break
 
+    structure.info['operator'] = 'random'
+    structure.info['n_tries'] = n_tries
     return structure
@@ -2,16 +2,22 @@
 The module contains the function gen_random_pop, which generates a population of random structures.
 """
 
-from ase import io
 from ase.io import Trajectory
 from pathlib import Path
 import os
-import numpy as np
-from functions.sort_population import sort_population
+from functions.population import Population
+from functions.prep_struct import prep_struct
 from functions.gen_rand_struct import gen_rand_struct
 from functions.gen_energy_file import gen_energy_file
+from functions.stop_criteria import budget_exhausted
+from functions.metrics import new_record, timed, finish_generation
+from functions.scheduler import run_jobs
+from functions.cost_model import fit_cost_model
+from functions.pipeline import make_jobs
 
-def gen_random_pop(pop_size, struct_filename, size, n_atoms, atom_symbol, calc, mag_moment, label, new_pop_name):
+def gen_random_pop(pop_size, struct_filename, size, n_atoms, atom_symbol, calc, mag_moment, label, new_pop_name,
+                   budget=None, relax_options=None,
+                   metrics=None, structures=None, reused=None, prefetch=0):
     """
     Generates a population of structures with atoms randomly distributed between the layers, based on the given parameters.
     As a result of the function's execution, a folder named new_pop_name is created, containing the output of the
@@ -20,6 +26,14 @@ def gen_random_pop(pop_size, struct_filename, size, n_atoms, atom_symbol, calc,
     sorted_new_pop_name.traj - stores the sorted atomic structures.
     energy_new_pop_name.txt - contains the energy values of the structures.
     Here, new_pop_name is one of the function's arguments and determines the naming convention for the generated files.
+    If the compute budget is used up, no new calculations are started and the structures relaxed so far
+    remain in new_pop_name.traj, from which the generation can be continued with continue_generation.
+    If structures are given (e.g., by enumerate_structs), they are used first and random structures are drawn
+    only after all of them have been used. The structures are relaxed in the given order (see scheduler.run_jobs).
+    The reused structures (e.g., relaxed in a previous run with the same calculator settings,
+    see seed_population) are added to the population without a new calculation.
+    The sorted population is also returned, so the next generation and the stop criteria use it
+    without reading sorted_new_pop_name.traj again.
 
     Args:
         pop_size (int): Size of the population.
@@ -31,58 +45,86 @@ def gen_random_pop(pop_size, struct_filename, size, n_atoms, atom_symbol, calc,
         mag_moment (float): Initial magnetic moment assigned to atoms between layers.
         label (str): Label assigned to the calculator files (e.g., MoS2).
         new_pop_name (str): Label of the new population.
+        budget (dict, optional): Compute budget of the run (see stop_criteria.init_budget).
+        relax_options (dict, optional): Options of the relaxation (see relax_struct).
+        metrics (dict, optional): Metrics collector of the run (see metrics.init_metrics).
+        structures (iterable, optional): Structures (ase.Atoms) relaxed before the random ones.
+        reused (list, optional): Already relaxed structures (ase.Atoms) added directly to the population.
+        prefetch (int, optional): Maximum number of the candidates created in advance in the background
+            while SIESTA is running (see pipeline.make_jobs, 0 - disabled).
 
     Returns:
-        None: The function does not return a value.
+        Population: The sorted population or None if the generation was checkpointed.
     """
 
+    gen_record = new_record(new_pop_name)
+
     folder_path = Path(f'{new_pop_name}')
     folder_path.mkdir(parents=True, exist_ok=True)
     original_directory = os.getcwd()
     os.chdir(folder_path)
 
+    # Two-layer structure to which the atoms between the layers are added
+    template = prep_struct(f'{original_directory}/{struct_filename}', size)
+
     # Creating .traj file for new population
     new_pop = Trajectory(f'{new_pop_name}.traj', 'w')
 
-    # Creating the individuals by drawing new structures
+    # Adding the structures that do not have to be relaxed again
+    relaxed = list((reused or [])[:pop_size])
+    for struct in relaxed:
+        new_pop.write(struct)
+
+    structures = iter(structures) if structures is not None else iter(())
+
+    def make_struct():
+        # Takes the next given structure or draws a new one
+        tmp_struct = next(structures, None)
+        if tmp_struct is None:
+            tmp_struct = gen_rand_struct(f'{original_directory}/{struct_filename}', size, atom_symbol, n_atoms,
+                                         template)
+        return tmp_struct
+
+    # Creating the individuals from the given structures or by drawing new structures
+    # - the missing individuals are created again if some relaxations fail
     candidates_counter = 0
-    while len(new_pop) < pop_size:
-        candidates_counter += 1
-        tmp_struct = gen_rand_struct(f'{original_directory}/{struct_filename}', size, atom_symbol, n_atoms)
-        moments = [0] * (len(tmp_struct) - n_atoms) + [mag_moment] * n_atoms
-        tmp_struct.set_initial_magnetic_moments(moments)
-        tmp_folder_path = Path(f'cand{candidates_counter}')
-        tmp_folder_path.mkdir(parents=True, exist_ok=True)
-        os.chdir(tmp_folder_path)
-        try:
-            tmp_struct.calc = calc
-            pot_energy = tmp_struct.get_potential_energy()
-            relaxed_struct = io.read(f'{label}.XV')
-            relaxed_struct.pbc = [True, True, False]
-            relaxed_struct.info['pot_energy'] = np.round(pot_energy, 4)
-            io.write(f'relaxed_cand{candidates_counter}.xyz', relaxed_struct)
-            new_pop.write(relaxed_struct)
-            print(f'Successfully relaxed cand{candidates_counter}.')
-            with open(f'../log_{new_pop_name}.txt', 'a') as f:
-                f.write(f'Successfully relaxed cand{candidates_counter}.\n')
-        except Exception as e:
-            print(f'Failed to relax cand{candidates_counter}. Error: {e}')
-            with open(f'../log_{new_pop_name}.txt', 'a') as f:
-                f.write(f'Failed to relax cand{candidates_counter}. Error: {e}\n')
-
-        os.chdir(original_directory / folder_path)
-
-    tmp_pop = sort_population(Trajectory(f'{new_pop_name}.traj', 'r'))
-    # Saving the energy of structures in the new population to a file
-    gen_energy_file(tmp_pop, f'../energy_{new_pop_name}')
-
-    os.chdir(original_directory)
-
-    # Saving the new population to the .traj file in order from the lowest to the highest energy
-    out_pop = Trajectory(f'sorted_{new_pop_name}.traj', 'w')
-    for structure in tmp_pop:
-        out_pop.write(structure)
+    # Cost model of the wall times fitted once for the whole generation
+    model = fit_cost_model(metrics['filename']) if metrics is not None else None
+    while len(relaxed) < pop_size and not budget_exhausted(budget):
+        specs = []
+        for _ in range(pop_size - len(relaxed)):
+            candidates_counter += 1
+            specs.append((f'cand{candidates_counter}', ()))
+        with make_jobs(new_pop_name, specs, make_struct, calc, metrics, prefetch) as jobs:
+            relaxed += run_jobs(jobs, new_pop, n_atoms, mag_moment, calc, label, new_pop_name, budget, relax_options,
+                                metrics, model)
+
+    # If the compute budget is exhausted, the unfinished generation is left in the new_pop_name.traj file
+    if len(relaxed) < pop_size:
+        new_pop.close()
+        os.chdir(original_directory)
+        print(f'Compute budget exhausted - the {new_pop_name} has been checkpointed.')
+        with open(f'{folder_path}/log_{new_pop_name}.txt', 'a') as f:
+            f.write(f'Compute budget exhausted - the {new_pop_name} has been checkpointed.\n')
+        finish_generation(metrics, gen_record, f'{folder_path}/log_{new_pop_name}.txt')
+        return None
+
+    new_pop.close()
+    with timed(metrics, gen_record, 'selection'):
+        # The population built from the structures kept in memory, without reading new_pop_name.traj
+        tmp_pop = Population.from_atoms(relaxed).sorted()
+    with timed(metrics, gen_record, 'io'):
+        # Saving the energy of structures in the new population to a file
+        gen_energy_file(tmp_pop, f'../energy_{new_pop_name}')
+
+        os.chdir(original_directory)
+
+        # Saving the new population to the .traj file in order from the lowest to the highest energy
+        tmp_pop.write(f'sorted_{new_pop_name}.traj')
+    finish_generation(metrics, gen_record, f'{folder_path}/log_{new_pop_name}.txt')
 
     print(f'The {new_pop_name} is complete!')
     with open(f'{folder_path}/log_{new_pop_name}.txt', 'a') as f:
         f.write(f'The {new_pop_name} is complete!\n')
+
+    return tmp_pop
@@ -0,0 +1,176 @@
+"""
+The module contains functions 'init_metrics', 'new_record', 'timed', 'finish_candidate', 'finish_generation',
+'write_record' and 'print_profile' - functions measuring the time spent in the stages of the algorithm
+and writing it to a JSON-lines metrics file.
+"""
+
+import os
+import json
+import time
+from contextlib import contextmanager
+from functions.failures import format_failure_stats
+from functions.validation import format_rejection_stats
+
+def init_metrics(filename='metrics.jsonl', profile_hook=None):
+    """
+    Creates the metrics collector of the run.
+
+    Args:
+        filename (str): Name of the JSON-lines metrics file.
+        profile_hook (callable, optional): Function called after each timed stage with the arguments
+            (stage, elapsed_time, record).
+
+    Returns:
+        dict: The dictionary describing the metrics collector.
+    """
+    metrics = {'filename': os.path.abspath(filename),
+               'profile_hook': profile_hook,
+               'candidates': []}
+    return metrics
+
+def new_record(pop_name, name=None):
+    """
+    Creates a record with the metrics of a single candidate or, if name is None, of a whole generation.
+
+    Args:
+        pop_name (str): Label of the population.
+        name (str, optional): Name of the candidate (e.g., cand1).
+
+    Returns:
+        dict: The record.
+    """
+    record = {'type': 'generation' if name is None else 'candidate',
+              'pop': pop_name,
+              'name': name,
+              'times': {},
+              'start': time.time()}
+    return record
+
+@contextmanager
+def timed(metrics, record, stage):
+    """
+    Context manager measuring the time of a stage and adding it to the record.
+
+    Args:
+        metrics (dict): The metrics collector created by init_metrics or None.
+        record (dict): The record created by new_record.
+        stage (str): Name of the stage (e.g., generation, siesta, io, selection).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        record['times'][stage] = record['times'].get(stage, 0.) + elapsed
+        if metrics is not None and metrics['profile_hook'] is not None:
+            metrics['profile_hook'](stage, elapsed, record)
+
+def finish_candidate(metrics, record, success):
+    """
+    Closes the record of a candidate and appends it to the metrics file.
+
+    Args:
+        metrics (dict): The metrics collector created by init_metrics or None.
+        record (dict): The record of the candidate.
+        success (bool): Whether the relaxation of the candidate succeeded.
+
+    Returns:
+        None: The function does not return a value.
+    """
+    if metrics is None:
+        return
+    record['success'] = bool(success)
+    record['wall_time'] = time.time() - record['start']
+    metrics['candidates'].append(record)
+    write_record(metrics, record)
+
+def finish_generation(metrics, record, log_filename=None):
+    """
+    Aggregates the records of the candidates of the generation, closes the record of the generation
+    and appends it to the metrics file. The time not covered by the SIESTA calculations is reported
+    as the Python-side overhead. The failed calculations are counted for each category together
+    with the SIESTA time wasted by them, and, if any failure occurred, described in the log file.
+    The structures rejected by the validation before the calculation are counted for each operator
+    and described in the log file in the same way.
+
+    Args:
+        metrics (dict): The metrics collector created by init_metrics or None.
+        record (dict): The record of the generation.
+        log_filename (str, optional): Name of the log file of the generation.
+
+    Returns:
+        None: The function does not return a value.
+    """
+    if metrics is None:
+        return
+    candidates = metrics['candidates']
+    stage_times = dict(record['times'])
+    for candidate in candidates:
+        for stage, elapsed in candidate['times'].items():
+            stage_times[stage] = stage_times.get(stage, 0.) + elapsed
+
+    record['times'] = stage_times
+    record['wall_time'] = time.time() - record['start']
+    record['n_candidates'] = len(candidates)
+    record['n_success'] = sum(candidate['success'] for candidate in candidates)
+    record['tries'] = sum(candidate.get('tries', 0) for candidate in candidates)
+    record['scf_iterations'] = sum(candidate.get('scf_iterations', 0) for candidate in candidates)
+    record['cg_steps'] = sum(candidate.get('cg_steps', 0) for candidate in candidates)
+    record['python_overhead'] = record['wall_time'] - stage_times.get('siesta', 0.)
+
+    failures = {}
+    for candidate in candidates:
+        for failure in candidate.get('failures', []):
+            stats = failures.setdefault(failure['category'], {'count': 0, 'siesta_time': 0.})
+            stats['count'] += 1
+            stats['siesta_time'] += failure['siesta_time']
+    record['failures'] = failures
+    if failures and log_filename is not None:
+        with open(log_filename, 'a') as f:
+            f.write(f'{format_failure_stats(failures)}\n')
+
+    rejections = {}
+    for candidate in candidates:
+        for operator, count in candidate.get('rejections', {}).items():
+            rejections[operator] = rejections.get(operator, 0) + count
+    record['rejections'] = rejections
+    if rejections and log_filename is not None:
+        with open(log_filename, 'a') as f:
+            f.write(f'{format_rejection_stats(rejections)}\n')
+
+    write_record(metrics, record)
+    metrics['candidates'] = []
+
+def write_record(metrics, record):
+    """
+    Appends the record to the metrics file as a single line. The line is written with one system call
+    on a file opened in append mode, so concurrent writers never interleave partial records.
+
+    Args:
+        metrics (dict): The metrics collector created by init_metrics.
+        record (dict): The record.
+
+    Returns:
+        None: The function does not return a value.
+    """
+    line = (json.dumps(record, default=float) + '\n').encode()
+    fd = os.open(metrics['filename'], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+def print_profile(stage, elapsed, record):
+    """
+    Profiling hook printing the duration of each stage.
+
+    Args:
+        stage (str): Name of the stage.
+        elapsed (float): Duration of the stage in seconds.
+        record (dict): The record to which the stage belongs.
+
+    Returns:
+        None: The function does not return a value.
+    """
+    name = record['name'] if record['name'] is not None else ''
+    print(f'[profile] {record["pop"]} {name} {stage}: {elapsed:.3f} s')
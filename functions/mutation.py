@@ -1,16 +1,89 @@
 """
-The module contains a function 'mutation' that performs mutation operation.
+The module contains a function 'mutation' that performs mutation operation, a function 'check_mutation_kinds'
+that checks the kinds of mutation drawn in the run and the functions 'mutate_random', 'mutate_displace',
+'mutate_hop' and 'mutate_shift' implementing its kinds.
 """
 
-from ase import Atoms, Atom
-import math
+from ase import Atom
+from ase.data import atomic_numbers
 import random
 import numpy as np
-from functions.small_functions import get_r, calc_distance, get_rand_xyz, get_image_positions
+from ase.geometry import get_distances, wrap_positions
+from functions.small_functions import (get_rand_xyz, get_interlayer_indexes, check_collision, build_cell_list,
+                                       get_max_collision_distance, get_parent_distance)
 
-def mutation(atoms):
+MUTATION_KINDS = ('random', 'displace', 'hop', 'shift')
+
+def mutation(atoms, kind='random', step=0.5, max_tries=100, sites=None):
+    """
+    Performs mutation of the given structure. Apart from the 'random' kind, which moves one atom between
+    the layers to a completely random position, the local kinds keep the structure close to the relaxed parent:
+    'displace' - small in-plane displacement of one atom,
+    'hop' - jump of one atom to a neighbouring high-symmetry site,
+    'shift' - collective in-plane shift of all atoms between the layers.
+    If a local move without collisions cannot be found, the 'random' kind is used.
+    The kind that was actually used is stored in atoms.info['mutation_kind'], the name of the parent
+    in atoms.info['parents'], its distance from the parent in atoms.info['parent_distance']
+    and the number of attempts in atoms.info['n_tries'].
+
+    Args:
+        atoms (ase.Atoms): Structure to be mutated.
+        kind (str): Kind of the mutation (one of MUTATION_KINDS).
+        step (float): Maximum length of the displacement in the 'displace' and 'shift' kinds.
+        max_tries (int): Number of attempts to find a local move without collisions.
+        sites (np.array, optional): The high-symmetry sites between the layers used by the 'hop' kind, computed
+            once from the unrelaxed template (see small_functions.get_interlayer_sites).
+
+    Returns:
+        ase.Atoms: The structure created by mutation.
+    """
+    if kind not in MUTATION_KINDS:
+        raise ValueError(f'Unknown mutation kind: {kind}')
+    if kind == 'hop' and sites is None:
+        raise ValueError('The hop mutation requires the sites of the template.')
+
+    structure, local_tries = None, 0
+    if kind == 'displace':
+        structure, local_tries = mutate_displace(atoms, step, max_tries)
+    elif kind == 'hop':
+        structure, local_tries = mutate_hop(atoms, sites, max_tries)
+    elif kind == 'shift':
+        structure, local_tries = mutate_shift(atoms, step, max_tries)
+
+    if structure is None:
+        # The attempts of the failed local kind are added to the attempts of the random one
+        kind = 'random'
+        structure = mutate_random(atoms)
+        structure.info['n_tries'] += local_tries
+    else:
+        structure.info['n_tries'] = local_tries
+
+    structure.info['operator'] = 'mutation'
+    structure.info['mutation_kind'] = kind
+    structure.info['parents'] = atoms.info.get('name', '')
+    structure.info['parent_distance'] = get_parent_distance(structure.positions[get_interlayer_indexes(structure)],
+                                                            [atoms.positions[get_interlayer_indexes(atoms)]],
+                                                            structure.cell, structure.pbc)
+    return structure
+
+def check_mutation_kinds(kinds):
+    """
+    Checks the kinds of mutation drawn in the run.
+
+    Args:
+        kinds (list): Kinds of mutation (see MUTATION_KINDS).
+
+    Returns:
+        None: The function does not return a value.
+    """
+    for kind in kinds:
+        if kind not in MUTATION_KINDS:
+            raise ValueError(f'Unknown mutation kind: {kind}')
+
+def mutate_random(atoms):
     """
-    Performs mutation of the given structure by changing the position of one atom between the layers.
+    Performs mutation of the given structure by changing the position of one atom between the layers
+    to a random position.
 
     Args:
         atoms (ase.Atoms): Structure to be mutated.
@@ -20,80 +93,138 @@ def mutation(atoms):
     """
     # An output structure that is a copy of the one given as an argument to the function
     structure = atoms.copy()
-    # Symbol of the atom located between the layers
-    atom_symbol = structure[len(structure)-1].symbol
-
-    # Dimensions of the unit cell
     cell = structure.get_cell()
-    array = structure.cell.cellpar()
-    a = array[0] # Dimension in the x-axis direction
-    b = array[1]
-    b_y = b * np.sqrt(3) / 2  # Component b in the y direction
-    b_x = b / 2  # Component b in the x direction
-    c = array[2] # Dimension in the z-axis direction
-    c_half = c / 2 # Half the height of the cell
-
-    atom_indexes = [] #  List with indexes of atoms lying between layers
 
-    # Adding indexes of atoms lying between layers to the list of atom_indexes
-    for atom in structure:
-        if math.isclose(atom.position[2], c_half, abs_tol=1E-1):
-            atom_indexes.append(atom.index)
+    # Indexes of atoms lying between layers
+    atom_indexes = get_interlayer_indexes(structure)
 
     index_to_del = random.choice(atom_indexes) # Randomly selected atom index to be removed
+    atom_symbol = structure[index_to_del].symbol # Symbol of the removed atom
     del structure[index_to_del] # Removing an atom from the structure
-    atom_indexes.remove(index_to_del) # Removing the index of the removed atom from the list
-
-    # Temporary structure storing the positions of atoms between layers
-    # needed to create the image_structures object
-    tmp_structure = Atoms()
-    tmp_structure.set_cell(cell)
-    for atom in structure:
-        if math.isclose(atom.position[2], c_half, abs_tol=1E-1):
-            tmp_structure.append(atom)
 
     tol_r = 0.1 # Tolerance used when checking the distance between atoms
 
-    # Temporary 3x3 structure that stores the positions of atoms between the layers and their images
-    image_structure = Atoms()
-    image_structure.set_cell(cell)
-    image_structure = image_structure * [3, 3, 1]
+    # Cell list of the structure used to find the atoms close to the added atom
+    atom_number = atomic_numbers[atom_symbol]
+    cutoff = get_max_collision_distance(list(structure.numbers) + [atom_number], tol_r)
+    cell_list = build_cell_list(structure, cutoff)
 
-    # Adding atoms to image positions based on the tmp_structures object
-    for atom in tmp_structure:
-        image_positions = get_image_positions(cell, atom)
+    n_tries = 0 # Number of drawn positions
+    while True:
+        n_tries += 1
+        random_positions = get_rand_xyz(cell)
+        # If there was no collision with atoms and their images - add an atom to the target structure
+        if not check_collision(structure, random_positions, atom_number, tol_r=tol_r, cell_list=cell_list):
+            structure.append(Atom(atom_symbol, random_positions, tag=1))
+            break
 
-        for position in image_positions:
-            image_structure.append(Atom(atom_symbol, position))
+    structure.info['n_tries'] = n_tries
+    return structure
 
-    # Flag informing whether it was possible to select an atom position that does not collide
-    # with the atomic images and atoms from layers in the target structure
-    should_continue = True
+def mutate_displace(atoms, step, max_tries):
+    """
+    Performs mutation of the given structure by a small in-plane displacement of one atom between the layers.
 
-    while should_continue:
-        collision_with_image = False # Flag informing about collisions with atomic images
-        random_positions = get_rand_xyz(cell)
-        random_atom = Atom(atom_symbol, random_positions) # Atom with new, random coordinates
-        middle_positions = random_positions + np.array([a - b_x, b_y, 0.])
-        middle_atom = Atom(atom_symbol, middle_positions) # Atom with random coordinates moved to the center of image_structure
-
-        for atom in image_structure: # Checking the distance between middle_atom and images
-            d = calc_distance(middle_atom, atom)
-            if d < (get_r(random_atom.number) + get_r(atom.number) + tol_r):
-                    collision_with_image = True
-                    break
-
-        if not collision_with_image:
-            collision_with_structure = False # Flag informing about a collision with atoms in the target structure
-            for atom in structure: # Checking the distance between random_atom and atoms in the target structure
-                d = calc_distance(random_atom, atom)
-                if d < (get_r(random_atom.number) + get_r(atom.number) + tol_r):
-                    collision_with_structure = True
-                    break
-
-            # If there was no collision - add an atom to the target structure
-            if not collision_with_structure:
-                structure.append(random_atom)
-                should_continue = False
+    Args:
+        atoms (ase.Atoms): Structure to be mutated.
+        step (float): Maximum length of the displacement.
+        max_tries (int): Number of attempts to find a displacement without collisions.
 
-    return structure
+    Returns:
+        tuple: The structure created by mutation (or None if no move was found) and the number of attempts.
+    """
+    structure = atoms.copy()
+    atom_indexes = get_interlayer_indexes(structure)
+
+    for n_tries in range(1, max_tries + 1):
+        index = random.choice(atom_indexes)
+        angle = random.uniform(0, 2 * np.pi)
+        length = random.uniform(0, step)
+        new_position = structure.positions[index] + length * np.array([np.cos(angle), np.sin(angle), 0.])
+        new_position = wrap_positions([new_position], structure.cell, structure.pbc)[0]
+        if not check_collision(structure, new_position, structure.numbers[index], skip=[index]):
+            structure.positions[index] = new_position
+            return structure, n_tries
+
+    return None, max_tries
+
+def mutate_hop(atoms, sites, max_tries):
+    """
+    Performs mutation of the given structure by moving one atom between the layers
+    to one of the neighbouring high-symmetry sites. The sites are not computed from the mutated structure,
+    as the in-plane displacements of the relaxed layers break the construction of the hollow sites.
+
+    Args:
+        atoms (ase.Atoms): Structure to be mutated.
+        sites (np.array): The high-symmetry sites between the layers of the unrelaxed template.
+        max_tries (int): Number of attempts to find a site without collisions.
+
+    Returns:
+        tuple: The structure created by mutation (or None if no move was found) and the number of attempts.
+    """
+    structure = atoms.copy()
+    atom_indexes = get_interlayer_indexes(structure)
+    _, site_d = get_distances_to(sites[0], sites, structure)
+    d_nn = np.min(site_d[site_d > 1E-1]) # Distance between the neighbouring sites
+
+    for n_tries in range(1, max_tries + 1):
+        index = random.choice(atom_indexes)
+        _, d = get_distances_to(structure.positions[index], sites, structure)
+        # Sites around the nearest one, without the site currently occupied by the atom
+        neighbours = np.nonzero((d < np.min(d) + 1.1 * d_nn) & (d > np.min(d) + 1E-1))[0]
+        if len(neighbours) == 0:
+            continue
+        new_position = sites[random.choice(neighbours)]
+        if not check_collision(structure, new_position, structure.numbers[index], skip=[index]):
+            structure.positions[index] = new_position
+            return structure, n_tries
+
+    return None, max_tries
+
+def mutate_shift(atoms, step, max_tries):
+    """
+    Performs mutation of the given structure by shifting all atoms between the layers
+    by the same small in-plane vector.
+
+    Args:
+        atoms (ase.Atoms): Structure to be mutated.
+        step (float): Maximum length of the shift.
+        max_tries (int): Number of attempts to find a shift without collisions.
+
+    Returns:
+        tuple: The structure created by mutation (or None if no move was found) and the number of attempts.
+    """
+    structure = atoms.copy()
+    atom_indexes = get_interlayer_indexes(structure)
+
+    # The atoms between the layers keep their mutual distances, so they are checked only against the layers
+    for n_tries in range(1, max_tries + 1):
+        angle = random.uniform(0, 2 * np.pi)
+        length = random.uniform(0, step)
+        shift = length * np.array([np.cos(angle), np.sin(angle), 0.])
+        new_positions = wrap_positions(structure.positions[atom_indexes] + shift, structure.cell, structure.pbc)
+        collision = False
+        for index, new_position in zip(atom_indexes, new_positions):
+            if check_collision(structure, new_position, structure.numbers[index], skip=atom_indexes):
+                collision = True
+                break
+        if not collision:
+            structure.positions[atom_indexes] = new_positions
+            return structure, n_tries
+
+    return None, max_tries
+
+def get_distances_to(position, positions, structure):
+    """
+    Returns the vectors and distances (minimum image convention) from the given position to the positions.
+
+    Args:
+        position (np.array): The xyz coordinates of the reference point.
+        positions (np.array): The xyz coordinates of the points.
+        structure (ase.Atoms): The structure defining the cell and periodic boundary conditions.
+
+    Returns:
+        tuple: The vectors and distances to the positions.
+    """
+    vectors, d = get_distances(position, positions, cell=structure.cell, pbc=structure.pbc)
+    return vectors[0], d[0]
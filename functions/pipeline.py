@@ -0,0 +1,154 @@
+"""
+The module contains a class 'JobPipeline' that creates the candidates of a generation in a background thread,
+so that the next structures are ready when the relaxation of the previous one ends (see scheduler.run_jobs),
+and a context manager 'make_jobs' that creates the jobs with or without it.
+"""
+
+import queue
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from functions.scheduler import make_job
+
+class JobPipeline:
+    """
+    Creates the jobs (see scheduler.make_job) in a background thread and keeps at most buffer_size ready jobs
+    in a bounded buffer, so the structures are created and validated while SIESTA relaxes the previous
+    candidates. The working directories of the ready jobs are created in advance and removed by discard
+    (or by close for the jobs not taken from the buffer) if the jobs are not relaxed, so that no empty folders
+    are left and the numbering of the candidates continued by continue_generation has no gaps.
+    The make_struct function is called only by the background thread and must not depend on the current
+    working directory. An error raised while creating a job is raised again by take.
+
+    Attributes:
+        n_jobs (int): Number of the jobs (the (name, args) pairs of specs, e.g. ('child1', ('child',))).
+        n_taken (int): Number of the jobs taken from the buffer.
+        directory (pathlib.Path): Directory in which the working directories of the candidates are created.
+        buffer (queue.Queue): The bounded buffer of ready jobs.
+        stopped (threading.Event): Event stopping the background thread.
+        thread (threading.Thread): The background thread.
+    """
+
+    def __init__(self, pop_name, specs, make_struct, calc, metrics=None, buffer_size=2, directory='.'):
+        self.n_jobs = len(specs)
+        self.n_taken = 0
+        self.directory = Path(directory).resolve()
+        self.buffer = queue.Queue(maxsize=max(1, buffer_size))
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._produce, args=(pop_name, specs, make_struct, calc, metrics),
+                                       daemon=True)
+        self.thread.start()
+
+    def __len__(self):
+        return self.n_jobs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _produce(self, pop_name, specs, make_struct, calc, metrics):
+        # Creating the jobs one by one - the thread waits while the buffer is full
+        for name, args in specs:
+            try:
+                job = make_job(pop_name, name, make_struct, calc, metrics, *args)
+                (self.directory / name).mkdir(parents=True, exist_ok=True)
+            except Exception as e:
+                # The error is raised again in the thread taking the jobs
+                job = e
+            while not self.stopped.is_set():
+                try:
+                    self.buffer.put(job, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            else:
+                # The job created while the pipeline was being stopped is not used
+                if not isinstance(job, Exception):
+                    self.discard([job])
+                return
+            if isinstance(job, Exception):
+                return
+
+    def take(self, block=True):
+        """
+        Takes all ready jobs from the buffer.
+
+        Args:
+            block (bool): Whether to wait for a job if none is ready (and not all jobs have been taken).
+
+        Returns:
+            list: The ready jobs (empty if no job is ready or all jobs have been taken).
+        """
+        jobs = []
+        while self.n_taken < self.n_jobs:
+            try:
+                job = self.buffer.get(block=block and not jobs)
+            except queue.Empty:
+                break
+            if isinstance(job, Exception):
+                self.close()
+                raise job
+            jobs.append(job)
+            self.n_taken += 1
+        return jobs
+
+    def discard(self, jobs):
+        """
+        Removes the working directories created in advance for the jobs that will not be relaxed.
+        Directories that are not empty are left.
+
+        Args:
+            jobs (list): The unused jobs.
+
+        Returns:
+            None: The function does not return a value.
+        """
+        for job in jobs:
+            try:
+                (self.directory / job['name']).rmdir()
+            except OSError:
+                pass
+
+    def close(self):
+        """
+        Stops the background thread. The jobs not taken from the buffer are discarded.
+        """
+        self.stopped.set()
+        self.thread.join()
+        unused = []
+        while True:
+            try:
+                job = self.buffer.get_nowait()
+            except queue.Empty:
+                break
+            if not isinstance(job, Exception):
+                unused.append(job)
+        self.discard(unused)
+
+@contextmanager
+def make_jobs(pop_name, specs, make_struct, calc, metrics=None, prefetch=0):
+    """
+    Context manager creating the jobs of the candidates passed to scheduler.run_jobs. With prefetch = 0 all
+    structures are created before the first relaxation, otherwise they are created in the background
+    by JobPipeline with at most prefetch ready jobs, which is stopped when the context is left (the folders
+    of the jobs left in its buffer are then removed).
+
+    Args:
+        pop_name (str): Label of the population.
+        specs (list): The (name, args) pairs of the candidates, e.g. ('child1', ('child',)).
+        make_struct (callable): Function creating the structure, called with the arguments args.
+        calc (ase.Calculator): Calculator object.
+        metrics (dict, optional): Metrics collector of the run (see metrics.init_metrics).
+        prefetch (int): Maximum number of the jobs created in advance (0 - no background creation).
+    """
+    if prefetch <= 0:
+        yield [make_job(pop_name, name, make_struct, calc, metrics, *args) for name, args in specs]
+        return
+
+    pipeline = JobPipeline(pop_name, specs, make_struct, calc, metrics, prefetch)
+    try:
+        yield pipeline
+    finally:
+        pipeline.close()
@@ -0,0 +1,200 @@
+"""
+The module contains a class 'Population' that stores a population of structures in NumPy arrays.
+"""
+
+import numpy as np
+from ase import Atoms
+from ase.io import Trajectory
+from functions.small_functions import get_interlayer_indexes
+
+LAYER_TAG = 0 # Tag of the atoms from the layers
+INTERCALANT_TAG = 1 # Tag of the atoms between the layers
+
+class Population:
+    """
+    Population of structures built on the same two-layer template. The positions, atomic numbers
+    and energies of all structures are stored in contiguous NumPy arrays. The atoms between the layers
+    always form the last block of atoms, so their positions are available as a view of the positions array.
+    The lineage of each structure is stored as its name (e.g., pop1/child2), the names of its parents
+    and the operator that created it.
+
+    Attributes:
+        positions (np.array): Positions of atoms, shape (n_structures, n_atoms, 3).
+        numbers (np.array): Atomic numbers, shape (n_structures, n_atoms).
+        energies (np.array): Potential energies of the structures.
+        tags (np.array): Role of each atom - LAYER_TAG or INTERCALANT_TAG (common for all structures).
+        names (np.array): Names of the structures.
+        parents (np.array): Comma-separated names of the parents of the structures.
+        operators (np.array): Operators that created the structures (random, enumeration, seed, crossover, mutation).
+        cell (ase.Cell): The cell common for all structures.
+        pbc (np.array): Periodic boundary conditions.
+        infos (list): The remaining information from atoms.info of each structure.
+    """
+    LINEAGE_KEYS = ('pot_energy', 'name', 'parents', 'operator')
+
+    def __init__(self, positions, numbers, energies, tags, names, parents, operators, cell, pbc, infos):
+        self.positions = positions
+        self.numbers = numbers
+        self.energies = energies
+        self.tags = tags
+        self.names = names
+        self.parents = parents
+        self.operators = operators
+        self.cell = cell
+        self.pbc = pbc
+        self.infos = infos
+        self.n_layer = int(np.count_nonzero(tags == LAYER_TAG))
+        if np.any(tags[:self.n_layer] != LAYER_TAG):
+            raise ValueError('The atoms between the layers must be the last atoms of the structures.')
+
+    @classmethod
+    def from_atoms(cls, structures):
+        """
+        Creates a population from a list of structures.
+
+        Args:
+            structures (list): List of ase.Atoms objects with the same number of atoms.
+
+        Returns:
+            Population: The created population.
+        """
+        structures = list(structures)
+        if len(structures) == 0:
+            raise ValueError('Cannot create an empty population.')
+
+        first = structures[0]
+        tags = first.get_tags()
+        # Structures written before the tags were introduced - atoms between the layers found by their height
+        if not np.any(tags == INTERCALANT_TAG):
+            tags = np.full(len(first), LAYER_TAG)
+            tags[get_interlayer_indexes(first)] = INTERCALANT_TAG
+
+        infos = [{key: value for key, value in s.info.items() if key not in cls.LINEAGE_KEYS} for s in structures]
+        return cls(positions=np.array([s.positions for s in structures]),
+                   numbers=np.array([s.numbers for s in structures]),
+                   energies=np.array([s.info.get('pot_energy', np.nan) for s in structures], dtype=float),
+                   tags=np.asarray(tags),
+                   names=np.array([s.info.get('name', '') for s in structures], dtype=str),
+                   parents=np.array([s.info.get('parents', '') for s in structures], dtype=str),
+                   operators=np.array([s.info.get('operator', '') for s in structures], dtype=str),
+                   cell=first.get_cell(),
+                   pbc=first.pbc.copy(),
+                   infos=infos)
+
+    @classmethod
+    def from_traj(cls, filename):
+        """
+        Loads a population from a .traj file.
+
+        Args:
+            filename (str): Name of the .traj file.
+
+        Returns:
+            Population: The loaded population.
+        """
+        return cls.from_atoms(Trajectory(filename, 'r'))
+
+    def __len__(self):
+        return len(self.energies)
+
+    def __getitem__(self, key):
+        """
+        Returns a sub-population. Slices return views of the arrays, index arrays return copies.
+        """
+        if isinstance(key, (int, np.integer)):
+            key = [key]
+        if not isinstance(key, slice):
+            key = np.asarray(key)
+        return Population(self.positions[key], self.numbers[key], self.energies[key], self.tags,
+                          self.names[key], self.parents[key], self.operators[key], self.cell, self.pbc,
+                          list(np.array(self.infos, dtype=object)[key]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.to_atoms(i)
+
+    @property
+    def intercalant_positions(self):
+        """
+        np.array: View of the positions of atoms between the layers, shape (n_structures, n_intercalants, 3).
+        """
+        return self.positions[:, self.n_layer:]
+
+    @property
+    def intercalant_numbers(self):
+        """
+        np.array: View of the atomic numbers of atoms between the layers, shape (n_structures, n_intercalants).
+        """
+        return self.numbers[:, self.n_layer:]
+
+    @property
+    def intercalant_indexes(self):
+        """
+        range: Indexes of atoms between the layers (common for all structures).
+        """
+        return range(self.n_layer, self.positions.shape[1])
+
+    def sorted(self):
+        """
+        Returns the population sorted from the lowest to the highest energy.
+
+        Returns:
+            Population: The sorted population.
+        """
+        return self[np.argsort(self.energies, kind='stable')]
+
+    def to_atoms(self, i, copy=True):
+        """
+        Creates an ase.Atoms object of the i-th structure.
+
+        Args:
+            i (int): Index of the structure.
+            copy (bool): Whether the arrays of the structure are copied. Without the copy, the positions,
+                atomic numbers and tags are views of the population arrays, so the structure can be written
+                or used as a read-only parent (e.g., by mutation, which modifies its own copy) without
+                copying the arrays, but must not be modified.
+
+        Returns:
+            ase.Atoms: The structure.
+        """
+        if copy:
+            structure = Atoms(numbers=self.numbers[i], positions=self.positions[i], cell=self.cell,
+                              pbc=self.pbc, tags=self.tags)
+        else:
+            structure = Atoms(cell=self.cell, pbc=self.pbc)
+            structure.arrays['numbers'] = self.numbers[i]
+            structure.arrays['positions'] = self.positions[i]
+            structure.arrays['tags'] = self.tags
+        structure.info.update(self.infos[i])
+        structure.info['pot_energy'] = self.energies[i]
+        structure.info['name'] = str(self.names[i])
+        structure.info['parents'] = str(self.parents[i])
+        structure.info['operator'] = str(self.operators[i])
+        return structure
+
+    def write(self, filename):
+        """
+        Writes the population to a .traj file.
+
+        Args:
+            filename (str): Name of the .traj file.
+
+        Returns:
+            None: The function does not return a value.
+        """
+        with Trajectory(filename, 'w') as out_pop:
+            self.write_to(out_pop)
+
+    def write_to(self, trajectory, indexes=None):
+        """
+        Writes the structures to an open trajectory directly from the arrays of the population.
+
+        Args:
+            trajectory (ase.io.Trajectory): The trajectory opened for writing.
+            indexes (iterable, optional): Indexes of the written structures (all by default).
+
+        Returns:
+            None: The function does not return a value.
+        """
+        for i in (range(len(self)) if indexes is None else indexes):
+            trajectory.write(self.to_atoms(i, copy=False))
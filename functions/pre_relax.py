@@ -0,0 +1,105 @@
+"""
+The module contains a function 'pre_relax' that performs a cheap classical pre-relaxation of the atoms between
+the layers and the calculator 'PairPotential' used for it.
+"""
+
+import itertools
+import numpy as np
+from ase.calculators.calculator import Calculator, all_changes
+from ase.constraints import FixAtoms, FixCartesian
+from ase.data import covalent_radii
+from ase.optimize import BFGS, FIRE
+from functions.small_functions import get_interlayer_indexes
+
+OPTIMIZERS = {'FIRE': FIRE, 'BFGS': BFGS}
+
+class PairPotential(Calculator):
+    """
+    Lennard-Jones-like pair potential with the equilibrium distance of each pair equal to the sum
+    of the covalent radii of the atoms: E = epsilon * ((r0/r)^12 - 2 * (r0/r)^6).
+    Only the pairs including an atom between the layers are computed - the pairs of atoms of the layers,
+    which are fixed during the pre-relaxation, add a constant to the energy and are left out.
+    """
+    implemented_properties = ['energy', 'forces']
+    default_parameters = {'epsilon': 0.1, 'cutoff': 6.0}
+
+    def calculate(self, atoms=None, properties=['energy'], system_changes=all_changes):
+        Calculator.calculate(self, atoms, properties, system_changes)
+        epsilon = self.parameters.epsilon
+
+        cutoff = self.parameters.cutoff
+        numbers = self.atoms.numbers
+        positions = self.atoms.positions
+        cell = self.atoms.cell
+        atom_indexes = np.array(get_interlayer_indexes(self.atoms), dtype=int)
+
+        # Periodic images within the cutoff - the number of images along each periodic direction is set
+        # from the distance between the opposite faces of the cell
+        heights = cell.volume / np.linalg.norm(np.cross(cell[[1, 2, 0]], cell[[2, 0, 1]]), axis=1)
+        ranges = [range(-int(np.ceil(cutoff / height)), int(np.ceil(cutoff / height)) + 1) if periodic else (0,)
+                  for height, periodic in zip(heights, self.atoms.pbc)]
+        shifts = np.array(list(itertools.product(*ranges))) @ cell
+
+        # Vectors from the atoms between the layers to all atoms and their images, shape (n_atoms, n, n_shifts, 3)
+        D = positions[np.newaxis, :, np.newaxis, :] + shifts - positions[atom_indexes, np.newaxis, np.newaxis, :]
+        d = np.linalg.norm(D, axis=-1)
+        k, j, _ = np.nonzero((d > 1E-8) & (d < cutoff))
+        D = D[(d > 1E-8) & (d < cutoff)]
+        d = d[(d > 1E-8) & (d < cutoff)]
+        i = atom_indexes[k]
+
+        r0 = covalent_radii[numbers[i]] + covalent_radii[numbers[j]]
+        x6 = (r0 / d) ** 6
+        # The pairs of two atoms between the layers are found twice
+        between = np.isin(j, atom_indexes)
+        weights = np.where(between, 0.5, 1.)
+
+        energy = np.sum(weights * epsilon * (x6 ** 2 - 2 * x6))
+        # dE/dr along the vector from atom i to atom j
+        de_dr = epsilon * (-12 * x6 ** 2 + 12 * x6) / d
+        pair_forces = (de_dr / d)[:, np.newaxis] * D
+        forces = np.zeros((len(self.atoms), 3))
+        np.add.at(forces, i, pair_forces)
+        # Forces exerted on the atoms of the layers by the atoms between the layers
+        np.add.at(forces, j[~between], -pair_forces[~between])
+
+        self.results['energy'] = energy
+        self.results['forces'] = forces
+
+def pre_relax(struct, optimizer='FIRE', fmax=0.05, steps=200):
+    """
+    Pre-relaxes the in-plane positions of the atoms between the layers with the classical pair potential.
+    The atoms of the layers and the heights of the atoms between the layers are fixed.
+    The number of optimizer steps and the largest and the mean displacement (Angstrom) of the atoms made
+    by the pre-relaxation are stored in struct.info ('pre_relax_steps', 'pre_relax_max_displacement',
+    'pre_relax_mean_displacement').
+
+    Args:
+        struct (ase.Atoms): Structure to be pre-relaxed (modified in place).
+        optimizer (str): Name of the ASE optimizer (FIRE or BFGS).
+        fmax (float): Force convergence criterion of the optimizer.
+        steps (int): Maximum number of optimizer steps.
+
+    Returns:
+        ase.Atoms: The pre-relaxed structure.
+    """
+    if optimizer not in OPTIMIZERS:
+        raise ValueError(f'Unknown optimizer: {optimizer}')
+
+    atom_indexes = get_interlayer_indexes(struct)
+    layer_indexes = [i for i in range(len(struct)) if i not in atom_indexes]
+    start_positions = struct.positions[atom_indexes].copy()
+
+    struct.set_constraint([FixAtoms(indices=layer_indexes),
+                           FixCartesian(atom_indexes, mask=(False, False, True))])
+    struct.calc = PairPotential()
+    opt = OPTIMIZERS[optimizer](struct, logfile=None)
+    opt.run(fmax=fmax, steps=steps)
+    struct.set_constraint()
+    struct.calc = None
+
+    displacements = np.linalg.norm(struct.positions[atom_indexes] - start_positions, axis=1)
+    struct.info['pre_relax_steps'] = opt.get_number_of_steps()
+    struct.info['pre_relax_max_displacement'] = float(np.round(np.max(displacements), 4))
+    struct.info['pre_relax_mean_displacement'] = float(np.round(np.mean(displacements), 4))
+    return struct
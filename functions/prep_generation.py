@@ -4,19 +4,27 @@ The module contains a function 'prep_generation' that prepare a single generatio
 
 import os, sys, random
 from pathlib import Path
-import numpy as np
-from ase import io
 from ase.io import Trajectory
 from math import ceil
-from functions.sort_population import sort_population
+from functions.population import Population
+from functions.prep_struct import prep_struct
 from functions.gen_rand_struct import gen_rand_struct
 from functions.mutation import mutation
+from functions.small_functions import get_interlayer_sites
 from functions.crossover import crossover
 from functions.gen_energy_file import gen_energy_file
-
-def prep_generation(pop_filename, pop_size, n_best, n_child, n_mut,
+from functions.stop_criteria import budget_exhausted
+from functions.metrics import new_record, timed, finish_generation
+from functions.selection import get_distance_matrix, select_parents
+from functions.scheduler import run_jobs, count_done
+from functions.cost_model import fit_cost_model
+from functions.pipeline import make_jobs
+
+def prep_generation(previous_pop, pop_size, n_best, n_child, n_mut,
                     struct_filename, size, n_atoms, n_change, atom_symbol,
-                    calc, mag_moment, label, new_pop_name):
+                    calc, mag_moment, label, new_pop_name, budget=None,
+                    mut_kinds=('random',), mut_step=0.5, relax_options=None,
+                    metrics=None, selection=None, prefetch=0):
     """
     Prepares a new generation based on the previous population and the given parameters.
     As a result of the function's execution, a folder named new_pop_name is created, containing the output of the
@@ -25,9 +33,16 @@ def prep_generation(pop_filename, pop_size, n_best, n_child, n_mut,
     sorted_new_pop_name.traj - stores the sorted atomic structures.
     energy_new_pop_name.txt - contains the energy values of the structures.
     Here, new_pop_name is one of the function's arguments and determines the naming convention for the generated files.
+    The parents of the new individuals are drawn from the better half of the previous population
+    (see selection.select_parents). The new individuals are relaxed one after another (see scheduler.run_jobs).
+    If the compute budget is used up, no new calculations are started and the structures relaxed so far
+    remain in new_pop_name.traj, from which the generation can be continued with continue_generation.
+    The sorted population is also returned, so the next generation and the stop criteria use it
+    without reading sorted_new_pop_name.traj again.
 
     Args:
-        pop_filename (str): Name of the file containing the previous population.
+        previous_pop (Population or str): The sorted previous population (e.g., returned by the previous call)
+            or the name of the file containing it.
         pop_size (int): Size of the population.
         n_best (int): Number of the best individuals from the previous generation that will go to the new generation.
         n_child (int): Number of new individuals created through crossover.
@@ -41,128 +56,112 @@ def prep_generation(pop_filename, pop_size, n_best, n_child, n_mut,
         mag_moment (float): Initial magnetic moment assigned to atoms between layers.
         label (str): Label assigned to the calculator files (e.g., MoS2).
         new_pop_name (str): Label of the new population.
+        budget (dict, optional): Compute budget of the run (see stop_criteria.init_budget).
+        mut_kinds (list, optional): Kinds of mutation drawn for each mutant (see mutation.MUTATION_KINDS).
+        mut_step (float, optional): Maximum displacement in the local kinds of mutation.
+        relax_options (dict, optional): Options of the relaxation (see relax_struct).
+        metrics (dict, optional): Metrics collector of the run (see metrics.init_metrics).
+        selection (dict, optional): Parent selection settings of the run (see selection.init_selection).
+        prefetch (int, optional): Maximum number of the candidates created in advance in the background
+            while SIESTA is running (see pipeline.make_jobs, 0 - disabled).
 
     Returns:
-        None: The function does not return a value.
+        Population: The sorted new population or None if the generation was checkpointed.
     """
     try:
-        # Loading the initial population from the .traj file
-        previous_pop = sort_population(Trajectory(pop_filename, 'r'))
-        # Better adapted part of the previous population
-        better_part = previous_pop[:ceil(pop_size/2)]
+        gen_record = new_record(new_pop_name)
+        with timed(metrics, gen_record, 'selection'):
+            # Loading the previous population from the .traj file if it is not kept in memory
+            if not isinstance(previous_pop, Population):
+                previous_pop = Population.from_traj(previous_pop).sorted()
+            # Better adapted part of the previous population
+            better_part = previous_pop[:ceil(pop_size/2)]
+            # Distances between the structures of the better part used by the diverse parent selection
+            distances = None
+            if selection is not None and selection['mode'] == 'diverse':
+                distances = get_distance_matrix(better_part, selection)
+                gen_record['diversity'] = float(distances.mean())
+        # Indexes of the parents selected in this generation
+        chosen = []
 
         folder_path = Path(f'{new_pop_name}')
         folder_path.mkdir(parents=True, exist_ok=True)
         original_directory = os.getcwd()
         os.chdir(folder_path)
 
+        # Two-layer structure to which the atoms between the layers are added
+        template = prep_struct(f'{original_directory}/{struct_filename}', size)
+        # High-symmetry sites of the hop mutation, computed once from the unrelaxed layers
+        sites = get_interlayer_sites(template) if 'hop' in mut_kinds else None
+
+        def make_struct(kind):
+            # Creates a new individual of the given kind
+            if kind == 'child':
+                index1, index2 = select_parents(better_part, 2, selection, distances, chosen)
+                return crossover(better_part, index1, index2, n_change, template)
+            if kind == 'mut':
+                index, = select_parents(better_part, 1, selection, distances, chosen)
+                # The parent is not copied - mutation modifies its own copy
+                return mutation(better_part.to_atoms(index, copy=False), random.choice(mut_kinds), mut_step,
+                                sites=sites)
+            return gen_rand_struct(f'{original_directory}/{struct_filename}', size, atom_symbol, n_atoms, template)
+
         # Creating .traj file for new population
         new_pop = Trajectory(f'{new_pop_name}.traj', 'w')
 
         # Adding the best individuals from the previous population directly to the new generation
-        for i in range(n_best):
-            new_pop.write(better_part[i])
-
-        # Creating new individuals through crossover
-        child_counter = 0
-        while len(new_pop) < n_best + n_child:
-            child_counter += 1
-            tmp_folder_path = Path(f'child{child_counter}')
-            tmp_folder_path.mkdir(parents=True, exist_ok=True)
-            os.chdir(tmp_folder_path)
-            parent1, parent2 = random.sample(better_part, 2)
-            child = crossover(parent1, parent2, n_change, f'{original_directory}/{struct_filename}', size)
-            moments = [0] * (len(child) - n_atoms) + [mag_moment] * n_atoms
-            child.set_initial_magnetic_moments(moments)
-            try:
-                child.calc = calc
-                pot_energy = child.get_potential_energy()
-                relaxed_child = io.read(f'{label}.XV')
-                relaxed_child.pbc = [True, True, False]
-                relaxed_child.info['pot_energy'] = np.round(pot_energy, 4)
-                io.write(f'relaxed_child{child_counter}.xyz', relaxed_child)
-                new_pop.write(relaxed_child)
-                print(f'Successfully relaxed child{child_counter}.')
-                with open(f'../log_{new_pop_name}.txt', 'a') as f:
-                    f.write(f'Successfully relaxed child{child_counter}.\n')
-            except Exception as e:
-                print(f'Failed to relax child{child_counter}. Error: {e}')
-                with open(f'../log_{new_pop_name}.txt', 'a') as f:
-                    f.write(f'Failed to relax child{child_counter}. Error: {e}\n')
-
-            os.chdir(original_directory / folder_path)
-
-        # Creating new individuals through mutation
-        mut_counter = 0
-        while len(new_pop) < n_best + n_child + n_mut:
-            mut_counter += 1
-            tmp_folder_path = Path(f'mut{mut_counter}')
-            tmp_folder_path.mkdir(parents=True, exist_ok=True)
-            os.chdir(tmp_folder_path)
-            mut_struct = mutation(random.choice(better_part))
-            moments = [0] * (len(mut_struct) - n_atoms) + [mag_moment] * n_atoms
-            mut_struct.set_initial_magnetic_moments(moments)
-            try:
-                mut_struct.calc = calc
-                pot_energy = mut_struct.get_potential_energy()
-                relaxed_mut_struct = io.read(f'{label}.XV')
-                relaxed_mut_struct.pbc = [True, True, False]
-                relaxed_mut_struct.info['pot_energy'] = np.round(pot_energy, 4)
-                io.write(f'relaxed_mut{mut_counter}.xyz', relaxed_mut_struct)
-                new_pop.write(relaxed_mut_struct)
-                print(f'Successfully relaxed mut{mut_counter}.')
-                with open(f'../log_{new_pop_name}.txt', 'a') as f:
-                    f.write(f'Successfully relaxed mut{mut_counter}.\n')
-            except Exception as e:
-                print(f'Failed to relax mut{mut_counter}. Error: {e}')
-                with open(f'../log_{new_pop_name}.txt', 'a') as f:
-                    f.write(f'Failed to relax mut{mut_counter}. Error: {e}\n')
-
-            os.chdir(original_directory / folder_path)
-
-        # Creating the remaining individuals by drawing new structures
-        candidates_counter = 0
-        while len(new_pop) < pop_size:
-            candidates_counter += 1
-            tmp_struct = gen_rand_struct(f'{original_directory}/{struct_filename}', size, atom_symbol, n_atoms)
-            moments = [0] * (len(tmp_struct) - n_atoms) + [mag_moment] * n_atoms
-            tmp_struct.set_initial_magnetic_moments(moments)
-            tmp_folder_path = Path(f'cand{candidates_counter}')
-            tmp_folder_path.mkdir(parents=True, exist_ok=True)
-            os.chdir(tmp_folder_path)
-            try:
-                tmp_struct.calc = calc
-                pot_energy = tmp_struct.get_potential_energy()
-                relaxed_struct = io.read(f'{label}.XV')
-                relaxed_struct.pbc = [True, True, False]
-                relaxed_struct.info['pot_energy'] = np.round(pot_energy, 4)
-                io.write(f'relaxed_cand{candidates_counter}.xyz', relaxed_struct)
-                new_pop.write(relaxed_struct)
-                print(f'Successfully relaxed cand{candidates_counter}.')
-                with open(f'../log_{new_pop_name}.txt', 'a') as f:
-                    f.write(f'Successfully relaxed cand{candidates_counter}.\n')
-            except Exception as e:
-                print(f'Failed to relax cand{candidates_counter}. Error: {e}')
-                with open(f'../log_{new_pop_name}.txt', 'a') as f:
-                    f.write(f'Failed to relax cand{candidates_counter}. Error: {e}\n')
-
-            os.chdir(original_directory / folder_path)
-
-        tmp_pop = sort_population(Trajectory(f'{new_pop_name}.traj', 'r'))
-        # Saving the energy of structures in the new population to a file
-        gen_energy_file(tmp_pop, f'../energy_{new_pop_name}')
-
-        os.chdir(original_directory)
-
-        # Saving the new population to the .traj file in order from the lowest to the highest energy
-        out_pop = Trajectory(f'sorted_{new_pop_name}.traj', 'w')
-        for structure in tmp_pop:
-            out_pop.write(structure)
+        # - they are written from the arrays of the population and kept in memory without copies
+        better_part.write_to(new_pop, range(n_best))
+        structures = [better_part.to_atoms(i, copy=False) for i in range(n_best)]
+
+        # Creating new individuals through crossover and mutation and the remaining individuals
+        # by drawing new structures - the missing candidates are created again if some relaxations fail
+        quotas = {'child': n_child, 'mut': n_mut, 'cand': pop_size - n_best - n_child - n_mut}
+        counters = {kind: 0 for kind in quotas}
+        done = count_done([struct.info['name'] for struct in structures], new_pop_name, quotas, n_best)
+        # Cost model of the wall times fitted once for the whole generation
+        model = fit_cost_model(metrics['filename']) if metrics is not None else None
+        while any(done[kind] < quota for kind, quota in quotas.items()) and not budget_exhausted(budget):
+            specs = []
+            for kind, quota in quotas.items():
+                for _ in range(quota - done[kind]):
+                    counters[kind] += 1
+                    specs.append((f'{kind}{counters[kind]}', (kind,)))
+            with make_jobs(new_pop_name, specs, make_struct, calc, metrics, prefetch) as jobs:
+                structures += run_jobs(jobs, new_pop, n_atoms, mag_moment, calc, label, new_pop_name, budget,
+                                       relax_options, metrics, model)
+            done = count_done([struct.info['name'] for struct in structures], new_pop_name, quotas, n_best)
+
+        # If the compute budget is exhausted, the unfinished generation is left in the new_pop_name.traj file
+        if any(done[kind] < quota for kind, quota in quotas.items()):
+            new_pop.close()
+            os.chdir(original_directory)
+            print(f'Compute budget exhausted - the {new_pop_name} has been checkpointed.')
+            with open(f'{folder_path}/log_{new_pop_name}.txt', 'a') as f:
+                f.write(f'Compute budget exhausted - the {new_pop_name} has been checkpointed.\n')
+            finish_generation(metrics, gen_record, f'{folder_path}/log_{new_pop_name}.txt')
+            return None
+
+        new_pop.close()
+        with timed(metrics, gen_record, 'selection'):
+            # The new population built from the structures kept in memory, without reading new_pop_name.traj
+            tmp_pop = Population.from_atoms(structures).sorted()
+        with timed(metrics, gen_record, 'io'):
+            # Saving the energy of structures in the new population to a file
+            gen_energy_file(tmp_pop, f'../energy_{new_pop_name}')
+
+            os.chdir(original_directory)
+
+            # Saving the new population to the .traj file in order from the lowest to the highest energy
+            tmp_pop.write(f'sorted_{new_pop_name}.traj')
+        finish_generation(metrics, gen_record, f'{folder_path}/log_{new_pop_name}.txt')
 
         print(f'The {new_pop_name} is complete!')
         with open(f'{folder_path}/log_{new_pop_name}.txt', 'a') as f:
             f.write(f'The {new_pop_name} is complete!\n')
 
+        return tmp_pop
+
     except Exception as er:
         print(er)
         sys.exit(1)
\ No newline at end of file
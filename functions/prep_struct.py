@@ -11,14 +11,13 @@ def prep_struct(struct_filename, size):
 
     Args:
         struct_filename (str): Name of the file containing dichalcogenide structure.
-        size (str): Size of the structure (e.g., 4x4).
+        size (str): Size of the structure (e.g., 4x4 or 10x10).
 
     Returns:
         ase.Atoms: The generated two-layer structure.
     """
     # Structure dimensions
-    n = int(size[0])
-    m = int(size[2])
+    n, m = (int(dimension) for dimension in size.lower().split('x'))
 
     structure = Atoms(io.read(struct_filename))
     # Setting a new cell dimension in the direction of the z-axis
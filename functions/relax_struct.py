@@ -0,0 +1,231 @@
+"""
+The module contains a function 'relax_struct' that relaxes a single structure with the SIESTA calculator,
+a function 'get_siesta_stats' that counts the CG steps and SCF iterations made by the calculator
+and a function 'load_unfinished' that loads a structure whose relaxation was interrupted.
+"""
+
+import numpy as np
+from ase import io
+from functions.pre_relax import pre_relax
+from functions.small_functions import get_interlayer_indexes
+from functions.metrics import new_record, timed
+from functions.calculator import get_calc_settings
+from functions.constraints import set_layer_constraint
+from functions.validation import validate_struct, count_rejection
+from functions.stop_criteria import budget_exhausted
+from functions.failures import classify_failure, adjusted_calc, FIXABLE_FAILURES, RETRY_ADJUSTMENTS
+
+def relax_struct(struct, n_atoms, mag_moment, calc, label, name, pop_name, budget=None, relax_options=None,
+                 metrics=None, record=None, resume=False):
+    """
+    Relaxes the given structure in the current working directory and logs the result of the calculations
+    to the file log_pop_name.txt located in the parent directory. The information stored in struct.info
+    (e.g., the operator that created the structure) and the tags of atoms are copied to the relaxed structure,
+    whose name is set to pop_name/name. The settings of the calculator (see calculator.get_calc_settings)
+    are stored in atoms.info['calc_settings'] of the relaxed structure. The starting structure is saved to the file start_name.traj,
+    so that an interrupted relaxation can be resumed (see load_unfinished).
+    Failed calculations are classified from the SIESTA output (see failures.classify_failure). Fixable failures
+    (e.g., SCF not converged) are retried in the same directory, starting from the saved geometry and density
+    matrix, with the escalating calculator adjustments from failures.RETRY_ADJUSTMENTS, as long as the compute budget
+    is not exhausted (see stop_criteria.budget_exhausted). The category and the SIESTA time of each failed attempt
+    are logged and stored in record['failures']. In the session mode, the failure is classified from the output
+    of the worker in the session directory and the error of the socket connection ('socket'), without retries.
+    Just before the calculation, the structure is checked by validation.validate_struct - a structure
+    with colliding atoms is rejected as a 'geometry' failure without starting SIESTA and without
+    counting a DFT evaluation in the budget.
+    The following relax_options are used:
+    'pre_relax' - ASE optimizer used for the classical pre-relaxation (FIRE, BFGS or none),
+    'pre_relax_fmax' - force convergence criterion of the pre-relaxation,
+    'pre_relax_steps' - maximum number of steps of the pre-relaxation,
+    'layer_constraint' - constraint of the atoms of the layers (see constraints.LAYER_CONSTRAINTS), stored
+    in atoms.info['layer_constraint'] and, together with the number of fixed degrees of freedom, in the record,
+    'session' - SiestaSession in which the structure is relaxed by an ASE optimizer instead of a separate
+    SIESTA CG run (the number of optimizer steps is then reported as the CG steps).
+
+    Args:
+        struct (ase.Atoms): Structure to be relaxed.
+        n_atoms (int): Number of atoms between layers.
+        mag_moment (float): Initial magnetic moment assigned to atoms between layers.
+        calc (ase.Calculator): Calculator object.
+        label (str): Label assigned to the calculator files (e.g., MoS2).
+        name (str): Name of the structure used in the output files and logs (e.g., cand1).
+        pop_name (str): Label of the population to which the structure belongs.
+        budget (dict, optional): Compute budget of the run in which DFT evaluations are counted.
+        relax_options (dict, optional): Options of the relaxation.
+        metrics (dict, optional): Metrics collector of the run (see metrics.init_metrics).
+        record (dict, optional): Metrics record of the candidate, to which the times of the pre-relaxation,
+            the SIESTA calculations and the file I/O, the number of SCF iterations and CG steps are added.
+        resume (bool, optional): Whether the structure comes from an interrupted relaxation. The pre-relaxation
+            is skipped and SIESTA restarts from the geometry and the density matrix saved in the current
+            working directory (DM.UseSaveXV, DM.UseSaveDM).
+
+    Returns:
+        ase.Atoms: The relaxed structure or None if the relaxation failed.
+    """
+    relax_options = relax_options or {}
+    record = record if record is not None else new_record(pop_name, name)
+    optimizer = relax_options.get('pre_relax', 'none') if not resume else 'none'
+
+    moments = [0] * (len(struct) - n_atoms) + [mag_moment] * n_atoms
+    struct.set_initial_magnetic_moments(moments)
+
+    try:
+        # Cheap classical pre-relaxation of the atoms between the layers
+        if optimizer != 'none':
+            with timed(metrics, record, 'pre_relax'):
+                pre_relax(struct, optimizer, relax_options.get('pre_relax_fmax', 0.05),
+                          relax_options.get('pre_relax_steps', 200))
+            record['pre_relax_max_displacement'] = struct.info['pre_relax_max_displacement']
+
+        # Constraint of the atoms of the layers passed to SIESTA or to the optimizer of the session
+        record['layer_constraint'] = relax_options.get('layer_constraint', 'none')
+        record['fixed_dof'] = set_layer_constraint(struct, record['layer_constraint'])
+
+        # Structure checked again just before the calculation, as the pre-relaxation may move the atoms
+        collisions = validate_struct(struct)
+        if collisions:
+            count_rejection(record.setdefault('rejections', {}), struct)
+            raise ValueError(f'Atoms too close before the calculation: {collisions[:5]}')
+        if budget is not None:
+            budget['n_evaluations'] += 1
+
+        # Starting structure kept for resuming an interrupted relaxation
+        if not resume:
+            with timed(metrics, record, 'io'):
+                io.write(f'start_{name}.traj', struct)
+
+        session = relax_options.get('session')
+        if session is not None:
+            # Relaxation by the Python-side optimizer in the long-lived SIESTA process
+            siesta_time = record['times'].get('siesta', 0.)
+            try:
+                with timed(metrics, record, 'siesta'):
+                    pot_energy, n_steps = session.relax(struct)
+            except Exception as e:
+                # Classified from the output of the worker and the error of the socket connection
+                record.setdefault('failures', []).append(
+                    {'category': classify_failure(label, e, session.directory),
+                     'siesta_time': record['times']['siesta'] - siesta_time})
+                raise
+            record['cg_steps'] = record.get('cg_steps', 0) + n_steps
+            relaxed_struct = struct.copy()
+        else:
+            struct.calc = calc
+            attempt = 0
+            while True:
+                siesta_time = record['times'].get('siesta', 0.)
+                try:
+                    with adjusted_calc(calc, RETRY_ADJUSTMENTS[attempt - 1] if attempt > 0 else None):
+                        with timed(metrics, record, 'siesta'):
+                            pot_energy = struct.get_potential_energy()
+                    break
+                except Exception as e:
+                    category = classify_failure(label, e)
+                    record.setdefault('failures', []).append(
+                        {'category': category, 'siesta_time': record['times']['siesta'] - siesta_time})
+                    # The retry is a new DFT evaluation, so it is not started when the budget is exhausted
+                    if (category not in FIXABLE_FAILURES or attempt >= len(RETRY_ADJUSTMENTS)
+                            or budget_exhausted(budget)):
+                        raise
+                    attempt += 1
+                    if budget is not None:
+                        budget['n_evaluations'] += 1
+                    message = (f'Calculation of {name} failed ({category}), retry {attempt} with '
+                               f'{RETRY_ADJUSTMENTS[attempt - 1]}. Error: {e}')
+                    print(message)
+                    with open(f'../log_{pop_name}.txt', 'a') as f:
+                        f.write(f'{message}\n')
+                finally:
+                    for key, value in get_siesta_stats(label).items():
+                        record[key] = record.get(key, 0) + value
+
+            with timed(metrics, record, 'io'):
+                relaxed_struct = io.read(f'{label}.XV')
+        relaxed_struct.pbc = [True, True, False]
+        relaxed_struct.set_tags(struct.get_tags())
+        relaxed_struct.info.update(struct.info)
+        relaxed_struct.info['name'] = f'{pop_name}/{name}'
+        relaxed_struct.info['pot_energy'] = np.round(pot_energy, 4)
+        relaxed_struct.info['cg_steps'] = record['cg_steps']
+        relaxed_struct.info['calc_settings'] = get_calc_settings(calc)
+        with timed(metrics, record, 'io'):
+            io.write(f'relaxed_{name}.xyz', relaxed_struct)
+        message = f'Successfully relaxed {name}.'
+        if resume:
+            message = f'Successfully resumed the relaxation of {name}.'
+        if optimizer != 'none':
+            message += (f' CG steps: {relaxed_struct.info["cg_steps"]},'
+                        f' largest displacement in the pre-relaxation: '
+                        f'{relaxed_struct.info["pre_relax_max_displacement"]:.3f} A.')
+        print(message)
+        with open(f'../log_{pop_name}.txt', 'a') as f:
+            f.write(f'{message}\n')
+        return relaxed_struct
+    except Exception as e:
+        failures = record.get('failures') or [{'category': classify_failure(label, e)}]
+        message = f'Failed to relax {name}. Category: {failures[-1]["category"]}.'
+        wasted = sum(failure.get('siesta_time', 0.) for failure in failures)
+        print(f'{message} Error: {e}')
+        with open(f'../log_{pop_name}.txt', 'a') as f:
+            f.write(f'{message} Wasted SIESTA time: {wasted:.1f} s. Error: {e}\n')
+        return None
+
+def get_siesta_stats(label):
+    """
+    Returns the number of CG steps and SCF iterations made by the SIESTA calculator
+    in the current working directory.
+
+    Args:
+        label (str): Label assigned to the calculator files (e.g., MoS2).
+
+    Returns:
+        dict: The numbers of CG steps ('cg_steps') and SCF iterations ('scf_iterations').
+    """
+    stats = {'cg_steps': 0, 'scf_iterations': 0}
+    try:
+        with open(f'{label}.out', 'r') as file:
+            for line in file:
+                if 'Begin CG opt. move' in line:
+                    stats['cg_steps'] += 1
+                else:
+                    words = line.split()
+                    if len(words) > 1 and words[0] == 'scf:' and words[1].isdigit():
+                        stats['scf_iterations'] += 1
+    except FileNotFoundError:
+        pass
+    return stats
+
+def load_unfinished(name, label):
+    """
+    Loads the structure whose relaxation in the current working directory was interrupted.
+    The structure saved by relax_struct in the file start_name.traj is restored with its tags and information
+    and moved to the last geometry written by SIESTA to the file label.XV. For directories without
+    the start_name.traj file, the structure is read from the .XV file and the atoms between the layers
+    are found by their height.
+
+    Args:
+        name (str): Name of the structure (e.g., cand1).
+        label (str): Label assigned to the calculator files (e.g., MoS2).
+
+    Returns:
+        ase.Atoms: The structure or None if neither of the files exists.
+    """
+    try:
+        struct = io.read(f'start_{name}.traj')
+    except FileNotFoundError:
+        struct = None
+
+    try:
+        last_struct = io.read(f'{label}.XV')
+    except FileNotFoundError:
+        return struct
+
+    if struct is None:
+        struct = last_struct
+        struct.pbc = [True, True, False]
+        tags = np.zeros(len(struct), dtype=int)
+        tags[get_interlayer_indexes(struct)] = 1
+        struct.set_tags(tags)
+    elif len(last_struct) == len(struct):
+        struct.positions = last_struct.positions
+    return struct
@@ -0,0 +1,187 @@
+"""
+The module contains a function 'run_jobs' that relaxes the candidates of a generation and reports
+the estimated time left, and functions 'make_job' and 'count_done' used with it.
+"""
+
+import os
+import time
+import numpy as np
+from pathlib import Path
+from functions.relax_struct import relax_struct
+from functions.stop_criteria import budget_exhausted
+from functions.metrics import new_record, timed, finish_candidate
+from functions.cost_model import get_features, predict_cost
+from functions.validation import validate_struct, count_rejection, MAX_REJECTIONS
+
+def make_job(pop_name, name, make_struct, calc, metrics=None, *args):
+    """
+    Creates a candidate structure and the metrics record with its features (see cost_model.get_features).
+    Every created structure is checked by validation.validate_struct and the colliding ones are created again
+    (up to validation.MAX_REJECTIONS times). The rejected structures are counted for each operator
+    in record['rejections'] and their drawn positions are added to record['tries'].
+
+    Args:
+        pop_name (str): Label of the population.
+        name (str): Name of the candidate (e.g., child1).
+        make_struct (callable): Function creating the structure, called with the arguments args.
+        calc (ase.Calculator): Calculator object.
+        metrics (dict, optional): Metrics collector of the run (see metrics.init_metrics).
+        *args: Arguments passed to make_struct.
+
+    Returns:
+        dict: The job ('name', 'struct', 'record').
+    """
+    record = new_record(pop_name, name)
+    record['tries'] = 0
+    rejections = {}
+    with timed(metrics, record, 'generation'):
+        while True:
+            struct = make_struct(*args)
+            record['tries'] += struct.info.pop('n_tries')
+            if not validate_struct(struct) or sum(rejections.values()) >= MAX_REJECTIONS:
+                break
+            count_rejection(rejections, struct)
+    if rejections:
+        record['rejections'] = rejections
+    record['features'] = get_features(struct, calc)
+    return {'name': name, 'struct': struct, 'record': record}
+
+def run_jobs(jobs, new_pop, n_atoms, mag_moment, calc, label, pop_name, budget=None, relax_options=None,
+             metrics=None, model=None):
+    """
+    Relaxes the candidates in their folders in the current working directory and writes the relaxed structures
+    to the trajectory new_pop. The candidates are relaxed one after another in the given order - as they are not
+    run concurrently, reordering them would not shorten the generation. The estimated time left (ETA) is printed
+    before each candidate and logged at the start. It is computed from the wall times predicted by the cost model
+    (fitted once per generation by the caller, see cost_model.fit_cost_model) or, without the model,
+    from the mean time of the already relaxed candidates.
+    If the jobs are created in the background by a pipeline.JobPipeline, the next candidate is taken
+    as soon as the previous relaxation ends, in the order of creation, and the time spent
+    waiting for the pipeline is added to the record of the candidate as the 'wait' stage.
+    No new calculations are started when the compute budget is used up, and the folders created in advance
+    by the pipeline for the remaining ready jobs are then removed.
+
+    Args:
+        jobs (list or JobPipeline): The jobs created by make_job or the pipeline creating them.
+        new_pop (ase.io.Trajectory): Trajectory to which the relaxed structures are written.
+        n_atoms (int): Number of atoms between layers.
+        mag_moment (float): Initial magnetic moment assigned to atoms between layers.
+        calc (ase.Calculator): Calculator object.
+        label (str): Label assigned to the calculator files (e.g., MoS2).
+        pop_name (str): Label of the population.
+        budget (dict, optional): Compute budget of the run (see stop_criteria.init_budget).
+        relax_options (dict, optional): Options of the relaxation (see relax_struct).
+        metrics (dict, optional): Metrics collector of the run (see metrics.init_metrics).
+        model (dict, optional): The cost model returned by cost_model.fit_cost_model (None - no predictions).
+
+    Returns:
+        list: The successfully relaxed structures (ase.Atoms), also written to new_pop.
+    """
+    def get_cost(job):
+        return predict_cost(model, job['record']['features']) if model is not None else 0.
+
+    # Jobs waiting for the relaxation and their predicted wall times
+    pipeline = jobs if not isinstance(jobs, list) else None
+    pending = list(jobs) if pipeline is None else []
+    costs = [get_cost(job) for job in pending]
+    n_jobs = len(jobs)
+
+    directory = os.getcwd()
+    relaxed = []
+    wall_times = []
+    predicted = []
+    for position in range(n_jobs):
+        if budget_exhausted(budget):
+            break
+
+        # Jobs made ready by the pipeline while the previous candidate was relaxed
+        wait = 0.
+        if pipeline is not None:
+            start = time.perf_counter()
+            ready = pipeline.take(block=not pending)
+            wait = time.perf_counter() - start
+            pending += ready
+            costs += [get_cost(job) for job in ready]
+
+        # The first of the pending jobs
+        job = pending.pop(0)
+        cost = costs.pop(0)
+        record = job['record']
+        if wait > 0.:
+            record['times']['wait'] = wait
+
+        # Estimated time left for the remaining candidates of the batch
+        # - the jobs not yet created by the pipeline are estimated from the mean predicted time
+        n_left = n_jobs - position
+        eta = None
+        if model is not None:
+            predicted.append(cost)
+            eta = cost + float(np.sum(costs)) + float(np.mean(predicted)) * (n_left - 1 - len(costs))
+        elif wall_times:
+            eta = float(np.mean(wall_times)) * n_left
+        if eta is not None:
+            message = f'ETA of {pop_name}: {eta:.0f} s ({n_left} candidates left)'
+            print(message)
+            if position == 0:
+                with open(f'log_{pop_name}.txt', 'a') as f:
+                    f.write(f'{message}\n')
+
+        # The time spent waiting for the previous candidates is not a part of the wall time of the candidate,
+        # the structures created in the background by the pipeline do not add to it either
+        record['start'] = time.time() - (record['times'].get('generation', 0.) if pipeline is None else wait)
+        if model is not None:
+            record['predicted_time'] = float(cost)
+
+        tmp_folder_path = Path(job['name'])
+        tmp_folder_path.mkdir(parents=True, exist_ok=True)
+        os.chdir(tmp_folder_path)
+        try:
+            relaxed_struct = relax_struct(job['struct'], n_atoms, mag_moment, calc, label, job['name'], pop_name,
+                                          budget, relax_options, metrics, record)
+        finally:
+            os.chdir(directory)
+        if relaxed_struct is not None:
+            with timed(metrics, record, 'io'):
+                new_pop.write(relaxed_struct)
+            relaxed.append(relaxed_struct)
+        finish_candidate(metrics, record, relaxed_struct is not None)
+        wall_times.append(time.time() - record['start'])
+
+    # Folders created in advance by the pipeline for the jobs not relaxed when the budget was used up
+    if pipeline is not None:
+        pipeline.discard(pending)
+    return relaxed
+
+def count_done(names, pop_name, quotas, n_best):
+    """
+    Counts the candidates of each kind (child, mut, cand) already relaxed in the population. The kind
+    is read from the name of the structure (e.g., pop1/child2). Structures without a name (written before
+    the names were introduced) are assigned to the kinds by their position in the population.
+
+    Args:
+        names (list): Names of the structures of the population in the order in which they were written.
+        pop_name (str): Label of the population.
+        quotas (dict): Number of candidates of each kind in the population.
+        n_best (int): Number of the best individuals from the previous generation at the beginning of the population.
+
+    Returns:
+        dict: Number of relaxed candidates of each kind.
+    """
+    done = {kind: 0 for kind in quotas}
+    for i, name in enumerate(names):
+        if name.startswith(f'{pop_name}/'):
+            kind = name.split('/')[-1].rstrip('0123456789')
+        elif name:
+            # The best individuals from the previous generation
+            continue
+        else:
+            limit = n_best
+            kind = None
+            for tmp_kind, quota in quotas.items():
+                limit += quota
+                if n_best <= i < limit:
+                    kind = tmp_kind
+                    break
+        if kind in done:
+            done[kind] += 1
+    return done
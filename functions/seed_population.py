@@ -0,0 +1,172 @@
+"""
+The module contains a function 'seed_population' that takes the best structures of previous runs
+as the starting structures of the initial population, and functions 'load_archives' and 'adapt_struct' used by it.
+"""
+
+import glob
+import random
+import numpy as np
+from collections import Counter
+from ase import Atom, io
+from ase.data import atomic_numbers
+from functions.calculator import get_calc_settings
+from functions.small_functions import (get_rand_xyz, build_cell_list, add_to_cell_list, check_collision,
+                                       get_max_collision_distance, get_interlayer_indexes, get_parent_distance)
+
+def load_archives(patterns):
+    """
+    Loads the structures of previous runs from the files matching the given patterns (e.g., ../run1/sorted_pop*.traj).
+    Any format readable by ASE with the information of the structures (.traj, .db, extended .xyz) can be used.
+    Structures without the energy are skipped and the structures appearing in several files (e.g., the best
+    individuals passed to the next generations) are loaded once.
+
+    Args:
+        patterns (list): Names of the files or glob patterns.
+
+    Returns:
+        list: The (structure, filename) pairs.
+    """
+    structures = []
+    seen = set()
+    for pattern in patterns:
+        filenames = sorted(glob.glob(pattern))
+        if not filenames:
+            print(f'No files matching {pattern}.')
+        for filename in filenames:
+            for struct in io.read(filename, ':'):
+                if 'pot_energy' not in struct.info:
+                    continue
+                key = (struct.info.get('name', ''), round(float(struct.info['pot_energy']), 4), len(struct))
+                if key in seen:
+                    continue
+                seen.add(key)
+                structures.append((struct, filename))
+    return structures
+
+def adapt_struct(struct, template, atom_symbol, n_atoms, max_tries=1000):
+    """
+    Adapts the structure of a previous run to the template of the current run. A structure of a smaller cell
+    is repeated in the plane if the template is its integer multiple. Surplus atoms between the layers
+    are removed at random and the missing ones are added at random positions, with the collisions
+    with the layers, the other atoms and their periodic images checked as in gen_rand_struct.
+
+    Args:
+        struct (ase.Atoms): The structure of a previous run.
+        template (ase.Atoms): Two-layer structure created by prep_struct.
+        atom_symbol (str): Chemical symbol of atoms between the layers.
+        n_atoms (int): Number of atoms between layers.
+        max_tries (int): Maximum number of drawn positions of each added atom.
+
+    Returns:
+        ase.Atoms: The adapted structure (atoms between the layers tagged 1 and placed after the layers)
+            or None if the structure does not fit the template.
+    """
+    structure = struct.copy()
+    structure.pbc = template.pbc
+    tags = np.zeros(len(structure), dtype=int)
+    tags[get_interlayer_indexes(struct)] = 1
+    structure.set_tags(tags)
+
+    # Repeating the structure of a smaller cell
+    cell = np.asarray(structure.get_cell())
+    template_cell = np.asarray(template.get_cell())
+    repeats = [template_cell[k] @ cell[k] / (cell[k] @ cell[k]) for k in range(2)]
+    if not all(round(r) >= 1 and np.isclose(r, round(r)) for r in repeats):
+        return None
+    structure = structure.repeat((round(repeats[0]), round(repeats[1]), 1))
+    if not np.allclose(structure.get_cell(), template_cell, atol=1E-3):
+        return None
+    # The atoms between the layers are moved after the layers
+    structure = structure[np.argsort(structure.get_tags(), kind='stable')]
+
+    atom_number = atomic_numbers[atom_symbol]
+    atom_indexes = get_interlayer_indexes(structure)
+    layer_numbers = np.delete(structure.numbers, atom_indexes)
+    if Counter(layer_numbers.tolist()) != Counter(template.numbers.tolist()):
+        return None
+    if np.any(structure.numbers[atom_indexes] != atom_number):
+        return None
+    previous_positions = structure.positions[atom_indexes]
+
+    # Removing the surplus atoms between the layers
+    if len(atom_indexes) > n_atoms:
+        del structure[random.sample(atom_indexes, len(atom_indexes) - n_atoms)]
+
+    tol_r = 0.1 # Tolerance used when checking the distance between atoms
+
+    # Adding the missing atoms between the layers
+    n_tries = 0 # Number of drawn positions
+    if len(atom_indexes) < n_atoms:
+        cutoff = get_max_collision_distance(list(structure.numbers) + [atom_number], tol_r)
+        cell_list = build_cell_list(structure, cutoff)
+        for _ in range(n_atoms - len(atom_indexes)):
+            for _ in range(max_tries):
+                n_tries += 1
+                random_positions = get_rand_xyz(structure.get_cell())
+                if not check_collision(structure, random_positions, atom_number, tol_r=tol_r, cell_list=cell_list):
+                    structure.append(Atom(atom_symbol, random_positions, tag=1))
+                    add_to_cell_list(cell_list, len(structure) - 1, random_positions)
+                    break
+            else:
+                return None
+
+    structure.info = {'operator': 'seed',
+                      'parents': struct.info.get('name', ''),
+                      'n_tries': max(n_tries, 1),
+                      'parent_distance': get_parent_distance(structure.positions[get_interlayer_indexes(structure)],
+                                                             [previous_positions], structure.cell, structure.pbc)}
+    return structure
+
+def seed_population(patterns, template, atom_symbol, n_atoms, calc, new_pop_name, max_structs):
+    """
+    Takes the best structures of previous runs (e.g., their sorted_pop*.traj files) as the starting structures
+    of the initial population. The structures with the same number of atoms between the layers and the same cell
+    are taken first, then the ones that have to be adapted (see adapt_struct), each group from the lowest energy.
+    The structures that need no adaptation and were relaxed with the same calculator settings
+    (see calculator.get_calc_settings) are reused without a new calculation, the remaining ones are relaxed again.
+    The name of the original structure is stored in atoms.info['parents'] and the file
+    in atoms.info['seed_file'].
+
+    Args:
+        patterns (list): Names of the files of previous runs or glob patterns.
+        template (ase.Atoms): Two-layer structure created by prep_struct.
+        atom_symbol (str): Chemical symbol of atoms between the layers.
+        n_atoms (int): Number of atoms between layers.
+        calc (ase.Calculator): Calculator object.
+        new_pop_name (str): Label of the initial population.
+        max_structs (int): Maximum number of taken structures.
+
+    Returns:
+        tuple: The reused relaxed structures (list of ase.Atoms named new_pop_name/seedN)
+            and the structures to be relaxed (list of ase.Atoms).
+    """
+    calc_settings = get_calc_settings(calc)
+    archives = load_archives(patterns)
+
+    def get_priority(item):
+        # Structures of the same cell, then the closest number of atoms between the layers, then the lowest energy
+        struct = item[0]
+        same_cell = np.allclose(struct.get_cell(), template.get_cell(), atol=1E-3)
+        return (not same_cell, abs(len(get_interlayer_indexes(struct)) - n_atoms), struct.info['pot_energy'])
+
+    reused = []
+    structures = []
+    for struct, filename in sorted(archives, key=get_priority):
+        if len(reused) + len(structures) >= max_structs:
+            break
+        structure = adapt_struct(struct, template, atom_symbol, n_atoms)
+        if structure is None:
+            continue
+        structure.info['seed_file'] = filename
+
+        unchanged = len(structure) == len(struct) and np.allclose(structure.get_cell(), struct.get_cell())
+        if unchanged and struct.info.get('calc_settings') == calc_settings:
+            structure.info['pot_energy'] = struct.info['pot_energy']
+            structure.info['calc_settings'] = calc_settings
+            structure.info['name'] = f'{new_pop_name}/seed{len(reused) + 1}'
+            reused.append(structure)
+        else:
+            structures.append(structure)
+
+    print(f'Structures taken from previous runs: {len(reused)} reused, {len(structures)} to be relaxed.')
+    return reused, structures
@@ -0,0 +1,175 @@
+"""
+The module contains a function 'select_parents' that selects the parents of a new individual, and functions
+'init_selection', 'get_fingerprints' and 'get_distance_matrix' used with it.
+"""
+
+import random
+import itertools
+import numpy as np
+
+SELECTION_MODES = ('uniform', 'diverse')
+
+def init_selection(mode='uniform', weight=0.5, r_max=6., n_bins=24):
+    """
+    Creates the parent selection settings of the run together with the cache of the fingerprints
+    and of the distance matrix kept between the generations.
+
+    Args:
+        mode (str): Selection mode - uniform (parents drawn with equal probability) or diverse
+            (energy rank balanced against the distance from the already selected parents).
+        weight (float): Weight of the distance in the diverse mode (0 - energy rank only, 1 - distance only).
+        r_max (float): Largest distance (Angstrom) included in the fingerprints.
+        n_bins (int): Number of bins of each part of the fingerprints.
+
+    Returns:
+        dict: The dictionary describing the parent selection.
+    """
+    if mode not in SELECTION_MODES:
+        raise ValueError(f'Unknown selection mode: {mode}')
+    selection = {'mode': mode,
+                 'weight': weight,
+                 'r_max': r_max,
+                 'n_bins': n_bins,
+                 'fingerprints': {},
+                 'names': [],
+                 'distances': np.zeros((0, 0))}
+    return selection
+
+def get_fingerprints(population, r_max=6., n_bins=24):
+    """
+    Returns the fingerprints of all structures of the population: the radial distribution of the distances
+    between the atoms between the layers and of the distances from the atoms between the layers to the atoms
+    of the layers. Each part is normalized to unit length, so both parts weigh the same in the distances.
+    Each distance is split linearly between the two nearest bins, so the fingerprints change continuously
+    with the positions.
+    The periodic images are taken into account for all structures at once.
+
+    Args:
+        population (Population): The population.
+        r_max (float): Largest distance (Angstrom) included in the fingerprints.
+        n_bins (int): Number of bins of each part of the fingerprints.
+
+    Returns:
+        np.array: The fingerprints, shape (n_structures, 2 * n_bins).
+    """
+    n_structs = len(population)
+    intercalants = population.intercalant_positions
+    layers = population.positions[:, :population.n_layer]
+    cell = np.asarray(population.cell)
+    width = r_max / (n_bins - 1)
+
+    # Shifts of the periodic images along the periodic directions
+    ranges = [(-1, 0, 1) if periodic else (0,) for periodic in population.pbc]
+    shifts = np.array(list(itertools.product(*ranges))) @ cell
+
+    fingerprints = np.zeros((n_structs, 2 * n_bins))
+    for part, others in enumerate((intercalants, layers)):
+        histogram = np.zeros(n_structs * n_bins)
+        for shift in shifts:
+            d = np.linalg.norm(intercalants[:, :, np.newaxis, :] - others[:, np.newaxis, :, :] - shift, axis=-1)
+            # Distances of the atoms from themselves are skipped
+            structs, _, _ = np.nonzero((d > 1E-8) & (d < r_max))
+            x = d[(d > 1E-8) & (d < r_max)] / width
+            lower = np.floor(x).astype(int)
+            upper_weight = x - lower
+            histogram += np.bincount(structs * n_bins + lower, weights=1. - upper_weight,
+                                     minlength=n_structs * n_bins)
+            upper = np.minimum(lower + 1, n_bins - 1)
+            histogram += np.bincount(structs * n_bins + upper, weights=upper_weight, minlength=n_structs * n_bins)
+        histogram = histogram.reshape(n_structs, n_bins)
+        lengths = np.linalg.norm(histogram, axis=1, keepdims=True)
+        fingerprints[:, part * n_bins:(part + 1) * n_bins] = histogram / np.where(lengths > 0, lengths, 1.)
+    return fingerprints
+
+def get_distance_matrix(population, selection):
+    """
+    Returns the matrix of the cosine distances between the fingerprints of the structures of the population,
+    computed for all pairs at once. The fingerprints and the distances of the structures passed
+    in the previous call (e.g., the best individuals of the previous generation) are taken from the cache,
+    so only the new structures are fingerprinted and only their rows of the matrix are computed.
+    The cache keeps the structures of the current population.
+
+    Args:
+        population (Population): The population (e.g., the better part of the previous generation).
+        selection (dict): The parent selection settings created by init_selection.
+
+    Returns:
+        np.array: The distances (0 - identical, 1 - completely different), shape (n_structures, n_structures).
+    """
+    names = [str(name) for name in population.names]
+    cache = selection['fingerprints']
+    # Structures without a name (written before the names were introduced) are never taken from the cache
+    missing = [i for i, name in enumerate(names) if not name or name not in cache]
+    fingerprints = np.zeros((len(names), 2 * selection['n_bins']))
+    if missing:
+        fingerprints[missing] = get_fingerprints(population[missing], selection['r_max'], selection['n_bins'])
+    for i, name in enumerate(names):
+        if i not in missing:
+            fingerprints[i] = cache[name]
+
+    lengths = np.linalg.norm(fingerprints, axis=1)
+    unit = fingerprints / np.where(lengths > 0, lengths, 1.)[:, np.newaxis]
+    known = np.array([i not in missing and name in selection['names'] for i, name in enumerate(names)], dtype=bool)
+    distances = np.zeros((len(names), len(names)))
+    new = np.nonzero(~known)[0]
+    if len(new):
+        rows = np.clip(0.5 * (1. - unit[new] @ unit.T), 0., 1.)
+        distances[new] = rows
+        distances[:, new] = rows.T
+    if np.any(known):
+        old = [selection['names'].index(name) for name in np.array(names)[known]]
+        distances[np.ix_(known, known)] = selection['distances'][np.ix_(old, old)]
+    np.fill_diagonal(distances, 0.)
+
+    selection['fingerprints'] = {name: fingerprints[i] for i, name in enumerate(names) if name}
+    selection['names'] = names
+    selection['distances'] = distances
+    return distances
+
+def select_parents(population, n_parents, selection=None, distances=None, chosen=None):
+    """
+    Selects the parents of a new individual from the population sorted from the lowest to the highest energy.
+    In the uniform mode the parents are drawn with equal probability. In the diverse mode each parent is drawn
+    with the probability proportional to the score (1 - weight) * rank_score + weight * distance_score,
+    where rank_score falls linearly from 1 for the best structure to 0 for the worst one and distance_score
+    is the distance from the closest parent already selected in the generation (or for the same individual),
+    relative to the largest such distance. When all structures have been selected, the selected
+    parents are forgotten and a new round begins.
+
+    Args:
+        population (Population): The sorted population.
+        n_parents (int): Number of the parents (1 for mutation, 2 for crossover).
+        selection (dict, optional): The parent selection settings created by init_selection.
+        distances (np.array, optional): The distance matrix returned by get_distance_matrix.
+        chosen (list, optional): Indexes of the parents already selected in the generation (extended in place).
+
+    Returns:
+        list: Indexes of the parents.
+    """
+    n = len(population)
+    if selection is None or selection['mode'] == 'uniform' or distances is None:
+        if n_parents == 1:
+            return [random.randrange(n)]
+        return random.sample(range(n), n_parents)
+
+    if chosen is None:
+        chosen = []
+    if len(set(chosen)) >= n:
+        chosen.clear()
+
+    rank_score = 1. - np.arange(n) / max(n - 1, 1)
+    parents = []
+    for _ in range(n_parents):
+        reference = chosen + parents
+        if reference:
+            distance_score = np.min(distances[:, reference], axis=1)
+            distance_score = distance_score / distance_score.max() if distance_score.max() > 0 else distance_score
+        else:
+            distance_score = np.ones(n)
+        score = (1. - selection['weight']) * rank_score + selection['weight'] * distance_score
+        # Small score keeps every structure possible to draw, the parents of the individual are excluded
+        score = score + 1E-6
+        score[parents] = 0.
+        parents.append(random.choices(range(n), weights=score)[0])
+    chosen.extend(parents)
+    return parents
@@ -1,11 +1,17 @@
 """
-The module contains a function 'get_r', 'calc_distance', 'second_part', 'get_rand_xyz' and 'get_image_positions' -
-small functions used in other modules.
+The module contains a function 'get_r', 'get_rand_xyz', 'build_cell_list', 'get_bin', 'add_to_cell_list',
+'get_neighbour_candidates', 'get_max_collision_distance', 'get_interlayer_indexes', 'check_collision',
+'find_collisions', 'unique_positions', 'get_interlayer_sites' and 'get_parent_distance' - small functions
+used in other modules. All geometry functions work for any cell shape and take the periodic images
+into account with the minimum image convention.
 """
 
+import math
 import numpy as np
 from ase import Atoms
 from ase.data import covalent_radii
+from ase.geometry import get_distances, wrap_positions
+from ase.neighborlist import neighbor_list
 import random
 
 def get_r(atomic_number):
@@ -21,95 +27,264 @@ def get_r(atomic_number):
     tmp_r = 0.9 * covalent_radii[atomic_number]
     return tmp_r
 
-def calc_distance(atom1, atom2):
+def get_rand_xyz(cell):
     """
-    Calculate the distance between two atoms.
+    Returns a random xyz coordinates lying in the plane between the layers (at half the height of the cell).
+    The coordinates are drawn in fractional coordinates, so any cell shape is supported.
 
     Args:
-        atom1 (ase.Atom): The first atom.
-        atom2 (ase.Atom): The second atom.
+        cell (ase.Cell): The cell object.
 
     Returns:
-        float: The distance between atom1 and atom2.
+        np.array: The random xyz coordinates.
     """
-    tmp_d = np.linalg.norm(atom1.position - atom2.position)
-    return tmp_d
+    tmp_xyz = np.array([random.random(), random.random(), 0.]) @ cell
+    tmp_xyz[2] = cell.cellpar()[2] / 2
+    return tmp_xyz
 
-def second_part(parent, part):
+def build_cell_list(structure, cutoff):
     """
-    Returns atoms from the parent structure that are not in the part object.
-    Function used in the crossover module.
+    Bins the atoms of the structure into a 2D grid of cells spanned by the in-plane lattice vectors.
+    Each cell of the grid is at least cutoff wide, so the neighbours of a point within the cutoff lie
+    in the 3x3 block of cells around it. The cell list is used by check_collision.
 
     Args:
-        parent (ase.Atoms): The parent structure.
-        part (ase.Atoms): The part object.
+        structure (ase.Atoms): The structure.
+        cutoff (float): The largest distance that will be checked.
 
     Returns:
-        ase.Atoms: The structure with atoms from the parent object that are not in the part object.
-    """
-    tmp_second_part = Atoms()
-    tmp_second_part.set_cell(parent.cell)
-    for parent_atom in parent:
-        found = False
-        for part_atom in part:
-            if np.allclose(parent_atom.position, part_atom.position, atol=1e-4):
-                found = True
-                break
-        if not found:
-            tmp_second_part.append(parent_atom)
-    return tmp_second_part
+        dict: The dictionary describing the cell list.
+    """
+    cell = structure.get_cell()
+    # Distances between the opposite faces of the unit cell
+    heights = cell.volume / np.linalg.norm(np.cross(cell[[1, 0]], cell[2]), axis=1)
+    cell_list = {'cell': cell,
+                 'n_bins': np.maximum(1, np.floor(heights / cutoff)).astype(int),
+                 'bins': {}}
+    for index, position in enumerate(structure.positions):
+        add_to_cell_list(cell_list, index, position)
+    return cell_list
 
-def get_rand_xyz(cell):
+def get_bin(cell_list, position):
+    """
+    Returns the cell of the cell list containing the given position.
+
+    Args:
+        cell_list (dict): The cell list created by build_cell_list.
+        position (np.array): The xyz coordinates.
+
+    Returns:
+        tuple: The indexes of the cell along the first and the second lattice vector.
     """
-    Returns a random xyz coordinates in appropriate ranges depending on the cell size.
+    fractional = cell_list['cell'].scaled_positions(np.array([position]))[0, :2] % 1.0
+    tmp_bin = np.floor(fractional * cell_list['n_bins']).astype(int) % cell_list['n_bins']
+    return tuple(tmp_bin)
+
+def add_to_cell_list(cell_list, index, position):
+    """
+    Adds an atom to the cell list.
+
+    Args:
+        cell_list (dict): The cell list created by build_cell_list.
+        index (int): The index of the atom in the structure.
+        position (np.array): The xyz coordinates of the atom.
+
+    Returns:
+        None: The function does not return a value.
+    """
+    cell_list['bins'].setdefault(get_bin(cell_list, position), []).append(index)
+
+def get_neighbour_candidates(cell_list, position):
+    """
+    Returns the indexes of atoms from the cells of the cell list neighbouring the given position.
 
     Args:
+        cell_list (dict): The cell list created by build_cell_list.
+        position (np.array): The xyz coordinates.
+
+    Returns:
+        list: The indexes of atoms that may lie within the cutoff from the position.
+    """
+    n_a, n_b = cell_list['n_bins']
+    i, j = get_bin(cell_list, position)
+    shifts_a = {(i + di) % n_a for di in (-1, 0, 1)}
+    shifts_b = {(j + dj) % n_b for dj in (-1, 0, 1)}
+    tmp_indexes = []
+    for bin_a in shifts_a:
+        for bin_b in shifts_b:
+            tmp_indexes.extend(cell_list['bins'].get((bin_a, bin_b), []))
+    return tmp_indexes
+
+def get_max_collision_distance(atomic_numbers, tol_r=0.1):
+    """
+    Returns the largest distance at which two atoms of the given elements are still treated as colliding.
+
+    Args:
+        atomic_numbers (iterable): The atomic numbers of the elements.
+        tol_r (float): Tolerance used when checking the distance between atoms.
+
+    Returns:
+        float: The largest collision distance.
+    """
+    return 2 * max(get_r(number) for number in set(atomic_numbers)) + tol_r
+
+def get_interlayer_indexes(structure):
+    """
+    Returns the indexes of atoms lying between the layers. The atoms are recognized by their tag (1),
+    or, if the structure has no tags, by their height (half the height of the cell).
+
+    Args:
+        structure (ase.Atoms): The structure.
+
+    Returns:
+        list: The indexes of atoms lying between the layers.
+    """
+    tags = structure.get_tags()
+    if np.any(tags == 1):
+        return np.nonzero(tags == 1)[0].tolist()
+
+    c_half = structure.cell.cellpar()[2] / 2
+    tmp_indexes = [atom.index for atom in structure if math.isclose(atom.position[2], c_half, abs_tol=1E-1)]
+    return tmp_indexes
+
+def check_collision(structure, position, atomic_number, skip=(), tol_r=0.1, cell_list=None):
+    """
+    Checks whether an atom placed at the given position collides with the atoms of the structure
+    or with their periodic images (minimum image convention). If a cell list is given,
+    only the atoms from the neighbouring cells of the cell list are checked.
+
+    Args:
+        structure (ase.Atoms): The structure.
+        position (np.array): The xyz coordinates of the checked atom.
+        atomic_number (int): The atomic number of the checked atom.
+        skip (iterable): Indexes of atoms in the structure that are not checked.
+        tol_r (float): Tolerance used when checking the distance between atoms.
+        cell_list (dict, optional): The cell list of the structure created by build_cell_list.
+
+    Returns:
+        bool: True if the atom collides with the structure.
+    """
+    mask = np.zeros(len(structure), dtype=bool)
+    if cell_list is None:
+        mask[:] = True
+    else:
+        mask[get_neighbour_candidates(cell_list, position)] = True
+    mask[list(skip)] = False
+    if not mask.any():
+        return False
+
+    _, d = get_distances(position, structure.positions[mask], cell=structure.cell, pbc=structure.pbc)
+    min_d = 0.9 * covalent_radii[structure.numbers[mask]] + get_r(atomic_number) + tol_r
+    return bool(np.any(d[0] < min_d))
+
+def find_collisions(structure, tol_r=0.1, indexes=None, scale=0.9):
+    """
+    Returns all pairs of colliding atoms in the structure, including collisions with periodic images.
+    The neighbour search uses the linear-scaling neighbour list from ASE and the collision distance
+    is set separately for each pair from the radii of both atoms.
+
+    Args:
+        structure (ase.Atoms): The structure.
+        tol_r (float): Tolerance used when checking the distance between atoms.
+        indexes (iterable, optional): Indexes of the checked atoms - if given, only the pairs
+            including at least one of them are returned.
+        scale (float): Fraction of the covalent radius used as the radius of an atom (0.9 as in get_r).
+
+    Returns:
+        list: The (i, j) pairs of indexes of colliding atoms (i <= j).
+    """
+    if len(structure) == 0:
+        return []
+
+    radii = scale * covalent_radii[structure.numbers]
+    cutoff = 2 * np.max(radii) + tol_r
+    i, j, d = neighbor_list('ijd', structure, cutoff)
+    min_d = radii[i] + radii[j] + tol_r
+    colliding = (d < min_d) & (i <= j)
+    if indexes is not None:
+        checked = np.zeros(len(structure), dtype=bool)
+        checked[list(indexes)] = True
+        colliding &= checked[i] | checked[j]
+    return list(zip(i[colliding].tolist(), j[colliding].tolist()))
+
+def unique_positions(positions, cell, pbc, tol=0.1):
+    """
+    Returns the positions wrapped into the cell without duplicates (including periodic images).
+
+    Args:
+        positions (np.array): The xyz coordinates.
         cell (ase.Cell): The cell object.
+        pbc (list): Periodic boundary conditions.
+        tol (float): Distance below which two positions are treated as the same.
 
     Returns:
-        np.array: The random xyz coordinates.
+        np.array: The unique positions.
+    """
+    positions = wrap_positions(positions, cell, pbc)
+    cell_list = build_cell_list(Atoms(cell=cell, pbc=pbc), tol)
+    keep = []
+    for i, position in enumerate(positions):
+        candidates = get_neighbour_candidates(cell_list, position)
+        if candidates:
+            _, d = get_distances(position, positions[candidates], cell=cell, pbc=pbc)
+            if np.any(d < tol):
+                continue
+        keep.append(i)
+        add_to_cell_list(cell_list, i, position)
+    return positions[keep]
+
+def get_interlayer_sites(structure):
+    """
+    Returns the high-symmetry sites between the layers: the sites above the atoms of the layers
+    and the hollow sites obtained by reflecting these positions through their nearest in-plane neighbours.
+
+    Args:
+        structure (ase.Atoms): The structure.
+
+    Returns:
+        np.array: The xyz coordinates of the sites at half the height of the cell.
+    """
+    cell = structure.get_cell()
+    pbc = structure.pbc
+    c_half = cell.cellpar()[2] / 2
+    interlayer_indexes = get_interlayer_indexes(structure)
+
+    # Projections of the atoms from the layers onto the plane between the layers
+    layer_mask = np.ones(len(structure), dtype=bool)
+    layer_mask[interlayer_indexes] = False
+    projections = structure.positions[layer_mask].copy()
+    projections[:, 2] = c_half
+    projections = Atoms(positions=unique_positions(projections, cell, pbc), cell=cell, pbc=pbc)
+
+    # Nearest-neighbour distance between the projections
+    cutoff = 2.0
+    i, j, d, D = neighbor_list('ijdD', projections, cutoff)
+    while len(d) == 0:
+        cutoff *= 2
+        i, j, d, D = neighbor_list('ijdD', projections, cutoff)
+    nearest = d < 1.1 * np.min(d)
+
+    # Hollow sites - projections reflected through their nearest neighbours
+    hollow = projections.positions[i[nearest]] - D[nearest]
+
+    return unique_positions(np.vstack([projections.positions, hollow]), cell, pbc)
+
+def get_parent_distance(positions, parents_positions, cell, pbc):
+    """
+    Returns the distance of the structure from its closest parent: the largest distance between an atom
+    between the layers of the structure and the nearest atom between the layers of the parent.
+
+    Args:
+        positions (np.array): The xyz coordinates of atoms between the layers of the structure.
+        parents_positions (list): The xyz coordinates of atoms between the layers of each parent.
+        cell (ase.Cell): The cell object.
+        pbc (list): Periodic boundary conditions.
+
+    Returns:
+        float: The distance from the closest parent.
     """
-    array = cell.cellpar()
-    a = array[0]  # wymiar w kierunku osi x
-    b = array[1]
-    c = array[2]  # wymiar w kierunku osi z
-    b_y = b * np.sqrt(3) / 2  # skladowa wektora b w kierunku y
-
-    y0 = 0  #zakres dozwolonych wartosci y
-    y1 = b_y
-    tmp_y = random.uniform(y0, y1)
-    x_prim = tmp_y * np.sqrt(3) / 3
-    x0 = 0 - x_prim  #zakres dozwolonych wartosci x
-    x1 = a - x_prim
-    tmp_x = random.uniform(x0, x1)
-    tmp_z = c / 2 #wartosc z
-
-    return np.array([tmp_x, tmp_y, tmp_z])
-
-def get_image_positions(cell, atom):
-    """
-        Returns the positions of atomic images based on the size of the cell.
-
-        Args:
-            cell (ase.Cell): The cell object.
-            atom (ase.Atom): The atom object.
-
-        Returns:
-            np.array: The positions of atom images based on the size of the cell.
-    """
-    array = cell.cellpar()
-    a = array[0]  # Dimension in the x-axis direction
-    b = array[1]
-    b_y = b * np.sqrt(3) / 2  # Component b in the y direction
-    b_x = b / 2  # Component b in the x direction
-
-    tmp_image_positions = [atom.position,
-                           atom.position + np.array([a, 0., 0.]),
-                           atom.position + np.array([2 * a, 0., 0.]),
-                           atom.position + np.array([-b_x, b_y, 0.]),
-                           atom.position + np.array([a - b_x, b_y, 0.]),
-                           atom.position + np.array([2 * a - b_x, b_y, 0.]),
-                           atom.position + np.array([-2 * b_x, 2 * b_y, 0.]),
-                           atom.position + np.array([a - 2 * b_x, 2 * b_y, 0.]),
-                           atom.position + np.array([2 * a - 2 * b_x, 2 * b_y, 0.])]
-    return tmp_image_positions
+    distances = []
+    for parent_positions in parents_positions:
+        _, d = get_distances(positions, parent_positions, cell=cell, pbc=pbc)
+        distances.append(np.max(np.min(d, axis=1)))
+    return float(min(distances))
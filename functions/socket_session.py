@@ -0,0 +1,109 @@
+"""
+The module contains a class 'SiestaSession' that keeps a SIESTA process connected through the i-PI socket
+interface of ASE, so that many structures can be relaxed by a Python-side optimizer in one warmed-up process.
+"""
+
+import os
+from pathlib import Path
+from ase.calculators.socketio import SocketIOCalculator
+from functions.pre_relax import OPTIMIZERS
+
+# fdf arguments turning SIESTA into a client of the i-PI socket server
+MASTER_ARGUMENTS = {'MD.TypeOfRun': 'Master',
+                    'Master.code': 'i-pi',
+                    'Master.interface': 'socket',
+                    'Master.socketType': 'unix'}
+
+class SiestaSession:
+    """
+    Long-lived SIESTA worker process driven through the i-PI socket interface of ASE. The process is started
+    with the first relaxed structure in its own directory and reused by the next structures, so the MPI startup,
+    the basis and pseudopotential setup and the grid initialization are paid once. The structures are relaxed
+    by an ASE optimizer, which obeys the constraints of the structures (see constraints.set_layer_constraint).
+    All structures relaxed in one session must have the same atoms and cell - only the positions may change
+    between them.
+
+    Attributes:
+        calc (ase.Calculator): The SIESTA calculator whose settings are used by the worker.
+        label (str): Label assigned to the calculator files (e.g., MoS2).
+        directory (str): Directory in which the worker is run.
+        unixsocket (str): Name of the unix socket.
+        optimizer (str): Name of the ASE optimizer (FIRE or BFGS).
+        fmax (float): Force convergence criterion of the optimizer.
+        steps (int): Maximum number of optimizer steps.
+        max_structures (int): Number of structures after which the worker is restarted (0 - never).
+        timeout (float): Time (s) after which a silent worker is treated as failed.
+        n_structures (int): Number of structures relaxed by the current worker.
+    """
+
+    def __init__(self, calc, label, directory='siesta_session', unixsocket=None, optimizer='BFGS', fmax=0.1,
+                 steps=250, max_structures=0, timeout=3600.):
+        if optimizer not in OPTIMIZERS:
+            raise ValueError(f'Unknown optimizer: {optimizer}')
+        self.calc = calc
+        self.label = label
+        self.directory = os.path.abspath(directory)
+        self.unixsocket = unixsocket or f'tmdalgen_{os.getpid()}'
+        self.optimizer = optimizer
+        self.fmax = fmax
+        self.steps = steps
+        self.max_structures = max_structures
+        self.timeout = timeout
+        self.n_structures = 0
+        self.socket_calc = None
+
+    def start(self):
+        """
+        Creates the socket calculator. The SIESTA process itself is launched by ASE with the first calculation.
+        """
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        parameters = {key: value for key, value in self.calc.parameters.items() if key not in ('atoms', 'restart')}
+        parameters['label'] = f'{self.directory}/{self.label}'
+        parameters['fdf_arguments'] = {**parameters.get('fdf_arguments', {}), **MASTER_ARGUMENTS,
+                                       'Master.address': self.unixsocket}
+        worker = self.calc.__class__(**parameters)
+        self.socket_calc = SocketIOCalculator(worker, unixsocket=self.unixsocket, timeout=self.timeout)
+        self.n_structures = 0
+
+    def close(self):
+        """
+        Stops the SIESTA process and closes the socket.
+        """
+        if self.socket_calc is not None:
+            self.socket_calc.close()
+            self.socket_calc = None
+
+    def relax(self, struct):
+        """
+        Relaxes the structure in the worker process. If the calculation fails, the worker is stopped
+        and a new one is started with the next structure.
+
+        Args:
+            struct (ase.Atoms): Structure to be relaxed (modified in place).
+
+        Returns:
+            tuple: The potential energy and the number of optimizer steps.
+        """
+        if self.socket_calc is None or (self.max_structures > 0 and self.n_structures >= self.max_structures):
+            self.close()
+            self.start()
+
+        struct.calc = self.socket_calc
+        try:
+            opt = OPTIMIZERS[self.optimizer](struct, logfile=None)
+            opt.run(fmax=self.fmax, steps=self.steps)
+            pot_energy = struct.get_potential_energy()
+        except Exception:
+            self.close()
+            raise
+        finally:
+            struct.calc = None
+            struct.set_constraint()
+        self.n_structures += 1
+        return pot_energy, opt.get_number_of_steps()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
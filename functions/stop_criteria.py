@@ -0,0 +1,109 @@
+"""
+The module contains functions 'init_budget', 'budget_exhausted', 'get_energy_stats', 'is_converged'
+and 'write_summary' - functions used to stop the algorithm before all generations are computed.
+"""
+
+import time
+import numpy as np
+
+def init_budget(max_evaluations=0, max_wall_time=0):
+    """
+    Creates the compute budget of the run. The budget is shared by all generations
+    and counts the DFT evaluations started so far. Both limits are soft - they are checked
+    only before a new evaluation is started (see budget_exhausted).
+
+    Args:
+        max_evaluations (int): Maximum number of DFT evaluations in the run (0 - no limit).
+        max_wall_time (float): Wall-time budget of the run in hours, after which no new evaluation
+            is started (0 - no limit).
+
+    Returns:
+        dict: The dictionary describing the compute budget.
+    """
+    budget = {'max_evaluations': max_evaluations,
+              'max_wall_time': max_wall_time * 3600,
+              'start_time': time.time(),
+              'n_evaluations': 0}
+    return budget
+
+def budget_exhausted(budget):
+    """
+    Checks whether the compute budget of the run has been used up. The check is made only between
+    the evaluations, so a relaxation started before the wall-time limit is not interrupted
+    and the run may end later than max_wall_time.
+
+    Args:
+        budget (dict): The compute budget created by init_budget or None.
+
+    Returns:
+        bool: True if no new DFT evaluation should be started.
+    """
+    if budget is None:
+        return False
+    if 0 < budget['max_evaluations'] <= budget['n_evaluations']:
+        return True
+    if 0 < budget['max_wall_time'] <= time.time() - budget['start_time']:
+        return True
+    return False
+
+def get_energy_stats(population):
+    """
+    Returns the lowest and the mean energy of the population together with its best structure.
+
+    Args:
+        population (Population): The population (e.g., returned by prep_generation).
+
+    Returns:
+        tuple: The lowest energy, the mean energy and the structure with the lowest energy.
+    """
+    best = int(np.argmin(population.energies))
+    return np.min(population.energies), np.mean(population.energies), population.to_atoms(best)
+
+def is_converged(history, stall_generations, tol_best, tol_mean):
+    """
+    Checks whether the lowest and the mean energy of the population have not changed by more than
+    the given tolerances for the last stall_generations generations.
+
+    Args:
+        history (list): List of (min, mean) energies of the completed generations.
+        stall_generations (int): Length of the stall window (0 - criterion disabled).
+        tol_best (float): Tolerance for the change of the lowest energy.
+        tol_mean (float): Tolerance for the change of the mean energy.
+
+    Returns:
+        bool: True if the algorithm has converged.
+    """
+    if stall_generations <= 0 or len(history) <= stall_generations:
+        return False
+
+    window = np.array(history[-(stall_generations + 1):])
+    best_change = np.ptp(window[:, 0])
+    mean_change = np.ptp(window[:, 1])
+    return best_change <= tol_best and mean_change <= tol_mean
+
+def write_summary(filename, history, budget, reason, best_struct=None):
+    """
+    Writes the final summary of the run to a .txt file.
+
+    Args:
+        filename (str): The name of the output file.
+        history (list): List of (min, mean) energies of the completed generations.
+        budget (dict): The compute budget of the run.
+        reason (str): The reason why the run was stopped.
+        best_struct (ase.Atoms, optional): The structure with the lowest energy found in the run.
+
+    Returns:
+        None: The function does not return a value.
+    """
+    wall_time = time.time() - budget['start_time']
+    with open(filename, 'w') as file:
+        file.write(f'Stop reason: {reason}\n')
+        file.write(f'Completed generations: {len(history)}\n')
+        file.write(f'DFT evaluations: {budget["n_evaluations"]}\n')
+        file.write(f'Wall time [h]: {np.round(wall_time / 3600, 4)}\n')
+        if best_struct is not None:
+            file.write(f'Best energy: {best_struct.info["pot_energy"]}\n')
+        file.write('\n')
+        file.write('Generation\tMin\tMean\n')
+        for i, (e_min, e_mean) in enumerate(history):
+            file.write(f'{i}\t{np.round(e_min, 4)}\t{np.round(e_mean, 4)}\n')
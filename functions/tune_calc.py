@@ -0,0 +1,138 @@
+"""
+The module contains a function 'tune_calc' that finds the cheapest settings of the SIESTA calculator
+reproducing the energy differences between structures, and functions 'single_point', 'write_tune_report'
+and 'write_calc_profile' used by it.
+"""
+
+import os
+import time
+import itertools
+import numpy as np
+from pathlib import Path
+from functions.calculator import get_calc, DEFAULT_PROFILE
+
+def tune_calc(structures, mag_moment, label, kpts_grid, cutoff_grid, dm_tolerance_grid, tol, folder='tune'):
+    """
+    Runs single-point calculations of the given structures for all combinations of the k-point meshes,
+    mesh cutoffs and SCF tolerances. The settings with the densest k-point mesh, the highest cutoff
+    and the lowest tolerance are the reference. The error of a setting is the largest deviation of the energy
+    differences between the structures (relative to the first structure) from the reference ones;
+    for a single structure, the deviation of its energy is used. The cheapest setting is the one
+    with the shortest total time of the calculations among the settings with the error not larger than tol.
+    Each calculation is run in the folder folder/k{kpts}_c{cutoff}_d{tolerance}/s{index}.
+
+    Args:
+        structures (list): Representative structures (ase.Atoms) with atoms between the layers marked with tag 1.
+        mag_moment (float): Initial magnetic moment assigned to atoms between layers.
+        label (str): Label assigned to the calculator files (e.g., MoS2).
+        kpts_grid (list): Numbers of k-points along each in-plane direction.
+        cutoff_grid (list): Mesh cutoffs in Ry.
+        dm_tolerance_grid (list): Tolerances of the density matrix (DM.Tolerance).
+        tol (float): Tolerance (eV) of the energy differences.
+        folder (str): Folder in which the calculations are run.
+
+    Returns:
+        tuple: The list of results (dict for each setting) and the profile of the cheapest setting
+            (dict, None if no setting meets the tolerance).
+    """
+    original_directory = os.getcwd()
+    results = []
+    for kpts, mesh_cutoff, dm_tolerance in itertools.product(sorted(kpts_grid), sorted(cutoff_grid),
+                                                             sorted(dm_tolerance_grid, reverse=True)):
+        profile = {'kpts': kpts, 'mesh_cutoff': mesh_cutoff, 'dm_tolerance': dm_tolerance}
+        energies = []
+        start = time.perf_counter()
+        for i, struct in enumerate(structures):
+            folder_path = Path(folder) / f'k{kpts}_c{mesh_cutoff}_d{dm_tolerance}' / f's{i}'
+            folder_path.mkdir(parents=True, exist_ok=True)
+            os.chdir(folder_path)
+            try:
+                energies.append(single_point(struct, mag_moment, label, profile))
+            except Exception as e:
+                print(f'Failed single point of s{i} with {profile}. Error: {e}')
+                energies.append(np.nan)
+            finally:
+                os.chdir(original_directory)
+        profile['time'] = time.perf_counter() - start
+        profile['energies'] = np.array(energies)
+        results.append(profile)
+        print(f'kpts = {kpts}, mesh_cutoff = {mesh_cutoff} Ry, dm_tolerance = {dm_tolerance}: '
+              f'{profile["time"]:.1f} s')
+
+    # The most accurate setting is the reference
+    reference = max(results, key=lambda r: (r['kpts'], r['mesh_cutoff'], -r['dm_tolerance']))
+    for result in results:
+        if len(structures) > 1:
+            error = (result['energies'] - result['energies'][0]) - (reference['energies'] - reference['energies'][0])
+        else:
+            error = result['energies'] - reference['energies']
+        result['error'] = float(np.max(np.abs(error))) if not np.any(np.isnan(error)) else np.inf
+        result['ok'] = bool(result['error'] <= tol)
+
+    passed = [result for result in results if result['ok']]
+    best = None
+    if passed:
+        cheapest = min(passed, key=lambda r: r['time'])
+        best = {key: cheapest[key] for key in DEFAULT_PROFILE}
+    return results, best
+
+def single_point(struct, mag_moment, label, profile):
+    """
+    Calculates the energy of the structure without relaxation in the current working directory.
+
+    Args:
+        struct (ase.Atoms): The structure.
+        mag_moment (float): Initial magnetic moment assigned to atoms between layers.
+        label (str): Label assigned to the calculator files (e.g., MoS2).
+        profile (dict): Settings of the calculator (see calculator.get_calc).
+
+    Returns:
+        float: The potential energy.
+    """
+    struct = struct.copy()
+    struct.set_initial_magnetic_moments(np.where(struct.get_tags() == 1, mag_moment, 0.))
+    calc = get_calc(label, profile)
+    calc.parameters['fdf_arguments']['MD.NumCGsteps'] = 0
+    struct.calc = calc
+    return struct.get_potential_energy()
+
+def write_tune_report(filename, results, tol, best):
+    """
+    Writes the time and the error of each setting to a text file.
+
+    Args:
+        filename (str): Name of the output file.
+        results (list): The results returned by tune_calc.
+        tol (float): Tolerance (eV) of the energy differences.
+        best (dict): The cheapest setting or None.
+
+    Returns:
+        None: The function does not return a value.
+    """
+    with open(filename, 'w') as f:
+        f.write(f'{"kpts":>6}{"cutoff (Ry)":>14}{"DM.Tolerance":>14}{"time (s)":>12}{"error (eV)":>14}  ok\n')
+        for r in sorted(results, key=lambda r: r['time']):
+            f.write(f'{r["kpts"]:>6}{r["mesh_cutoff"]:>14}{r["dm_tolerance"]:>14}{r["time"]:>12.1f}'
+                    f'{r["error"]:>14.5f}  {"yes" if r["ok"] else "no"}\n')
+        if best is None:
+            f.write(f'\nNo setting reproduces the reference energy differences within {tol} eV.\n')
+        else:
+            f.write(f'\nCheapest setting within {tol} eV: kpts = {best["kpts"]}, '
+                    f'mesh_cutoff = {best["mesh_cutoff"]} Ry, dm_tolerance = {best["dm_tolerance"]}\n')
+
+def write_calc_profile(filename, profile):
+    """
+    Writes the calculator profile in the format of the input file, so it can be read with load_config.
+
+    Args:
+        filename (str): Name of the profile file.
+        profile (dict): Settings of the calculator (see calculator.get_calc).
+
+    Returns:
+        None: The function does not return a value.
+    """
+    with open(filename, 'w') as f:
+        f.write(f'{"kpts = " + str(profile["kpts"]):<32}# (int) Number of k-points along each in-plane direction.\n')
+        f.write(f'{"mesh_cutoff = " + str(profile["mesh_cutoff"]):<32}# (float) Mesh cutoff in Ry.\n')
+        f.write(f'{"dm_tolerance = " + str(profile["dm_tolerance"]):<32}# (float) Tolerance of the density '
+                f'matrix (DM.Tolerance).\n')
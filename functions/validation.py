@@ -0,0 +1,60 @@
+"""
+The module contains a function 'validate_struct' that checks a candidate structure before the DFT calculation
+and functions 'count_rejection' and 'format_rejection_stats' that count and describe the rejected candidates.
+"""
+
+from functions.small_functions import find_collisions, get_interlayer_indexes
+
+# Maximum number of rejected structures of a single candidate, after which the last structure is kept
+# and rejected again by relax_struct (as a 'geometry' failure) without starting the calculation
+MAX_REJECTIONS = 100
+
+# Fraction of the covalent radii used as the radii of atoms by the validation. The gate is well below the bonding
+# distances (e.g., 1.91 A for Mo-S with the tolerance), so the atoms inherited from a relaxed parent at a bonding
+# distance are not rejected - the stricter distance of small_functions.get_r is used only by the operators
+# when an atom is placed or moved
+GATE_SCALE = 0.7
+
+def validate_struct(structure, tol_r=0.1):
+    """
+    Checks the structure with a single vectorized pass over all pairs of atoms within the collision distance
+    (see small_functions.find_collisions), with the periodic images taken into account (minimum image convention)
+    and the collision distance of each pair set from the covalent radii of both elements scaled by GATE_SCALE.
+    Only the pairs including an atom between the layers are checked, as the atoms of the layers come from
+    the input structure.
+
+    Args:
+        structure (ase.Atoms): The structure.
+        tol_r (float): Tolerance used when checking the distance between atoms.
+
+    Returns:
+        list: The (i, j) pairs of indexes of colliding atoms (empty if the structure is valid).
+    """
+    return find_collisions(structure, tol_r, get_interlayer_indexes(structure), GATE_SCALE)
+
+def count_rejection(rejections, structure):
+    """
+    Counts a rejected structure under the operator that created it (atoms.info['operator']).
+
+    Args:
+        rejections (dict): Number of rejected structures of each operator (modified in place).
+        structure (ase.Atoms): The rejected structure.
+
+    Returns:
+        None: The function does not return a value.
+    """
+    operator = structure.info.get('operator', 'unknown')
+    rejections[operator] = rejections.get(operator, 0) + 1
+
+def format_rejection_stats(rejections):
+    """
+    Describes the rejected structures of a generation aggregated by finish_generation.
+
+    Args:
+        rejections (dict): Number of rejected structures of each operator.
+
+    Returns:
+        str: The description (e.g., 'Rejected before the calculation: crossover 3, mutation 1').
+    """
+    parts = [f'{operator} {count}' for operator, count in sorted(rejections.items())]
+    return 'Rejected before the calculation: ' + ', '.join(parts)
@@ -1,10 +1,19 @@
 # ==================================================
 # Imports
 # ==================================================
+from ase import io
 from functions.gen_random_pop import gen_random_pop
+from functions.prep_struct import prep_struct
+from functions.enumerate_structs import enumerate_structs
+from functions.seed_population import seed_population
 from functions.prep_generation import prep_generation
-from functions.calculator import get_calc
+from functions.calculator import get_calc, load_calc_profile
 from functions.load_config import load_config
+from functions.stop_criteria import init_budget, get_energy_stats, is_converged, write_summary
+from functions.metrics import init_metrics, print_profile
+from functions.socket_session import SiestaSession
+from functions.selection import init_selection
+from functions.mutation import check_mutation_kinds
 
 # ==================================================
 # Loading algorithm parameters from the input file
@@ -24,21 +33,135 @@ atom_symbol = config['atom_symbol']
 mag_moment = config['mag_moment']
 label = config['label']
 
+# File with the calculator settings found by tune.py (none - the default settings of get_calc)
+calc_profile = str(config.get('calc_profile', 'none'))
+
+# Kinds of mutation (e.g., random,displace,hop,shift) and the maximum displacement in the local kinds
+mut_kinds = str(config.get('mut_kinds', 'random')).split(',')
+mut_step = float(config.get('mut_step', 0.5))
+
+# Parent selection - uniform or balancing the energy rank against the distance from the already selected parents
+parent_selection = str(config.get('parent_selection', 'uniform'))
+diversity_weight = float(config.get('diversity_weight', 0.5))
+
+# Initial population - random structures or all symmetry-unique arrangements on the high-symmetry sites
+init_mode = str(config.get('init_mode', 'random'))
+enum_rank = str(config.get('enum_rank', 'pair'))
+enum_max_structs = config.get('enum_max_structs', 0)
+
+# Files of previous runs whose best structures seed the initial population (none - disabled)
+seed_files = str(config.get('seed_files', 'none'))
+seed_max_structs = config.get('seed_max_structs', 0)
+
+# Options of the relaxation of a single structure (see relax_struct)
+relax_options = {'pre_relax': str(config.get('pre_relax', 'none')),
+                 'pre_relax_fmax': float(config.get('pre_relax_fmax', 0.05)),
+                 'pre_relax_steps': config.get('pre_relax_steps', 200),
+                 'layer_constraint': str(config.get('layer_constraint', 'none'))}
+
+# Relaxation in separate SIESTA CG runs (standard) or in a long-lived SIESTA process driven through
+# the i-PI socket interface by an ASE optimizer (socket)
+siesta_mode = str(config.get('siesta_mode', 'standard'))
+socket_optimizer = str(config.get('socket_optimizer', 'BFGS'))
+socket_fmax = float(config.get('socket_fmax', 0.1))
+socket_steps = config.get('socket_steps', 250)
+socket_restart = config.get('socket_restart', 0)
+
+# Number of candidates created in advance in a background thread while SIESTA is running (0 - disabled)
+prefetch = config.get('prefetch', 0)
+
+# Optional stopping criteria (0 - criterion disabled)
+stall_generations = config.get('stall_generations', 0)
+stall_tol_best = float(config.get('stall_tol_best', 0.001))
+stall_tol_mean = float(config.get('stall_tol_mean', 0.01))
+max_evaluations = config.get('max_evaluations', 0)
+max_wall_time = float(config.get('max_wall_time', 0))
+
+# Metrics file with the time spent in each stage (none - disabled) and printing of the stage times
+metrics_file = str(config.get('metrics_file', 'metrics.jsonl'))
+profile = config.get('profile', 0)
+
 # ==================================================
 # The main logic of the program
 # ==================================================
 def main():
+    # Checking the kinds of mutation before any calculation is started
+    check_mutation_kinds(mut_kinds)
+
     # Setting the calculator used for calculations
-    calc = get_calc(label)
+    calc = get_calc(label, load_calc_profile(calc_profile) if calc_profile != 'none' else None,
+                    relax_options['layer_constraint'])
+
+    # Long-lived SIESTA process shared by all relaxations
+    session = None
+    if siesta_mode == 'socket':
+        session = SiestaSession(calc, label, optimizer=socket_optimizer, fmax=socket_fmax, steps=socket_steps,
+                                max_structures=socket_restart)
+        relax_options['session'] = session
+
+    # Parent selection settings with the fingerprints cached between the generations
+    selection = init_selection(parent_selection, diversity_weight)
+
+    # Compute budget shared by all generations
+    budget = init_budget(max_evaluations, max_wall_time)
+    # Metrics collector writing the times of the stages to the metrics file
+    metrics = None
+    if metrics_file != 'none':
+        metrics = init_metrics(metrics_file, print_profile if profile else None)
+    # Lowest and mean energy of each completed generation
+    history = []
+    best_struct = None
+    stop_reason = f'All {n_generations} generations computed'
+
+    try:
+        # Generating the initial population
+        structures = []
+        reused = []
+        init_size = pop_size
+        template = prep_struct(struct_filename, size)
+        if seed_files != 'none':
+            reused, structures = seed_population(seed_files.split(','), template, atom_symbol, n_atoms, calc, 'pop0',
+                                                 seed_max_structs if seed_max_structs > 0 else pop_size)
+        if init_mode == 'enumerate':
+            enumerated = enumerate_structs(template, atom_symbol, n_atoms, enum_rank, enum_max_structs)
+            init_size = max(pop_size, len(reused) + len(structures) + len(enumerated))
+            structures += enumerated
+            print(f'Number of symmetry-unique arrangements to relax: {len(enumerated)}')
+        population = gen_random_pop(init_size, struct_filename, size, n_atoms, atom_symbol, calc, mag_moment, label,
+                                    'pop0', budget, relax_options, metrics, structures, reused, prefetch)
+
+        # Preparing the next generations
+        for i in range(n_generations):
+            if population is None:
+                stop_reason = f'Compute budget exhausted - pop{i} checkpointed'
+                break
+
+            # The sorted population is kept in memory between the generations
+            e_min, e_mean, tmp_best = get_energy_stats(population)
+            history.append((e_min, e_mean))
+            if best_struct is None or tmp_best.info['pot_energy'] < best_struct.info['pot_energy']:
+                best_struct = tmp_best
+
+            if i == n_generations - 1:
+                break
+            if is_converged(history, stall_generations, stall_tol_best, stall_tol_mean):
+                stop_reason = f'Converged - no improvement in the last {stall_generations} generations'
+                break
 
-    # Generating the initial population
-    gen_random_pop(pop_size, struct_filename, size, n_atoms, atom_symbol, calc, mag_moment, label, 'pop0')
+            population = prep_generation(population, pop_size, n_best, n_child, n_mut,
+                                         struct_filename, size, n_atoms, n_change, atom_symbol,
+                                         calc, mag_moment, label, f'pop{i+1}', budget,
+                                         mut_kinds, mut_step, relax_options, metrics, selection, prefetch)
+    finally:
+        # Stopping the SIESTA process also when the run is interrupted
+        if session is not None:
+            session.close()
 
-    # Preparing the next generations
-    for i in range(n_generations-1):
-        prep_generation(f'sorted_pop{i}.traj', pop_size, n_best, n_child, n_mut,
-                        struct_filename, size, n_atoms, n_change, atom_symbol,
-                        calc, mag_moment, label, f'pop{i+1}')
+    # Writing the final summary of the run
+    write_summary('summary.txt', history, budget, stop_reason, best_struct)
+    if best_struct is not None:
+        io.write('best_struct.xyz', best_struct)
+    print(stop_reason)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,58 @@
+"""
+Tests of the validation of candidates before the DFT calculation (functions/validation.py).
+"""
+
+import random
+from pathlib import Path
+import numpy as np
+import pytest
+from ase.geometry import get_distances
+from functions.gen_rand_struct import gen_rand_struct
+from functions.prep_struct import prep_struct
+from functions.small_functions import get_interlayer_indexes, get_interlayer_sites
+from functions.mutation import mutation
+from functions.validation import validate_struct
+
+STRUCT_FILENAME = str(Path(__file__).resolve().parents[1] / 'MoS2.xyz')
+
+def get_min_distance(structure, index):
+    # Distance from the atom to the nearest other atom (minimum image convention)
+    others = [i for i in range(len(structure)) if i != index]
+    _, d = get_distances(structure.positions[index], structure.positions[others], cell=structure.cell,
+                         pbc=structure.pbc)
+    return np.min(d)
+
+def make_relaxed_parent(bond=2.40):
+    # 4x4 structure with 4 Mo atoms between the layers, one of them at the relaxed Mo-S bond length from an S atom
+    random.seed(3)
+    structure = gen_rand_struct(STRUCT_FILENAME, '4x4', 'Mo', 4)
+    index = get_interlayer_indexes(structure)[0]
+    z = structure.positions[index, 2]
+    sulfur = [i for i in range(len(structure)) if structure.numbers[i] == 16 and structure.get_tags()[i] == 0]
+    for i in sorted(sulfur, key=lambda i: abs(structure.positions[i, 2] - z)):
+        r = np.sqrt(bond ** 2 - (structure.positions[i, 2] - z) ** 2)
+        for angle in np.linspace(0, 2 * np.pi, 24, endpoint=False):
+            structure.positions[index] = structure.positions[i] + [r * np.cos(angle), r * np.sin(angle), 0.]
+            structure.positions[index, 2] = z
+            if np.isclose(get_min_distance(structure, index), bond):
+                structure.info['name'] = 'pop0/cand1'
+                return structure
+    raise RuntimeError('No position at the bond length found')
+
+def test_relaxed_bond_is_valid():
+    parent = make_relaxed_parent()
+    assert validate_struct(parent) == []
+
+@pytest.mark.parametrize('kind', ['displace', 'hop', 'random', 'shift'])
+def test_mutants_of_relaxed_parent_are_valid(kind):
+    parent = make_relaxed_parent()
+    sites = get_interlayer_sites(prep_struct(STRUCT_FILENAME, '4x4'))
+    random.seed(0)
+    rejected = sum(bool(validate_struct(mutation(parent, kind, sites=sites))) for _ in range(50))
+    assert rejected == 0
+
+def test_overlapping_atoms_are_rejected():
+    structure = make_relaxed_parent()
+    index1, index2 = get_interlayer_indexes(structure)[:2]
+    structure.positions[index2] = structure.positions[index1] + [1.0, 0., 0.]
+    assert validate_struct(structure) != []
@@ -0,0 +1,53 @@
+# ==================================================
+# Imports
+# ==================================================
+from functions.prep_struct import prep_struct
+from functions.gen_rand_struct import gen_rand_struct
+from functions.load_config import load_config
+from functions.tune_calc import tune_calc, write_tune_report, write_calc_profile
+
+# ==================================================
+# Loading algorithm parameters from the input file
+# ==================================================
+config = load_config('input.txt')
+
+struct_filename = config['struct_filename']
+size = config['size']
+n_atoms = config['n_atoms']
+atom_symbol = config['atom_symbol']
+mag_moment = config['mag_moment']
+label = config['label']
+
+# Grid of the calculator settings and the number of representative structures
+tune_kpts = [int(k) for k in str(config.get('tune_kpts', '2,4,6,8')).split(',')]
+tune_cutoffs = [float(c) for c in str(config.get('tune_cutoffs', '100,150,200')).split(',')]
+tune_dm_tolerances = [float(d) for d in str(config.get('tune_dm_tolerances', '0.001')).split(',')]
+tune_n_structs = config.get('tune_n_structs', 3)
+tune_tol = float(config.get('tune_tol', 0.01))
+# File to which the cheapest calculator settings are written (none - the default name calc_profile.txt)
+calc_profile = str(config.get('calc_profile', 'none'))
+
+# ==================================================
+# The main logic of the program
+# ==================================================
+def main():
+    # Representative structures - the two-layer structure with randomly distributed atoms between the layers
+    template = prep_struct(struct_filename, size)
+    structures = [gen_rand_struct(struct_filename, size, atom_symbol, n_atoms, template)
+                  for _ in range(tune_n_structs)]
+
+    # Single-point calculations over the grid of the calculator settings
+    results, best = tune_calc(structures, mag_moment, label, tune_kpts, tune_cutoffs, tune_dm_tolerances, tune_tol)
+
+    write_tune_report('tune_report.txt', results, tune_tol, best)
+    if best is None:
+        print(f'No setting reproduces the reference energy differences within {tune_tol} eV.')
+        return
+
+    profile_filename = calc_profile if calc_profile != 'none' else 'calc_profile.txt'
+    write_calc_profile(profile_filename, best)
+    print(f'Cheapest setting: kpts = {best["kpts"]}, mesh_cutoff = {best["mesh_cutoff"]} Ry, '
+          f'dm_tolerance = {best["dm_tolerance"]} - written to {profile_filename}')
+
+if __name__ == '__main__':
+    main()